@@ -1,8 +1,15 @@
 import argparse
+import sys
 from pathlib import Path
 
 from backuper import Backuper
-from config import Commands, VariableRequired, WrongGitPath, load_settings
+from archive import COMPRESSIONS
+from completion import SHELLS, script
+from events import OUTPUT_MODES, configure
+from listing import FORMATS
+from throttle import IOPolicy, TokenBucket, lower_priority
+from config import Commands, Settings, VariableRequired, WrongGitPath, load_settings
+from errors import GikkonError
 
 
 def main() -> None:
@@ -16,6 +23,31 @@ def main() -> None:
         help="prints what would be done without actually doing it",
     )
     parser.add_argument("-c", "--config", type=Path, help="path to configuration file")
+    parser.add_argument(
+        "--metrics_dir",
+        type=Path,
+        help="directory of node_exporter textfile collector to write backup and status metrics to",
+    )
+
+    parser.add_argument(
+        "--nice",
+        action="store_true",
+        help="run with idle I/O and lowest CPU priority, and don't keep read files in page cache",
+    )
+    parser.add_argument(
+        "--bandwidth_limit",
+        help="limit reading of files to this many bytes per second, e.g. '20M'",
+    )
+    parser.add_argument(
+        "--output",
+        choices=OUTPUT_MODES,
+        help="how progress is shown: text lines, a progress bar on stderr, nothing, or auto to pick by terminal",
+    )
+    parser.add_argument(
+        "--events_fd",
+        type=int,
+        help="also write every event as a JSON line to this file descriptor, e.g. 3 with '3>events.jsonl'",
+    )
 
     subparser = parser.add_subparsers(title="commands", required=True, dest="command")
 
@@ -35,6 +67,20 @@ def main() -> None:
         action="store_true",
         help="ask about rollback changed files on the system",
     )
+    parser_backup.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue an interrupted backup, skipping files it has already processed",
+    )
+    parser_backup.add_argument(
+        "--deadline",
+        help="time budget like '90s' or '10m', recently modified files go first and the rest is left for --resume",
+    )
+    parser_backup.add_argument(
+        "--direct",
+        action="store_true",
+        help="write changed files straight into git objects and commit from the index, bypassing the working tree",
+    )
 
     # Commands.LIST
     parser_list = subparser.add_parser(Commands.LIST.value, help="list all files under backup control")
@@ -50,13 +96,118 @@ def main() -> None:
         action="store_true",
         help="show files in git repo instead of system",
     )
+    parser_list.add_argument(
+        "-f",
+        "--format",
+        choices=FORMATS,
+        help="output format: plain text, JSON array, JSON lines or NUL separated paths",
+    )
+    parser_list.add_argument(
+        "-l",
+        "--long",
+        action="store_true",
+        help="show status (in sync, modified, missing), size and modification time of files",
+    )
 
     # Commands.ADD
-    parser_add = subparser.add_parser(Commands.ADD.value, help="add file for backup control")
-    parser_add.add_argument("file", type=Path, help="file to add to backup control")
+    parser_add = subparser.add_parser(Commands.ADD.value, help="add file or directory for backup control")
+    parser_add.add_argument(
+        "file", type=Path, help="file to add to backup control, files created later in a directory are added too"
+    )
 
     # Commands.INIT
-    subparser.add_parser(Commands.INIT.value, help="initialize config repo")
+    parser_init = subparser.add_parser(Commands.INIT.value, help="initialize config repo")
+    parser_init.add_argument(
+        "--filter",
+        help="partial clone filter passed to git clone, e.g. 'blob:none'",
+    )
+    parser_init.add_argument("--depth", type=int, help="create a shallow clone with given number of commits")
+    parser_init.add_argument(
+        "--sparse",
+        nargs="+",
+        metavar="DIR",
+        help="check out only given repo directories, '{hostname}' is replaced with the current host name",
+    )
+
+    # Commands.STATUS
+    parser_status = subparser.add_parser(
+        Commands.STATUS.value,
+        help="check whether system files differ from backup without changing anything, "
+        "exit code is 0 if all files are in sync, otherwise the sum of 1 if some are modified, 2 if some are missing "
+        "and 4 if some can't be read",
+    )
+    parser_status.add_argument("-q", "--quiet", action="store_true", help="print nothing, only set exit code")
+
+    # Commands.LOG
+    parser_log = subparser.add_parser(Commands.LOG.value, help="show commits changing a system file")
+    parser_log.add_argument("file", type=Path, help="system path of a file under backup control")
+    parser_log.add_argument("-n", "--max_count", type=int, help="show at most this many commits (20 by default)")
+
+    # Commands.DIFF
+    parser_diff = subparser.add_parser(Commands.DIFF.value, help="compare a system file with its backup copy")
+    parser_diff.add_argument("file", type=Path, help="system path of a file under backup control")
+    parser_diff.add_argument(
+        "--at",
+        help="revision or date ('last tuesday', '2024-01-31') of the backup copy, last commit by default",
+    )
+
+    # Commands.GC
+    subparser.add_parser(
+        Commands.GC.value,
+        help="remove chunks of large files from the sidecar store which no commit or repo file refers to",
+    )
+
+    # Commands.DU
+    parser_du = subparser.add_parser(
+        Commands.DU.value,
+        help="show size of repo files and directories in the last commit and in the whole history",
+    )
+    parser_du.add_argument("--max_depth", type=int, help="show files and directories at most this deep")
+    parser_du.add_argument(
+        "-s",
+        "--by_size",
+        action="store_true",
+        help="sort by size in history, largest first, instead of by path",
+    )
+
+    # Commands.EXPORT
+    parser_export = subparser.add_parser(
+        Commands.EXPORT.value,
+        help="write files of a revision as a tar archive straight from git objects, for hosts without git",
+    )
+    parser_export.add_argument(
+        "--at",
+        "--rev",
+        help="revision or date ('last tuesday', '2024-01-31') to export, last commit by default",
+    )
+    parser_export.add_argument(
+        "--system_paths",
+        action="store_true",
+        help="name entries by system paths and restore large files from the sidecar store, "
+        "unpack with 'tar -x -C /'",
+    )
+    parser_export.add_argument(
+        "-f",
+        "--archive",
+        type=Path,
+        metavar="FILE",
+        help="write the archive into this file instead of stdout, compression is taken from its suffix",
+    )
+    parser_export.add_argument("--compression", choices=COMPRESSIONS, help="compress the archive with gzip or xz")
+
+    # Commands.TUNE
+    subparser.add_parser(
+        Commands.TUNE.value,
+        help="enable git settings which speed up status and add on big repos (done by init too), "
+        "and compare timing of git status before and after",
+    )
+
+    # Commands.COMPLETION
+    parser_completion = subparser.add_parser(
+        Commands.COMPLETION.value,
+        help="print shell completion script, e.g. 'source <(gikkon completion bash)'",
+    )
+    parser_completion.add_argument("shell", choices=SHELLS)
 
     try:
         args = vars(parser.parse_args())
@@ -74,16 +225,92 @@ def main() -> None:
             Or use '--path' option\n",
         )
 
-    backuper = Backuper(path=config.git_path, dry_run=config.dry_run)
+    if config.command == Commands.COMPLETION.value:
+        print(script(config.shell, subparser.choices, config.git_path), end="")
+        return
+
+    try:
+        run(config)
+    except GikkonError as ex:
+        print(f"Error: {ex}")
+        sys.exit(1)
+
+
+def run(config: Settings) -> None:
+    """run the command of parsed settings, its errors are reported by main"""
+    # Lines are flushed in batches, the progress bar and git commands flush them before writing themselves
+    sys.stdout.reconfigure(line_buffering=False)
+    configure(config.output, config.events_fd)
+
+    if config.nice:
+        lower_priority()
+
+    bucket = TokenBucket(config.bandwidth_limit) if config.bandwidth_limit else None
+
+    backuper = Backuper(
+        path=config.git_path,
+        dry_run=config.dry_run,
+        sparse_paths=config.sparse_paths,
+        roots=config.roots,
+        metadata=config.metadata,
+        xattrs=config.xattrs,
+        metrics_dir=config.metrics_dir,
+        io_policy=IOPolicy(drop_cache=config.nice, bucket=bucket),
+        filters=config.filters,
+        update_index=True,
+        remotes=config.remotes,
+        push_timeout=config.push_timeout,
+        large_file_size=config.large_file_size,
+        store=config.store,
+        policies=config.policies,
+        max_blob_size=config.max_blob_size,
+        large_blobs=config.large_blobs,
+    )
 
     if config.command == Commands.BACKUP.value:
-        backuper.backup(ask_rollback=config.ask_rollback, delete_not_present=config.remove)
+        backuper.backup(
+            ask_rollback=config.ask_rollback,
+            delete_not_present=config.remove,
+            resume=config.resume,
+            deadline=config.deadline,
+            direct=config.direct,
+            update_worktree=config.update_worktree,
+        )
     elif config.command == Commands.LIST.value:
-        backuper.print_files(print_all=config.show_all, repo_paths=config.repo_paths)
+        backuper.print_files(
+            print_all=config.show_all,
+            repo_paths=config.repo_paths,
+            output_format=config.output_format,
+            long=config.long,
+        )
     elif config.command == Commands.ADD.value:
         backuper.add(config.fname)
+    elif config.command == Commands.STATUS.value:
+        sys.exit(backuper.status(quiet=config.quiet))
+    elif config.command == Commands.LOG.value:
+        backuper.log(config.fname, max_count=config.max_count)
+    elif config.command == Commands.DIFF.value:
+        backuper.diff(config.fname, at=config.at)
+    elif config.command == Commands.TUNE.value:
+        backuper.tune()
+    elif config.command == Commands.DU.value:
+        backuper.du(max_depth=config.max_depth, by_size=config.by_size)
+    elif config.command == Commands.EXPORT.value:
+        backuper.export(
+            at=config.at,
+            system_paths=config.system_paths,
+            archive=config.archive,
+            compression=config.compression,
+        )
+    elif config.command == Commands.GC.value:
+        backuper.gc()
     elif config.command == Commands.INIT.value:
-        backuper.init_repo(config_path=config.config_path)
+        backuper.init_repo(
+            config_path=config.config_path,
+            clone_filter=config.clone_filter,
+            depth=config.clone_depth,
+            sparse=config.sparse,
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,186 @@
+"""
+Library interface of gikkon. Nothing here prompts, decisions are made by callbacks,
+and every operation returns a result object instead of printing a report. Progress and warnings are events,
+add a sink to events.bus to see them. Failures raise errors.GikkonError, nothing exits the process.
+
+    repo = Repo(Path("~/config").expanduser())
+    staged = repo.stage(remove_missing=lambda paths: paths)
+    if staged.changes:
+        repo.commit("nightly backup")
+"""
+import time
+from pathlib import Path
+from typing import Callable, Iterable, NamedTuple, Optional
+
+from backuper import BACKUP_METRICS, Backuper
+from git_wrapper import DEFAULT_COMMIT_MESSAGE, DiffStat, RemoteResult
+from metrics import Metrics
+from stat_cache import SyncStatus
+from throttle import DEFAULT_POLICY, IOPolicy
+
+
+class FileState(NamedTuple):
+    path: Path
+    outer: Path
+    status: SyncStatus
+
+
+class ScanResult(NamedTuple):
+    files: list[FileState]
+    duration: float
+
+    @property
+    def modified(self) -> list[FileState]:
+        return [file for file in self.files if file.status == SyncStatus.MODIFIED]
+
+    @property
+    def missing(self) -> list[FileState]:
+        return [file for file in self.files if file.status == SyncStatus.MISSING]
+
+
+class StageResult(NamedTuple):
+    changes: list[DiffStat]
+    copied: int
+    deleted: int
+    bytes_copied: int
+    missing: int
+    duration: float
+
+
+class CommitResult(NamedTuple):
+    # None if there was nothing to commit
+    commit: Optional[str]
+    pushes: list[RemoteResult]
+    duration: float
+
+    @property
+    def pushed(self) -> bool:
+        return bool(self.pushes) and all(push.ok for push in self.pushes)
+
+
+class Change(NamedTuple):
+    status: str
+    path: Path
+    outer: Path
+
+
+class RollbackResult(NamedTuple):
+    reverted: list[Change]
+    duration: float
+    # Filtered files whose filters can't be undone, they are left as they are in the system
+    kept: list[Change] = []
+
+
+def remove_none(paths: list[Path]) -> list[Path]:
+    return []
+
+
+def revert_all(changes: list[Change]) -> list[Change]:
+    return changes
+
+
+class Repo:
+    """A config repo driven without prompts, one instance can be reused for any number of runs"""
+
+    def __init__(
+        self,
+        path: Path,
+        sparse_paths: Optional[list[str]] = None,
+        roots: Optional[dict[str, str]] = None,
+        metadata: bool = True,
+        xattrs: bool = False,
+        filters: Optional[dict[str, dict]] = None,
+        io_policy: IOPolicy = DEFAULT_POLICY,
+        remotes: Optional[dict[str, str]] = None,
+        push_timeout: Optional[float] = None,
+        large_file_size: int = 0,
+        store: Optional[Path] = None,
+        policies: Optional[dict[str, dict]] = None,
+    ) -> None:
+        self.backuper = Backuper(
+            path,
+            sparse_paths=sparse_paths,
+            roots=roots,
+            metadata=metadata,
+            xattrs=xattrs,
+            io_policy=io_policy,
+            filters=filters,
+            remotes=remotes,
+            push_timeout=push_timeout,
+            large_file_size=large_file_size,
+            store=store,
+            policies=policies,
+        )
+        self.git = self.backuper.git
+
+    def scan(self) -> ScanResult:
+        """Compare system files with repo copies, without changing anything"""
+        start = time.monotonic()
+        files = [FileState(Path(key), paths.outer, status) for key, paths, status in self.backuper.compare()]
+        return ScanResult(files, time.monotonic() - start)
+
+    def stage(
+        self,
+        remove_missing: Callable[[list[Path]], Iterable[Path]] = remove_none,
+        resume: bool = False,
+        deadline: Optional[float] = None,
+    ) -> StageResult:
+        """
+        Copy changed system files into the repo and stage them. remove_missing gets system paths of files
+        which are gone and returns those to remove from the repo.
+        """
+        start = time.monotonic()
+
+        def select_missing(candidates: list[Path]) -> list[int]:
+            selected = set(remove_missing(candidates))
+            return [i for i, path in enumerate(candidates) if path in selected]
+
+        self.backuper.metrics = Metrics("backup", BACKUP_METRICS)
+        self.backuper.copy_files(
+            delete_not_present=True, resume=resume, deadline=deadline, select_missing=select_missing
+        )
+        changes = self.git.stage()
+
+        values = self.backuper.metrics.values
+        return StageResult(
+            changes=changes,
+            copied=int(values["gikkon_files_copied"]),
+            deleted=int(values["gikkon_files_deleted"]),
+            bytes_copied=int(values["gikkon_bytes_copied"]),
+            missing=int(values["gikkon_files_missing"]),
+            duration=time.monotonic() - start,
+        )
+
+    def commit(self, message: str = DEFAULT_COMMIT_MESSAGE, push: bool = True) -> CommitResult:
+        """Commit staged changes and push them to all remotes concurrently"""
+        start = time.monotonic()
+        if not self.git.staged_changes():
+            return CommitResult(None, [], time.monotonic() - start)
+
+        commit = self.git.commit(message)
+        pushes = self.git.publish() if push else []
+
+        return CommitResult(commit, pushes, time.monotonic() - start)
+
+    def rollback(self, select: Callable[[list[Change]], Iterable[Change]] = revert_all) -> RollbackResult:
+        """
+        Drop uncommitted changes of the repo, and copy the committed versions of files picked by select
+        back to the system. Files new in the repo are removed from it. Filtered files whose filters can't be undone
+        are never overwritten with the filtered copy, they are reported as kept.
+        """
+        start = time.monotonic()
+        self.git.unstage()
+
+        changes = [
+            Change(status, path, self.backuper.outer_path(path)) for status, path in self.git.get_changed_files()
+        ]
+        selected = list(select(changes))
+
+        self.git.discard_changes()
+        kept = set(self.backuper.revert_files([(change.status, change.path) for change in selected]))
+
+        return RollbackResult(
+            [change for change in selected if change.path not in kept],
+            time.monotonic() - start,
+            [change for change in selected if change.path in kept],
+        )
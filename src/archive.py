@@ -0,0 +1,81 @@
+"""Tar archives of a revision written straight from git objects, for hosts without git"""
+import tarfile
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+from direct import MODE_EXECUTABLE, MODE_SYMLINK
+from metadata import Entry
+from stat_cache import BUFFER_SIZE
+
+COMPRESSIONS = ("none", "gz", "xz")
+SUFFIXES = {".gz": "gz", ".tgz": "gz", ".xz": "xz", ".txz": "xz"}
+
+
+def compression_for(archive: Optional[Path]) -> str:
+    """Compression implied by the archive file name, none for stdout"""
+    return SUFFIXES.get(archive.suffix, "none") if archive else "none"
+
+
+def open_tar(output: BinaryIO, compression: str) -> tarfile.TarFile:
+    """Tar written as a stream, so output doesn't have to be seekable"""
+    return tarfile.open(fileobj=output, mode="w|" + ("" if compression == "none" else compression))
+
+
+def read_exactly(stream: BinaryIO, size: int) -> Iterator[bytes]:
+    while size > 0:
+        chunk = stream.read(min(size, BUFFER_SIZE))
+        if not chunk:
+            raise EOFError(f"{size} more bytes were expected")
+        size -= len(chunk)
+        yield chunk
+
+
+class ChunkReader:
+    """File object reading from an iterator of chunks, at most one chunk is held in memory"""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self.chunks = iter(chunks)
+        self.chunk = b""
+        self.offset = 0
+
+    def read(self, size: int = -1) -> bytes:
+        parts = []
+        while size != 0:
+            if self.offset == len(self.chunk):
+                self.chunk, self.offset = next(self.chunks, b""), 0
+                if not self.chunk:
+                    break
+
+            end = len(self.chunk) if size < 0 else min(len(self.chunk), self.offset + size)
+            parts.append(self.chunk[self.offset : end])
+            if size > 0:
+                size -= end - self.offset
+            self.offset = end
+
+        return b"".join(parts)
+
+
+def tar_info(name: str, mode: str, size: int, mtime: int, entry: Optional[Entry] = None) -> tarfile.TarInfo:
+    """
+    Header of a file with git mode of its tree entry. Permissions and owner come from the stored metadata
+    if there is any, otherwise the file belongs to root with permissions git would check it out with.
+    """
+    info = tarfile.TarInfo(name)
+    info.mtime = mtime
+    info.uname = info.gname = "root"
+    info.mode = 0o755 if mode == MODE_EXECUTABLE else 0o644
+    if mode == MODE_SYMLINK:
+        info.type = tarfile.SYMTYPE
+        info.mode = 0o777
+    else:
+        info.size = size
+
+    if entry is not None:
+        info.uname, info.gname = entry.user, entry.group
+        if mode != MODE_SYMLINK:
+            info.mode = entry.mode
+        for field, value in (("uid", entry.user), ("gid", entry.group)):
+            if value.isdigit():
+                setattr(info, field, int(value))
+
+    return info
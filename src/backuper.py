@@ -1,62 +1,230 @@
-import filecmp
+import difflib
 import os
 import shutil
+import stat
 import subprocess
 import sys
+import tempfile
+import time
 from collections import namedtuple
+from contextlib import closing, redirect_stdout
+from itertools import chain
 from pathlib import Path
+from typing import BinaryIO, Callable, Container, Iterable, Iterator, Optional
 
 import user_texts
-from git_wrapper import GitWrapper
+from archive import ChunkReader, compression_for, open_tar, read_exactly, tar_info
+from git_wrapper import DEFAULT_COMMIT_MESSAGE, SERVICE_FILES, TUNING, ZERO_OID, GitWrapper
 from interactor import UserInput
-from config import ConfigManager
-from validator import YES_VARIANTS
+from journal import Journal
+from completion import add_to_index, write_index
+from config import ConfigManager, expand_host
+from dir_cache import DirCache, track_dir, tracked_dirs
+from direct import MODE_FILE, MODE_REMOVED, MODE_SYMLINK, BlobCache, Change, blob_id, file_blob_id, git_mode
+from durable import SyncBatch, copy_attributes, replace_file, temp_path
+from errors import GikkonError, GitError, SudoError
+from events import (
+    BackupResumed,
+    DeadlineReached,
+    FileCompared,
+    FileCopied,
+    FileDeleted,
+    FileSkipped,
+    RemovalStarted,
+    ScanFinished,
+    ScanStarted,
+    Warned,
+    emit,
+)
+from filters import FilterSet, Pipeline, Transform
+from metadata import MANIFEST_NAME, Manifest
+from metrics import Metrics
+from metadata import apply as apply_metadata
+from metadata import dump as dump_metadata
+from metadata import parse as parse_metadata
+from listing import PRINTERS, ListEntry, bounded_map, print_text
+from path_mapper import PathMapper
+from policies import PathPolicy, PolicySet, is_binary, next_run
+from sidecar import DIGEST_PREFIX, MAX_POINTER_SIZE, POINTER_HEADER, Pointer, Store, parse_pointer, read_pointer
+from stat_cache import BUFFER_SIZE, StatCache, SyncStatus, read_file, state_path, sync_status
+from throttle import DEFAULT_POLICY, IOPolicy
+from usage import print_usage
 
-HOME = "home"
 Paths = namedtuple("Paths", ["inner", "outer"])
 
+STATUS_METRICS = ("gikkon_files_tracked", "gikkon_files_changed", "gikkon_files_missing")
+BACKUP_METRICS = STATUS_METRICS + (
+    "gikkon_files_copied",
+    "gikkon_files_deleted",
+    "gikkon_bytes_copied",
+    "gikkon_files_skipped",
+)
+
+# Seconds between saves of backup progress
+CHECKPOINT_INTERVAL = 5
+
+# Exit code bits of the status command
+STATUS_MODIFIED = 1
+STATUS_MISSING = 2
+STATUS_UNREADABLE = 4
+
 
 def _select_files_to_revert(changed_files: list[tuple[str, Path]]) -> list[tuple[str, Path]]:
-    print("\nSelect files to revert (use space-separated file numbers, press Enter for all, or type 'q' to quit):")
-    for i, (_, file) in enumerate(changed_files, start=1):
-        print(f"{i}. {file}")
+    selected = UserInput.select([file for _, file in changed_files], user_texts.revert_files)
+    return [changed_files[i] for i in selected]
+
+
+def _copy(from_file: Path, to_file: Path, policy: IOPolicy = DEFAULT_POLICY, keep_attributes: bool = False) -> None:
+    """
+    Replace to_file with a copy of from_file atomically. Symlinks are copied as links,
+    and a symlink at to_file is replaced itself rather than written through.
+    With keep_attributes the new file gets mode, owner and xattrs of the file it replaces instead of from_file.
+    """
+    if os.path.islink(from_file):
+        replace_file(to_file, lambda tmp_path: os.symlink(os.readlink(from_file), tmp_path))
+        return
+
+    def write(tmp_path: Path) -> None:
+        _copy_content(from_file, tmp_path, policy)
+        if keep_attributes:
+            copy_attributes(to_file, tmp_path)
+
+    replace_file(to_file, write)
+
+
+def _copy_content(from_file: Path, to_file: Path, policy: IOPolicy) -> None:
+    if policy.is_default:
+        shutil.copy(from_file, to_file)
+        return
+
+    with open(from_file, "rb") as src, open(to_file, "wb") as dst:
+        while chunk := policy.read(src, BUFFER_SIZE):
+            dst.write(chunk)
+        policy.release(src)
+    shutil.copymode(from_file, to_file)
+
+
+def _write_filtered(from_file: Path, to_file: Path, transform: Transform, policy: IOPolicy = DEFAULT_POLICY) -> None:
+    data = transform.apply(read_file(from_file, policy))
+
+    def write(tmp_path: Path) -> None:
+        tmp_path.write_bytes(data)
+        shutil.copymode(from_file, tmp_path)
+
+    replace_file(to_file, write)
+
+
+def _write_pointer(from_file: Path, to_file: Path, pointer: Pointer) -> None:
+    def write(tmp_path: Path) -> None:
+        tmp_path.write_bytes(pointer.dump())
+        shutil.copymode(from_file, tmp_path)
+
+    replace_file(to_file, write)
+
+
+def _restore_large(inner_path: Path, outer_path: Path, pointer: Pointer, store: Store) -> None:
+    """Assemble the file from the sidecar store right at its system path, or in a temporary file for sudo"""
+
+    def write(tmp_path: Path) -> None:
+        store.write(pointer, tmp_path)
+        shutil.copymode(inner_path, tmp_path)
+        copy_attributes(outer_path, tmp_path)
+
+    emit(FileCopied(inner_path, outer_path, pointer.size, rollback=True))
+    if _can_replace(outer_path):
+        replace_file(outer_path, write)
+        return
+
+    fd, tmp_path = tempfile.mkstemp(prefix="gikkon_")
+    os.close(fd)
+    try:
+        write(Path(tmp_path))
+        _copy_file_with_sudo(tmp_path, outer_path)
+    finally:
+        os.remove(tmp_path)
+
+
+def _restore_filtered(inner_path: Path, outer_path: Path, pipeline: Pipeline) -> bool:
+    """
+    Undo filters of the repo copy using the current system file. Where filters can't be undone, the system file
+    is kept, as writing the filtered copy over it would lose whatever the filters removed, secrets most of all.
+    Returns whether the system file is restored.
+    """
+    try:
+        system_data = outer_path.read_bytes()
+    except FileNotFoundError:
+        system_data = None
+    except PermissionError:
+        emit(Warned(f"{outer_path} can't be read to undo its filters, keeping it as it is"))
+        return False
 
-    selected_indices = input("Enter file numbers, press Enter for all, or type 'q' to quit: ")
+    data, exact = pipeline.invert(inner_path.read_bytes(), system_data)
+    if data == system_data:
+        return True
 
-    if selected_indices.strip() == "":
-        return changed_files
-    elif selected_indices.lower() == "q":
-        return []
+    if not exact:
+        if system_data is not None:
+            emit(Warned(f"filters of {outer_path} can't be undone, keeping it as it is"))
+            return False
+        emit(Warned(f"filters of {outer_path} can't be undone, restoring the filtered content"))
 
-    indices = [int(index) - 1 for index in selected_indices.split() if index.isdigit()]
+    fd, tmp_path = tempfile.mkstemp(prefix="gikkon_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        shutil.copymode(inner_path, tmp_path)
+        _copy_file(Path(tmp_path), outer_path)
+    finally:
+        os.remove(tmp_path)
 
-    return [changed_files[i] for i in indices if 0 <= i < len(changed_files)]
+    return True
 
 
-def _copy(from_file: Path, to_file: Path) -> None:
-    shutil.copy(from_file, to_file)
+def _tune(git: GitWrapper) -> None:
+    before = git.status_duration()
+    results = git.tune()
+    after = git.status_duration()
+
+    for result in results:
+        if result.ok:
+            print(f"{result.name} = {result.value}")
+        else:
+            print(f"Warning: {result.name} = {result.value} is not in effect: {result.message}")
+    print(f"git status took {before:.3f}s before tuning and {after:.3f}s after")
+
+
+def _lstat(path: Path) -> Optional[os.stat_result]:
+    try:
+        return os.lstat(path)
+    except FileNotFoundError:
+        return None
 
 
 def _copy_file(src, dst):
-    print(f"copying from {src} to {dst}")
+    emit(FileCopied(src, dst, rollback=True))
 
-    if not _has_write_access(dst):
+    if not _can_replace(dst):
         _copy_file_with_sudo(src, dst)
     else:
-        _copy(src, dst)
+        _copy(src, dst, keep_attributes=True)
 
 
 def _copy_file_with_sudo(src, dst):
-    print(f"copying from {src} to {dst}")
+    # Same as _copy, the file is copied next to the destination and renamed over it
+    tmp_path = temp_path(Path(dst))
     try:
-        subprocess.check_call(["sudo", "cp", src, dst])
+        subprocess.check_call(["sudo", "cp", src, tmp_path])
+        if os.path.isfile(dst) and not os.path.islink(dst):
+            # The new file keeps owner, mode and xattrs of the one it replaces, like copying onto it did
+            subprocess.check_call(["sudo", "cp", "--attributes-only", "--preserve=mode,ownership,xattr", dst, tmp_path])
+        subprocess.check_call(["sudo", "mv", "-f", tmp_path, dst])
     except subprocess.CalledProcessError as e:
-        print(f"Error: Failed to copy file with sudo: {e}")
-        sys.exit(1)
+        subprocess.call(["sudo", "rm", "-f", tmp_path])
+        raise SudoError(f"Failed to copy file with sudo: {e}")
 
 
 def _delete_file(file_path):
-    print(f"removing {file_path}")
+    emit(FileDeleted(file_path, rollback=True))
     if not _has_write_access(file_path):
         _delete_file_with_sudo(file_path)
     else:
@@ -67,25 +235,101 @@ def _delete_file_with_sudo(file_path):
     try:
         subprocess.check_call(["sudo", "rm", file_path])
     except subprocess.CalledProcessError as e:
-        print(f"Error: Failed to delete file with sudo: {e}")
-        sys.exit(1)
+        raise SudoError(f"Failed to delete file with sudo: {e}")
 
 
 def _has_write_access(file_path):
     return os.access(file_path, os.W_OK)
 
 
+def _can_replace(file_path):
+    """Renaming over a file needs access to its directory, the file itself shouldn't be protected either"""
+    return _has_write_access(Path(file_path).parent) and (
+        not os.path.lexists(file_path) or _has_write_access(file_path)
+    )
+
+
 class Backuper:
-    def __init__(self, path: Path, dry_run: bool = False) -> None:
-        self.git = GitWrapper(path)
+    def __init__(
+        self,
+        path: Path,
+        dry_run: bool = False,
+        sparse_paths: Optional[list[str]] = None,
+        roots: Optional[dict[str, str]] = None,
+        metadata: bool = True,
+        xattrs: bool = False,
+        metrics_dir: Optional[Path] = None,
+        io_policy: IOPolicy = DEFAULT_POLICY,
+        filters: Optional[dict[str, dict]] = None,
+        update_index: bool = False,
+        remotes: Optional[dict[str, str]] = None,
+        push_timeout: Optional[float] = None,
+        large_file_size: int = 0,
+        store: Optional[Path] = None,
+        policies: Optional[dict[str, dict]] = None,
+        max_blob_size: int = 0,
+        large_blobs: str = "ask",
+    ) -> None:
+        self.git = GitWrapper(
+            path,
+            sparse_paths=sparse_paths,
+            remotes=remotes,
+            push_timeout=push_timeout,
+            max_blob_size=max_blob_size,
+            large_blobs=large_blobs,
+        )
+        self.mapper = PathMapper.from_config(roots)
         self.dry_run = dry_run
+        self.metadata = metadata
+        self.xattrs = xattrs
+        self.metrics_dir = metrics_dir
+        self.io_policy = io_policy
+        self.filters = FilterSet(filters or {}, state_path(path, "filter_cache"))
+        # Files of this size and larger are kept in the sidecar store, 0 disables it
+        self.large_file_size = large_file_size
+        self.store = Store(store or state_path(path, "store"))
+        self.policies = PolicySet(policies or {})
+        # Listings of system directories tracked wholesale
+        self.system_dirs = DirCache.for_repo(path, "system_dirs.json")
+        # Index of tracked system paths for shell completion
+        self.update_index = update_index
+        self.metrics = Metrics("")
 
     def add(self, fname: Path) -> None:
+        """Put a file under backup control. A directory is tracked wholesale, backup picks up files created in it later"""
         fpath = fname.resolve()
+        files = [fpath]
+        inner = self._to_inner(fpath)
+        keys = [inner]
+        if os.path.isdir(fpath):
+            files = list(self.system_dirs.walk(fpath))
+            # Files are put under the path of the directory, whichever root their own paths fall into
+            keys = [inner.joinpath(file_path.relative_to(fpath)) for file_path in files]
+            if self.dry_run:
+                print(f"Dry run: Tracking directory {fpath}")
+            else:
+                track_dir(self.git.path, inner)
+        else:
+            fstat = _lstat(fpath)
+            if fstat is not None and not (stat.S_ISREG(fstat.st_mode) or stat.S_ISLNK(fstat.st_mode)):
+                raise GikkonError(f"{fpath} is not a regular file, a symlink or a directory")
 
-        path = self.git.path.joinpath(Path(str(fpath)[1:]))
-        if fpath.is_relative_to(Path.home()):
-            path = self.git.path.joinpath(HOME, fpath.relative_to(Path.home()))
+        manifest = Manifest.for_repo(self.git.path) if self.metadata and not self.dry_run else None
+        for file_path, key in zip(files, keys):
+            self._add_file(file_path, key, manifest)
+
+        if self.dry_run:
+            return
+
+        if manifest is not None:
+            manifest.save()
+        self.system_dirs.save()
+
+        if self.update_index:
+            add_to_index(self.git.path, *files)
+
+    def _add_file(self, fpath: Path, inner: Path, manifest: Optional[Manifest]) -> None:
+        path = self.git.path.joinpath(inner)
 
         if self.dry_run:
             if not path.parent.is_dir():
@@ -96,46 +340,508 @@ class Backuper:
 
         path.parent.mkdir(parents=True, exist_ok=True)
 
-        _copy(fpath, path)
+        key = str(path.relative_to(self.git.path))
+        transform = None if fpath.is_symlink() else self.filters.transform(key)
+        if transform:
+            _write_filtered(fpath, path, transform)
+        elif self.large_file_size and not fpath.is_symlink() and self._is_large(fpath.stat().st_size):
+            _write_pointer(fpath, path, self.store.put(fpath))
+        else:
+            _copy(fpath, path)
 
-    def backup(self, ask_rollback: bool = True, delete_not_present=False) -> None:
-        self.git.ensure_push()
+        if manifest is not None:
+            manifest.update(key, fpath, xattrs=self.xattrs)
 
-        self._copy_files(delete_not_present)
+    def backup(
+        self,
+        ask_rollback: bool = True,
+        delete_not_present=False,
+        resume: bool = False,
+        deadline: Optional[float] = None,
+        direct: bool = False,
+        update_worktree: bool = True,
+    ) -> None:
+        self.metrics = Metrics("backup", BACKUP_METRICS)
+        if direct:
+            if resume or deadline:
+                print("Warning: direct backup checks all files, --resume and --deadline are ignored")
+            self._backup_direct(delete_not_present, update_worktree)
+        else:
+            self._backup(ask_rollback, delete_not_present, resume, deadline)
+        self._export_metrics()
+
+    def _backup(self, ask_rollback: bool, delete_not_present: bool, resume: bool, deadline: Optional[float]) -> None:
+        with self.metrics.phase("ensure_push"):
+            self.git.ensure_push()
+
+        with self.metrics.phase("copy"):
+            self.copy_files(delete_not_present, resume=resume, deadline=deadline)
 
-        if self.git.show_changes():
+        with self.metrics.phase("diff"):
+            has_changes = self.git.show_changes()
+
+        if has_changes:
             if self.dry_run:
                 print("Dry run: commit and push changes")
                 return
 
             if UserInput.ask_bool(user_texts.accept_changes, default=True):
-                self.git.commit_and_push()
+                with self.metrics.phase("commit"):
+                    self.git.commit_and_push()
                 return
 
             if ask_rollback and UserInput.ask_bool(user_texts.revert_changes, default=False):
+                # Removals of missing files are staged, checkout alone would keep them
+                self.git.unstage()
                 changed_files = self.git.get_changed_files()
                 files_to_revert = _select_files_to_revert(changed_files)
                 self.git.discard_changes()
-                self._revert_files(files_to_revert)
+                self.revert_files(files_to_revert)
 
             print("Abort changes")
 
-    def print_files(self, print_all: bool, repo_paths: bool) -> None:
-        filtered_files = [
-            str(paths.inner) if repo_paths else str(paths.outer)
-            for f in self.git.files()
-            for paths in [self._absolute_paths_from_inner(f)]
-            if (not repo_paths and paths.outer.is_file()) or (repo_paths and (print_all or paths.outer.is_file()))
-        ]
+    def _backup_direct(self, delete_not_present: bool, update_worktree: bool) -> None:
+        """
+        Commit changed system files without copying them into the working tree. Their contents go straight
+        into the object database, the commit is made from the index, and the working tree is brought up
+        to date afterwards only with update_worktree, so it may be missing or read-only.
+        """
+        with self.metrics.phase("ensure_push"):
+            self.git.ensure_push()
+
+        with tempfile.TemporaryDirectory(prefix="gikkon-") as tmp_dir:
+            with self.metrics.phase("scan"):
+                index = self.git.index_entries()
+                changes = self._direct_changes(delete_not_present, Path(tmp_dir), index)
+
+            if not changes:
+                self._index_direct(index, changes)
+                return
+
+            for title, status in (
+                (user_texts.add_files_info, "A"),
+                (user_texts.change_files_info, "M"),
+                (user_texts.delete_files_info, "D"),
+            ):
+                keys = [change.key for change in changes if change.status == status]
+                if keys:
+                    print(f"\n{title}\n")
+                    for key in keys:
+                        print(f"{status} {key}")
+
+            if self.dry_run:
+                print("Dry run: commit and push changes")
+                return
+
+            # Sources are exactly what is hashed, so their sizes are sizes of the new blobs
+            sizes = {change.key: os.stat(change.source).st_size for change in changes if change.status != "D"}
+            if self.git.max_blob_size and not self.git.allow_blobs(sizes):
+                print("Abort changes")
+                sys.exit(1)
+
+            if not UserInput.ask_bool(user_texts.accept_changes, default=True):
+                print("Abort changes")
+                return
+
+            message = UserInput.raw(user_texts.commit_message, default=DEFAULT_COMMIT_MESSAGE)
+            with self.metrics.phase("commit"):
+                self._commit_direct(changes, message, update_worktree)
+            self._index_direct(index, changes)
+
+        self.git._report(self.git.publish())
+        print("Changes committed and pushed")
+
+    def _direct_changes(
+        self, delete_not_present: bool, tmp_dir: Path, index: dict[str, tuple[str, str]]
+    ) -> list[Change]:
+        """
+        Compare blob ids of system files with the index, skipping files the path policies leave out of this run.
+        Contents which are not the system file itself (filtered files, sidecar pointers, symlink targets)
+        are written into tmp_dir to be hashed by git.
+        """
+        cache = BlobCache.for_repo(self.git.path)
+        manifest = Manifest(self.git.path.joinpath(MANIFEST_NAME))
+        # The working tree may be stale, so the manifest is taken from the index as well
+        if MANIFEST_NAME in index:
+            manifest.entries = parse_metadata(self.git.show_file("", Path(MANIFEST_NAME)).decode().splitlines())
+
+        keys = self._index_keys(index)
+        keys += [self._key(paths) for paths in self._new_paths(known=index)]
+        self.system_dirs.save()
+
+        run = next_run(state_path(self.git.path, "run_count"))
+        changes = []
+        missing = []
+        for key in keys:
+            paths = self._absolute_paths_from_inner(Path(key))
+            outer_stat = _lstat(paths.outer)
+            self.metrics.inc("gikkon_files_tracked")
+            if outer_stat is None or not (stat.S_ISREG(outer_stat.st_mode) or stat.S_ISLNK(outer_stat.st_mode)):
+                emit(FileCompared(paths.outer, SyncStatus.MISSING.value))
+                self.metrics.inc("gikkon_files_missing")
+                missing.append(paths)
+                continue
+
+            policy = self.policies.policy(key)
+            if not self._is_wanted(key, paths, outer_stat, policy, run):
+                self.metrics.inc("gikkon_files_skipped")
+                continue
 
-        if not filtered_files:
-            print("\nNo files under gikkon control")
+            if self.metadata:
+                manifest.update(key, paths.outer, outer_stat, self.xattrs)
+
+            mode = git_mode(outer_stat)
+            transform = None if stat.S_ISLNK(outer_stat.st_mode) else self.filters.transform(key)
+            large = transform is None and stat.S_ISREG(outer_stat.st_mode) and self._is_large(outer_stat.st_size)
+            fingerprint = transform.fingerprint if transform else ("sidecar" if large else "")
+            oid, data = cache.get(key, outer_stat, fingerprint, policy.compare), None
+            if oid is None or index.get(key) != (mode, oid):
+                oid, data = self._blob(paths.outer, outer_stat, transform, large)
+                if oid is not None:
+                    cache.update(key, outer_stat, oid, fingerprint)
+
+            if index.get(key) == (mode, oid):
+                emit(FileCompared(paths.outer, SyncStatus.IN_SYNC.value))
+                continue
+
+            source = paths.outer
+            if data is not None:
+                source = tmp_dir.joinpath(str(len(changes)))
+                source.write_bytes(data)
+
+            emit(FileCompared(paths.outer, SyncStatus.MODIFIED.value))
+            changes.append(Change(key, "M" if key in index else "A", mode, source))
+            self._count_copy(paths, outer_stat)
+
+        cache.save()
+
+        if missing and delete_not_present:
+            selected = UserInput.select(
+                [paths.outer for paths in missing], user_texts.remove_missing_files, default_all=False
+            )
+            for paths in (missing[i] for i in selected):
+                key = self._key(paths)
+                changes.append(Change(key, "D", MODE_REMOVED))
+                manifest.remove(key)
+                self.metrics.inc("gikkon_files_deleted")
+
+        if manifest.changed:
+            data = dump_metadata(manifest.entries).encode()
+            if index.get(MANIFEST_NAME) != (MODE_FILE, blob_id(data)):
+                source = tmp_dir.joinpath(MANIFEST_NAME)
+                source.write_bytes(data)
+                changes.append(Change(MANIFEST_NAME, "M" if MANIFEST_NAME in index else "A", MODE_FILE, source))
+
+        return changes
+
+    def _index_keys(self, index: Iterable[str]) -> list[str]:
+        """Keys of the git index which are files in the sparse checkout, service files left out"""
+        roots = tuple(f"{path.rstrip('/')}/" for path in self.git.sparse_paths)
+        return [key for key in index if key not in SERVICE_FILES and (not roots or key.startswith(roots))]
+
+    def _index_direct(self, index: dict[str, tuple[str, str]], changes: list[Change]) -> None:
+        """
+        Refresh the completion index with files of the git index after changes are committed,
+        the working tree may be stale after a direct backup
+        """
+        if self.update_index and not self.dry_run:
+            removed = {change.key for change in changes if change.status == "D"}
+            added = [change.key for change in changes if change.status == "A" and change.key != MANIFEST_NAME]
+            keys = [key for key in self._index_keys(index) + added if key not in removed]
+            write_index(self.git.path, (outer for _inner, outer in self.mapper.to_outer_many(keys)))
+
+    def _blob(
+        self, outer: Path, outer_stat: os.stat_result, transform: Optional[Transform], large: bool
+    ) -> tuple[Optional[str], Optional[bytes]]:
+        """
+        Blob id of what is committed for the system file, and that content unless it is the file itself.
+        Id is None if the file changed while it was read.
+        """
+        if stat.S_ISLNK(outer_stat.st_mode):
+            data = os.fsencode(os.readlink(outer))
+        elif transform:
+            data = transform.apply(read_file(outer, self.io_policy))
+        elif large:
+            data = self.store.put(outer, self.io_policy).dump()
         else:
-            print("\nFiles under gikkon control:")
-            for file_path in filtered_files:
-                print(file_path)
+            return file_blob_id(outer, outer_stat.st_size, self.io_policy), None
+
+        return blob_id(data), data
+
+    def _commit_direct(self, changes: list[Change], message: str, update_worktree: bool) -> None:
+        written = [change for change in changes if change.status != "D"]
+        removed = [change for change in changes if change.status == "D"]
+        oids = self.git.hash_objects([change.source for change in written])
+        self.git.update_index(
+            [(change.mode, oid, change.key) for change, oid in zip(written, oids)]
+            + [(MODE_REMOVED, ZERO_OID, change.key) for change in removed]
+        )
+        self.git.commit_index(message)
+
+        if update_worktree:
+            self.git.checkout_index([change.key for change in written])
+            for change in removed:
+                path = self.git.path.joinpath(change.key)
+                if os.path.lexists(path):
+                    os.remove(path)
+
+    def _export_metrics(self) -> None:
+        if not self.metrics_dir:
+            return
+
+        self.metrics.set("gikkon_git_subprocesses", self.git.subprocess_count)
+        self.metrics.set("gikkon_unpushed_commits", self.git.unpushed_commits())
+        last_push = self.git.last_push_time()
+        if last_push:
+            self.metrics.set("gikkon_last_push_timestamp_seconds", last_push)
+
+        self.metrics.write_textfile(self.metrics_dir)
+
+    def print_files(self, print_all: bool, repo_paths: bool, output_format: str = "text", long: bool = False) -> None:
+        cache = StatCache.for_repo(self.git.path)
+        with_status = long or output_format in ("json", "jsonl")
+
+        def check(paths: Paths) -> ListEntry:
+            return self._list_entry(paths, cache if with_status else None)
+
+        entries = (
+            entry
+            for entry in bounded_map(check, self._all_paths())
+            if entry.status != SyncStatus.MISSING.value or (repo_paths and print_all)
+        )
 
-    def init_repo(self, config_path):
+        if output_format == "text":
+            print_text(entries, repo_paths, long)
+        else:
+            PRINTERS[output_format](entries, repo_paths)
+
+        cache.save()
+        self.git.dir_cache.save()
+
+    def status(self, quiet: bool = False) -> int:
+        """
+        Compare system files with repo copies using stat data, reading files only when stat changed.
+        Changes neither the repo, the system nor local caches and never touches the network, so it is cheap enough
+        for monitoring. The only file written is the metrics textfile, when metrics_dir is set.
+        Returns exit code: STATUS_MODIFIED, STATUS_MISSING and STATUS_UNREADABLE bits, 0 if everything is in sync.
+        """
+        self.metrics = Metrics("status", STATUS_METRICS)
+        code = 0
+        with self.metrics.phase("scan"):
+            for _key, paths, file_status in self.compare():
+                emit(FileCompared(paths.outer, file_status.value))
+                self.metrics.inc("gikkon_files_tracked")
+                if file_status == SyncStatus.MODIFIED:
+                    self.metrics.inc("gikkon_files_changed")
+                    code |= STATUS_MODIFIED
+                elif file_status == SyncStatus.MISSING:
+                    self.metrics.inc("gikkon_files_missing")
+                    code |= STATUS_MISSING
+                elif file_status == SyncStatus.UNREADABLE:
+                    code |= STATUS_UNREADABLE
+
+                if not quiet:
+                    print(f"{file_status.value:<8}  {paths.outer}")
+
+        self._export_metrics()
+        return code
+
+    def compare(self) -> Iterator[tuple[str, Paths, SyncStatus]]:
+        """Repo path, paths and sync status of every tracked file, nothing is changed"""
+        cache = StatCache.for_repo(self.git.path)
+
+        def check(paths: Paths) -> tuple[str, Paths, SyncStatus]:
+            key = self._key(paths)
+            status = sync_status(
+                key,
+                paths.outer,
+                paths.inner,
+                cache,
+                policy=self.io_policy,
+                transform=self.filters.transform(key, memoize=False),
+                compare=self.policies.policy(key).compare,
+            )
+            return key, paths, status
+
+        yield from bounded_map(check, self._all_paths())
+        # Files created in tracked directories are not backed up yet
+        for paths in self._new_paths():
+            yield self._key(paths), paths, SyncStatus.MODIFIED
+
+    def outer_path(self, path: Path) -> Path:
+        """System path of a file by its path in the repo"""
+        return self.mapper.to_outer(path)
+
+    def log(self, fname: Path, max_count: int = 20) -> None:
+        inner = self._to_inner(Path(os.path.abspath(fname)))
+
+        history = self.git.log(inner, max_count)
+        print(history.rstrip("\n") if history else f"No history for {fname}")
+
+    def diff(self, fname: Path, at: Optional[str] = None) -> None:
+        outer = Path(os.path.abspath(fname))
+        inner = self._to_inner(outer)
+        at = at or "HEAD"
+
+        revision = self.git.resolve_revision(at)
+        if revision is None:
+            print(f"No commits found at {at}")
+            return
+
+        old = self.git.show_file(revision, inner)
+        if old is None:
+            print(f"{outer} is not in the repo at {at}")
+            return
+
+        pointer = parse_pointer(old)
+        if pointer:
+            old = b"".join(self.store.read(pointer))
+
+        try:
+            new = outer.read_bytes()
+        except FileNotFoundError:
+            new = b""
+
+        # The repo keeps filtered content, so compare it with what backup would store now
+        transform = self.filters.transform(str(inner))
+        if transform and new:
+            new = transform.apply(new)
+
+        sys.stdout.writelines(
+            difflib.unified_diff(
+                old.decode(errors="replace").splitlines(keepends=True),
+                new.decode(errors="replace").splitlines(keepends=True),
+                fromfile=f"{revision[:7]}:{outer}",
+                tofile=str(outer),
+            )
+        )
+
+    def export(
+        self,
+        at: Optional[str] = None,
+        system_paths: bool = False,
+        archive: Optional[Path] = None,
+        compression: Optional[str] = None,
+    ) -> None:
+        """
+        Write files of a revision as a tar archive into archive or to stdout, straight from git objects: nothing
+        is checked out and files are streamed in chunks. Stored permissions and owners are applied. With
+        system_paths entries are named by their system paths and large files are read back from the sidecar store,
+        so the archive can be unpacked with 'tar -x -C /' on a host without git.
+        """
+        # Messages must not end up in the archive written to stdout
+        output = sys.stdout.buffer
+        with redirect_stdout(sys.stderr):
+            if archive is None and output.isatty():
+                raise GikkonError("Refusing to write an archive to a terminal, redirect stdout or use --archive")
+
+            at = at or "HEAD"
+            revision = self.git.resolve_revision(at)
+            if revision is None:
+                raise GitError(f"No commits found at {at}")
+
+            compression = compression or compression_for(archive)
+            if archive is None:
+                self._write_archive(revision, system_paths, output, compression)
+                output.flush()
+                return
+
+            if self.dry_run:
+                print(f"Dry run: Writing {revision[:7]} to {archive}")
+                return
+
+            def write(tmp_path: Path) -> None:
+                with open(tmp_path, "wb") as f:
+                    self._write_archive(revision, system_paths, f, compression)
+
+            replace_file(archive, write)
+
+    def _write_archive(self, revision: str, system_paths: bool, output: BinaryIO, compression: str) -> None:
+        mtime = self.git.commit_time(revision)
+        roots = tuple(f"{path.rstrip('/')}/" for path in self.git.sparse_paths)
+        tree = self.git.tree_entries(revision)
+        entries = [
+            (mode, oid, path)
+            for mode, oid, path in tree
+            if (not roots or path.startswith(roots) or path in SERVICE_FILES)
+            and not (system_paths and path in SERVICE_FILES)
+        ]
+        manifest_oid = next((oid for _mode, oid, path in tree if path == MANIFEST_NAME), None)
+        # The manifest goes first through the same cat-file process
+        oids = ([manifest_oid] if manifest_oid else []) + [oid for _mode, oid, _path in entries]
+        with closing(self.git.stream_blobs(oids)) as blobs, open_tar(output, compression) as tar:
+            manifest = {}
+            if manifest_oid:
+                size, stream = next(blobs)
+                manifest = parse_metadata(b"".join(read_exactly(stream, size)).decode().splitlines())
+
+            for (mode, _oid, path), (size, stream) in zip(entries, blobs):
+                name = str(self.mapper.to_outer(Path(path))).lstrip("/") if system_paths else path
+                info = tar_info(name, mode, size, mtime, manifest.get(path))
+                if mode == MODE_SYMLINK:
+                    info.linkname = os.fsdecode(b"".join(read_exactly(stream, size)))
+                    tar.addfile(info)
+                    continue
+
+                head = b"".join(read_exactly(stream, min(size, len(POINTER_HEADER))))
+                content = chain([head], read_exactly(stream, size - len(head)))
+                # Pointers are small, so they are read whole
+                if system_paths and head == POINTER_HEADER and size <= MAX_POINTER_SIZE:
+                    data = b"".join(content)
+                    pointer = parse_pointer(data)
+                    content = [data]
+                    if pointer:
+                        info.size = pointer.size
+                        content = self.store.read(pointer)
+
+                tar.addfile(info, ChunkReader(content))
+
+    def gc(self) -> None:
+        """
+        Remove chunks of the sidecar store which no pointer refers to. Pointers are looked for in the work tree
+        and in all local git objects, so files can be restored from any commit available locally.
+        A partial clone lacking blobs of its commits is refused, pointers among them would go unnoticed.
+        """
+        if self.git.is_partial_clone():
+            missing = self.git.missing_objects()
+            if missing:
+                raise GitError(
+                    f"{len(missing)} object(s) of this partial clone are not fetched and may be pointers to chunks, "
+                    "fetch them or run gc in a full clone"
+                )
+
+        pointers = [read_pointer(self.git.path.joinpath(path)) for path in self.git.files()]
+        pointers += [parse_pointer(blob) for blob in self.git.blobs_starting_with(POINTER_HEADER, MAX_POINTER_SIZE)]
+        pointers = [pointer for pointer in pointers if pointer]
+
+        if self.dry_run:
+            print(f"Dry run: removing {len(self.store.unreferenced(pointers))} chunk(s)")
+            return
+
+        removed, freed = self.store.gc(pointers)
+        print(f"removed {removed} chunk(s), {freed} bytes freed")
+
+    def du(self, max_depth: Optional[int] = None, by_size: bool = False) -> None:
+        """Show how much every repo path and directory takes in HEAD and in the whole history"""
+        usages, unknown = self.git.blob_usage()
+        print_usage(usages, max_depth, by_size, unknown)
+
+    def tune(self) -> None:
+        """Enable git settings which keep status and add fast on big repos, and show how much they help"""
+        if self.dry_run:
+            for name, value in TUNING.items():
+                print(f"Dry run: setting {name} = {value}")
+            return
+
+        _tune(self.git)
+
+    def init_repo(
+        self,
+        config_path,
+        clone_filter: Optional[str] = None,
+        depth: Optional[int] = None,
+        sparse: Optional[list[str]] = None,
+    ):
         repo_url = UserInput.raw(user_texts.init_repo)
         if not repo_url:
             return
@@ -145,41 +851,310 @@ class Backuper:
         if not os.path.isabs(system_path):
             raise ValueError("Please, use absolute path")
 
-        GitWrapper.clone(repo_url, system_path)
+        GitWrapper.clone(
+            repo_url,
+            system_path,
+            filter_spec=clone_filter,
+            depth=depth,
+            sparse_paths=expand_host(sparse or []),
+        )
+
+        _tune(GitWrapper(Path(system_path)))
 
         config_manager = ConfigManager(config_path)
         config_manager.rewrite_repo_path(system_path)
+        if sparse:
+            # Later commands walk only the sparse subtrees, so keep the unexpanded list next to the repo path
+            config_manager.rewrite_variable("Init", "sparse", sparse)
 
     def _absolute_paths_from_inner(self, path: Path) -> Paths:
-        str_path = str(path)
+        return Paths(inner=self.git.path.joinpath(path), outer=self.mapper.to_outer(path))
+
+    def _all_paths(self) -> Iterator[Paths]:
+        for inner, outer in self.mapper.to_outer_many(self.git.files()):
+            yield Paths(inner=self.git.path.joinpath(inner), outer=outer)
+
+    def _new_paths(self, known: Optional[Container[str]] = None) -> Iterator[Paths]:
+        """System files in tracked directories which have no copy in the repo yet, or aren't among known keys"""
+        for inner_dir in tracked_dirs(self.git.path):
+            outer_dir = self.mapper.to_outer(inner_dir)
+            for outer in self.system_dirs.walk(outer_dir):
+                key = inner_dir.joinpath(outer.relative_to(outer_dir))
+                inner = self.git.path.joinpath(key)
+                if str(key) not in known if known is not None else not os.path.lexists(inner):
+                    yield Paths(inner=inner, outer=outer)
+
+    def _to_inner(self, outer: Path) -> Path:
+        """Repo path of a system path, tracked files keep theirs when roots overlap"""
+        return self.mapper.to_inner(outer, exists=lambda inner: os.path.lexists(self.git.path.joinpath(inner)))
+
+    def _key(self, paths: Paths) -> str:
+        return str(paths.inner.relative_to(self.git.path))
+
+    def _list_entry(self, paths: Paths, cache: Optional[StatCache]) -> ListEntry:
+        try:
+            outer_stat = os.lstat(paths.outer)
+        except OSError:
+            outer_stat = None
+
+        key = self._key(paths)
+        policy = self.policies.policy(key)
+        if outer_stat is None or not (stat.S_ISREG(outer_stat.st_mode) or stat.S_ISLNK(outer_stat.st_mode)):
+            return ListEntry(paths.inner, paths.outer, SyncStatus.MISSING.value, None, None, policy.describe())
+
+        status = None
+        if cache is not None:
+            transform = self.filters.transform(key, memoize=False)
+            status = sync_status(
+                key, paths.outer, paths.inner, cache, outer_stat, self.io_policy, transform, policy.compare
+            ).value
+
+        return ListEntry(paths.inner, paths.outer, status, outer_stat.st_size, outer_stat.st_mtime, policy.describe())
+
+    def copy_files(
+        self,
+        delete_not_present=False,
+        resume=False,
+        deadline: Optional[float] = None,
+        select_missing: Optional[Callable[[list[Path]], list[int]]] = None,
+    ) -> None:
+        """
+        Copy changed system files into the repo. Progress is journaled, so an interrupted run continues with
+        resume. With deadline in seconds recently modified files go first and the rest is left for the next run.
+        Files missing in the system are removed from the repo if select_missing picks them, the user is asked
+        by default.
+        """
+        cache = StatCache.for_repo(self.git.path)
+        manifest = Manifest.for_repo(self.git.path)
+        journal = Journal.for_repo(self.git.path)
+        batch = SyncBatch()
+        if resume:
+            journal.load()
+            if journal.done:
+                emit(BackupResumed(len(journal.done)))
+        else:
+            journal.reset()
+
+        run = next_run(state_path(self.git.path, "run_count"), resume)
+        stop_at = time.monotonic() + deadline if deadline else None
+        checkpoint_at = time.monotonic() + CHECKPOINT_INTERVAL
+        missing = []
+        tracked = []
+        left = 0
+        items = self._stat_paths(by_mtime=stop_at is not None)
+        emit(ScanStarted("backup", len(items) if isinstance(items, list) else None))
+        try:
+            for paths, outer_stat in items:
+                self.metrics.inc("gikkon_files_tracked")
+                tracked.append(paths.outer)
+                if outer_stat is None:
+                    emit(FileCompared(paths.outer, SyncStatus.MISSING.value))
+                    self.metrics.inc("gikkon_files_missing")
+                    if delete_not_present:
+                        missing.append(paths)
+                    continue
+
+                key = self._key(paths)
+                if key in journal.done:
+                    continue
+
+                if stop_at is not None and time.monotonic() >= stop_at:
+                    left += 1
+                    continue
+
+                if not self._is_wanted(key, paths, outer_stat, self.policies.policy(key), run):
+                    self.metrics.inc("gikkon_files_skipped")
+                    continue
+
+                copied = self._copy_one(key, paths, outer_stat, cache, manifest, batch)
+                emit(FileCompared(paths.outer, (SyncStatus.MODIFIED if copied else SyncStatus.IN_SYNC).value))
+                journal.record(key)
+
+                if time.monotonic() >= checkpoint_at:
+                    self._checkpoint(batch, cache, manifest, journal)
+                    checkpoint_at = time.monotonic() + CHECKPOINT_INTERVAL
+        finally:
+            self._checkpoint(batch, cache, manifest, journal, final=True)
+            emit(ScanFinished("backup", len(tracked)))
+
+        if left:
+            emit(DeadlineReached(left))
+        else:
+            journal.remove()
 
-        outer_path = Path("/").joinpath(path)
-        inner_path = self.git.path.joinpath(path)
+        removed = self._remove_missing(missing, manifest, select_missing) if missing else []
 
-        if str_path.startswith(HOME):
-            outer_path = str.replace(str_path, f"{HOME}/", "")
-            outer_path = Path.home().joinpath(Path(outer_path))
+        manifest.save()
+        self.git.dir_cache.save()
+        self.system_dirs.save()
 
-        return Paths(inner=inner_path, outer=outer_path)
+        if self.update_index:
+            removed_outer = {paths.outer for paths in removed}
+            write_index(self.git.path, (outer for outer in tracked if outer not in removed_outer))
 
-    def _copy_files(self, delete_not_present=False) -> None:
-        for inner_path in self.git.files():
-            paths = self._absolute_paths_from_inner(inner_path)
+    def _stat_paths(self, by_mtime: bool = False) -> Iterable[tuple[Paths, Optional[os.stat_result]]]:
+        """
+        Tracked paths with lstat of system files, None for missing ones.
+        Paths with higher priority go first, and recently modified ones among them if by_mtime.
+        """
+        items = ((paths, _lstat(paths.outer)) for paths in chain(self._all_paths(), self._new_paths()))
+        if not by_mtime and not self.policies.has_priorities:
+            return items
 
-            if delete_not_present and not paths.outer.exists():
-                ok = input(f"Delete {paths.inner} [y/N]? ").lower()
-                if ok in YES_VARIANTS:
-                    _delete_file(paths.inner)
+        def order(item: tuple[Paths, Optional[os.stat_result]]) -> tuple[int, int]:
+            paths, outer_stat = item
+            mtime = (outer_stat.st_mtime_ns if outer_stat else -1) if by_mtime else 0
+            return self.policies.policy(self._key(paths)).priority, mtime
 
-            if paths.outer.exists() and paths.outer.is_file():
-                if not filecmp.cmp(paths.outer, paths.inner):
-                    _copy(paths.outer, paths.inner)
+        return sorted(items, key=order, reverse=True)
 
-    def _revert_files(self, files: list[tuple[str, Path]]) -> None:
+    @staticmethod
+    def _is_wanted(key: str, paths: Paths, outer_stat: os.stat_result, policy: PathPolicy, run: int) -> bool:
+        """Whether the policy lets the file be checked and copied in this run"""
+        if not policy.is_due(key, run):
+            return False
+
+        if not stat.S_ISREG(outer_stat.st_mode):
+            return True
+
+        if policy.max_size and outer_stat.st_size > policy.max_size:
+            emit(FileSkipped(paths.outer, f"it is larger than {policy.max_size} bytes"))
+            return False
+
+        if policy.skip_binary and is_binary(paths.outer):
+            emit(FileSkipped(paths.outer, "it is a binary file"))
+            return False
+
+        return True
+
+    def _copy_one(
+        self,
+        key: str,
+        paths: Paths,
+        outer_stat: os.stat_result,
+        cache: StatCache,
+        manifest: Manifest,
+        batch: SyncBatch,
+    ) -> bool:
+        """Copy the file into the repo if it changed, returns whether it was copied"""
+        copied = False
+        if stat.S_ISLNK(outer_stat.st_mode):
+            if not os.path.islink(paths.inner) or os.readlink(paths.inner) != os.readlink(paths.outer):
+                paths.inner.parent.mkdir(parents=True, exist_ok=True)
+                _copy(paths.outer, paths.inner)
+                batch.add(paths.inner)
+                self._count_copy(paths, outer_stat)
+                copied = True
+        elif stat.S_ISREG(outer_stat.st_mode):
+            transform = self.filters.transform(key)
+            compare = self.policies.policy(key).compare
+            # Files new in tracked directories are missing in the repo
+            if (
+                os.path.islink(paths.inner)
+                or sync_status(key, paths.outer, paths.inner, cache, outer_stat, self.io_policy, transform, compare)
+                != SyncStatus.IN_SYNC
+            ):
+                paths.inner.parent.mkdir(parents=True, exist_ok=True)
+                if transform:
+                    _write_filtered(paths.outer, paths.inner, transform, self.io_policy)
+                    cache.update(key, outer_stat, os.stat(paths.inner), transform.fingerprint)
+                elif self._is_large(outer_stat.st_size):
+                    pointer = self.store.put(paths.outer, self.io_policy)
+                    _write_pointer(paths.outer, paths.inner, pointer)
+                    cache.update(key, outer_stat, os.stat(paths.inner), DIGEST_PREFIX + pointer.digest)
+                else:
+                    _copy(paths.outer, paths.inner, self.io_policy)
+                    cache.update(key, outer_stat, os.stat(paths.inner))
+                batch.add(paths.inner)
+                self._count_copy(paths, outer_stat)
+                copied = True
+        else:
+            return False
+
+        if self.metadata:
+            manifest.update(key, paths.outer, outer_stat, self.xattrs)
+
+        return copied
+
+    def _is_large(self, size: int) -> bool:
+        return 0 < self.large_file_size <= size
+
+    @staticmethod
+    def _checkpoint(
+        batch: SyncBatch, cache: StatCache, manifest: Manifest, journal: Journal, final: bool = False
+    ) -> None:
+        # Copies are synced first, the journal must never list files whose copies could still be lost
+        batch.flush(whole_filesystem=final)
+        cache.save()
+        manifest.save()
+        journal.flush()
+
+    def _count_copy(self, paths: Paths, outer_stat: os.stat_result) -> None:
+        emit(FileCopied(paths.outer, paths.inner, outer_stat.st_size))
+        self.metrics.inc("gikkon_files_changed")
+        self.metrics.inc("gikkon_files_copied")
+        self.metrics.inc("gikkon_bytes_copied", outer_stat.st_size)
+
+    def _remove_missing(
+        self,
+        missing: list[Paths],
+        manifest: Manifest,
+        select_missing: Optional[Callable[[list[Path]], list[int]]] = None,
+    ) -> list[Paths]:
+        """Remove selected files from the repo, returns removed ones"""
+        candidates = [paths.outer for paths in missing]
+        if select_missing is None:
+            selected = UserInput.select(candidates, user_texts.remove_missing_files, default_all=False)
+        else:
+            selected = select_missing(candidates)
+        to_remove = [missing[i] for i in selected]
+        if not to_remove:
+            return []
+
+        if self.dry_run:
+            for paths in to_remove:
+                print(f"Dry run: removing {paths.inner}")
+            return []
+
+        emit(RemovalStarted(len(to_remove)))
+        self.git.remove_files([paths.inner for paths in to_remove])
+        self.metrics.inc("gikkon_files_deleted", len(to_remove))
+        for paths in to_remove:
+            emit(FileDeleted(paths.inner))
+            manifest.remove(self._key(paths))
+
+        return to_remove
+
+    def revert_files(self, files: list[tuple[str, Path]]) -> list[Path]:
+        """Copy repo versions of files back to the system, returns repo paths of files that are kept as they are"""
+        manifest = Manifest.for_repo(self.git.path)
+        batch = SyncBatch()
+        restore = []
+        kept = []
         for status, file in files:
             inner_path, outer_path = self._absolute_paths_from_inner(Path(file))
 
             if status == "?":
                 _delete_file(inner_path)
-            else:
-                _copy_file(inner_path, outer_path)
+                continue
+
+            entry = manifest.get(str(file)) if self.metadata else None
+            pipeline = self.filters.pipeline(str(file))
+            pointer = read_pointer(inner_path)
+            # Symlinks are recreated together with the rest of metadata
+            if not (entry and entry.link):
+                if pipeline:
+                    if not _restore_filtered(inner_path, outer_path, pipeline):
+                        kept.append(file)
+                        continue
+                elif pointer:
+                    _restore_large(inner_path, outer_path, pointer, self.store)
+                else:
+                    _copy_file(inner_path, outer_path)
+                batch.add(outer_path)
+            if entry:
+                restore.append((outer_path, entry))
+
+        apply_metadata(restore)
+        batch.flush(whole_filesystem=True)
+        return kept
@@ -0,0 +1,98 @@
+import hashlib
+import os
+from pathlib import Path
+from typing import Iterable
+
+SHELLS = ("bash", "zsh", "fish")
+# Commands taking a system path of a tracked file
+PATH_COMMANDS = ("diff", "log")
+
+
+def index_path(repo_path: Path) -> Path:
+    """Every repo has its own index, named by a digest of its absolute path"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home().joinpath(".cache")
+    digest = hashlib.sha256(os.fsencode(os.path.abspath(repo_path))).hexdigest()[:16]
+    return Path(cache_home, "gikkon", "indexes", digest)
+
+
+def read_index(repo_path: Path) -> list[str]:
+    try:
+        with open(index_path(repo_path)) as f:
+            return f.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+
+def write_index(repo_path: Path, paths: Iterable[Path]) -> None:
+    """
+    Sorted system paths of tracked files, one per line. Completion scripts read it directly,
+    so completing a path never starts python or walks the repo.
+    """
+    path = index_path(repo_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        f.writelines(f"{p}\n" for p in sorted(set(map(str, paths))) if "\n" not in p)
+    os.replace(tmp_path, path)
+
+
+def add_to_index(repo_path: Path, *paths: Path) -> None:
+    write_index(repo_path, read_index(repo_path) + [str(path) for path in paths])
+
+
+_BASH = """\
+_gikkon() {
+    local cur=${COMP_WORDS[COMP_CWORD]} command word
+    for word in "${COMP_WORDS[@]:1:COMP_CWORD-1}"; do
+        [[ " COMMANDS " == *" $word "* ]] && command=$word && break
+    done
+
+    if [[ -z $command ]]; then
+        mapfile -t COMPREPLY < <(compgen -W "COMMANDS" -- "$cur")
+    elif [[ " PATH_COMMANDS " == *" $command "* && $cur != -* ]]; then
+        mapfile -t COMPREPLY < <(awk -v p="$cur" 'index($0, p) == 1' "INDEX" 2>/dev/null)
+    elif [[ $command == add ]]; then
+        mapfile -t COMPREPLY < <(compgen -f -- "$cur")
+    fi
+}
+complete -o filenames -F _gikkon gikkon
+"""
+
+_ZSH = """\
+#compdef gikkon
+_gikkon() {
+    local command word
+    for word in ${words[2,CURRENT-1]}; do
+        [[ " COMMANDS " == *" $word "* ]] && command=$word && break
+    done
+
+    if [[ -z $command ]]; then
+        compadd -- COMMANDS
+    elif [[ " PATH_COMMANDS " == *" $command "* ]]; then
+        compadd -- ${(f)"$(awk -v p="$PREFIX" 'index($0, p) == 1' "INDEX" 2>/dev/null)"}
+    elif [[ $command == add ]]; then
+        _files
+    fi
+}
+compdef _gikkon gikkon
+"""
+
+_FISH = """\
+complete -c gikkon -f
+complete -c gikkon -n __fish_use_subcommand -a "COMMANDS"
+complete -c gikkon -n "__fish_seen_subcommand_from PATH_COMMANDS" \\
+    -a '(awk -v p=(commandline -ct) "index(\\$0, p) == 1" "INDEX" 2>/dev/null)'
+complete -c gikkon -n "__fish_seen_subcommand_from add" -F
+"""
+
+_TEMPLATES = {"bash": _BASH, "zsh": _ZSH, "fish": _FISH}
+
+
+def script(shell: str, commands: Iterable[str], repo_path: Path) -> str:
+    """Completion script of the shell, paths are completed from the index of the repo"""
+    return (
+        _TEMPLATES[shell]
+        .replace("PATH_COMMANDS", " ".join(PATH_COMMANDS))
+        .replace("COMMANDS", " ".join(commands))
+        .replace("INDEX", str(index_path(repo_path)))
+    )
@@ -1,3 +1,4 @@
+import socket
 from enum import Enum
 from pathlib import Path
 from typing import Any, Optional
@@ -11,6 +12,14 @@ class Commands(Enum):
     ADD = "add"
     ROLLBACK = "rollback"
     INIT = "init"
+    LOG = "log"
+    STATUS = "status"
+    DIFF = "diff"
+    COMPLETION = "completion"
+    GC = "gc"
+    TUNE = "tune"
+    DU = "du"
+    EXPORT = "export"
 
 
 class ConfigManager:
@@ -24,12 +33,15 @@ class ConfigManager:
         return toml.load(self.config_path)
 
     def save_config(self, config):
-        with open(self.config_path, 'w') as f:
+        with open(self.config_path, "w") as f:
             toml.dump(config, f)
 
     def rewrite_repo_path(self, new_path):
+        self.rewrite_variable("General", "path", new_path)
+
+    def rewrite_variable(self, section, name, value):
         config = self.load_config()
-        config['General']['path'] = new_path
+        config.setdefault(section, {})[name] = value
 
         self.save_config(config)
 
@@ -56,20 +68,62 @@ class Settings:
 
         self.dry_run = args.get("dry_run") or self.app_config.get_variable("General", "dry_run", False)
         self.remove = args.get("remove") or self.app_config.get_variable("Backup", "remove", False)
+        self.resume = args.get("resume") or False
+        self.direct = args.get("direct") or self.app_config.get_variable("Backup", "direct", False)
+        self.update_worktree = self.app_config.get_variable("Backup", "update_worktree", True)
+        self.deadline = parse_duration(args.get("deadline") or self.app_config.get_variable("Backup", "deadline", 0))
         self.show_all = args.get("show_all") or self.app_config.get_variable("List", "show_all", False)
         self.ask_rollback = args.get("ask_rollback") or self.app_config.get_variable("Backup", "ask_rollback", True)
         self.repo_paths = args.get("repo_paths") or self.app_config.get_variable("List", "repo_paths", False)
+        self.output_format = args.get("format") or self.app_config.get_variable("List", "format", "text")
+        self.long = args.get("long") or self.app_config.get_variable("List", "long", False)
         self.command = args.get("command")
         self.fname = args.get("file")
-
-        # Ignoring wrong git path in init mode
-        if not self.git_path.exists() and not self.command == Commands.INIT.value:
+        self.at = args.get("at")
+        self.max_count = args.get("max_count") or 20
+        self.quiet = args.get("quiet") or False
+        self.max_depth = args.get("max_depth")
+        self.by_size = args.get("by_size") or False
+        self.system_paths = args.get("system_paths") or False
+        self.archive = args.get("archive")
+        self.compression = args.get("compression")
+        self.shell = args.get("shell")
+        metrics_dir = args.get("metrics_dir") or self.app_config.get_variable("Metrics", "textfile_dir", "")
+        self.metrics_dir = Path(metrics_dir) if metrics_dir else None
+        self.nice = args.get("nice") or self.app_config.get_variable("Nice", "enabled", False)
+        self.bandwidth_limit = parse_size(
+            args.get("bandwidth_limit") or self.app_config.get_variable("Nice", "bandwidth_limit", 0)
+        )
+        self.output = args.get("output") or self.app_config.get_variable("Output", "mode", "auto")
+        self.events_fd = args.get("events_fd")
+        self.clone_filter = args.get("filter") or self.app_config.get_variable("Init", "filter", "")
+        self.clone_depth = args.get("depth") or self.app_config.get_variable("Init", "depth", 0)
+        self.sparse = args.get("sparse") or self.app_config.get_variable("Init", "sparse", [])
+        self.roots = self.app_config.config.get("Paths", {})
+        self.remotes = self.app_config.get_variable("Push", "remotes", {"origin": "main"})
+        self.push_timeout = parse_duration(self.app_config.get_variable("Push", "timeout", 0)) or None
+        self.filters = self.app_config.config.get("Filters", {})
+        self.policies = self.app_config.config.get("Policies", {})
+        self.metadata = self.app_config.get_variable("Backup", "metadata", True)
+        self.xattrs = self.app_config.get_variable("Backup", "xattrs", False)
+        self.large_file_size = parse_size(self.app_config.get_variable("LargeFiles", "threshold", 0))
+        self.max_blob_size = parse_size(self.app_config.get_variable("LargeFiles", "max_blob_size", 0))
+        self.large_blobs = self.app_config.get_variable("LargeFiles", "large_blobs", "ask")
+        store = self.app_config.get_variable("LargeFiles", "store", "")
+        self.store = Path(store).expanduser() if store else None
+
+        # Ignoring wrong git path in init mode and for completion scripts
+        if not self.git_path.exists() and self.command not in (Commands.INIT.value, Commands.COMPLETION.value):
             raise WrongGitPath(self.git_path)
 
     @property
     def config_path(self):
         return self.app_config.config_path
 
+    @property
+    def sparse_paths(self) -> list[str]:
+        return expand_host(self.sparse)
+
 
 class VariableRequired(Exception):
     def __init__(self, section: str, name: str):
@@ -81,6 +135,48 @@ class WrongGitPath(Exception):
         super().__init__(f"Wrong Git path: {git_path}")
 
 
+SIZE_SUFFIXES = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(size) -> int:
+    """Parse size like 512, '64K' or '1.5G' into bytes"""
+    if isinstance(size, (int, float)):
+        return int(size)
+
+    size = size.strip().upper().removesuffix("B").removesuffix("I")
+    suffix = size[-1:] if size[-1:] in SIZE_SUFFIXES else ""
+    return int(float(size[: len(size) - len(suffix)]) * SIZE_SUFFIXES[suffix])
+
+
+def format_size(size: float) -> str:
+    """Format bytes like 512B, 2.0K or 1.5G, the reverse of parse_size"""
+    for unit in ("B", "K", "M", "G", "T"):
+        if size < 1024:
+            break
+        size /= 1024
+
+    return f"{size:.1f}{unit}" if unit != "B" else f"{int(size)}B"
+
+
+DURATION_SUFFIXES = {"": 1, "S": 1, "M": 60, "H": 60 * 60, "D": 24 * 60 * 60}
+
+
+def parse_duration(duration) -> float:
+    """Parse duration like 90, '30s', '10m' or '1.5h' into seconds"""
+    if isinstance(duration, (int, float)):
+        return float(duration)
+
+    duration = duration.strip().upper()
+    suffix = duration[-1:] if duration[-1:] in DURATION_SUFFIXES else ""
+    return float(duration[: len(duration) - len(suffix)]) * DURATION_SUFFIXES[suffix]
+
+
+def expand_host(paths: list[str]) -> list[str]:
+    """Substitute '{hostname}' placeholder, so one config can describe the whole fleet"""
+    hostname = socket.gethostname()
+    return [path.replace("{hostname}", hostname) for path in paths]
+
+
 def load_settings(args) -> Settings:
     DEFAULT_PATH = Path().home().joinpath(Path(".config/gikkon/config.toml"))
     config_path = args.get("config") or DEFAULT_PATH
@@ -0,0 +1,123 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from stat_cache import state_path
+
+# Committed list of repo directories tracked wholesale, files created in them later are backed up too
+TRACKED_DIRS_NAME = ".gikkon-dirs"
+# Listings taken this soon after the directory changed are not trusted, its mtime may not change
+# again on filesystems with coarse timestamps when an entry is added in the same tick
+RACY_WINDOW_NS = 2 * 10**9
+
+
+class DirCache:
+    """
+    Listings of directories with mtime and inode the directory had when it was listed. Adding, removing
+    or renaming an entry changes mtime of its directory, so while mtime is unchanged the cached listing
+    is used instead of reading the directory. Changes deep in a subtree don't touch its ancestors,
+    so every subdirectory is still checked, but only changed ones are read.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.entries: dict[str, list] = {}
+        self.changed = False
+
+    @classmethod
+    def for_repo(cls, repo_path: Path, name: str) -> "DirCache":
+        cache = cls(state_path(repo_path, name))
+        cache.load()
+        return cache
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def save(self) -> None:
+        if not self.changed:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+    def listing(self, directory: Path) -> tuple[list[str], list[str]]:
+        """
+        Names of files and subdirectories. Files are regular files and symlinks, symlinks to directories are
+        neither like with os.walk, and sockets, FIFOs and devices are left out as they can't be backed up.
+        """
+        key = str(directory)
+        try:
+            dir_stat = os.stat(directory)
+        except (FileNotFoundError, NotADirectoryError):
+            return [], []
+
+        entry = self.entries.get(key)
+        if (
+            entry is not None
+            and entry[:2] == [dir_stat.st_mtime_ns, dir_stat.st_ino]
+            and entry[2] - dir_stat.st_mtime_ns > RACY_WINDOW_NS
+        ):
+            return entry[3], entry[4]
+
+        listed_at = time.time_ns()
+        files, dirs = [], []
+        with os.scandir(directory) as entries:
+            for dir_entry in entries:
+                if dir_entry.is_symlink():
+                    if not dir_entry.is_dir():
+                        files.append(dir_entry.name)
+                elif dir_entry.is_file():
+                    files.append(dir_entry.name)
+                elif dir_entry.is_dir():
+                    dirs.append(dir_entry.name)
+
+        files.sort()
+        dirs.sort()
+        if entry is not None:
+            for name in set(entry[4]) - set(dirs):
+                self._forget(directory.joinpath(name))
+        self.entries[key] = [dir_stat.st_mtime_ns, dir_stat.st_ino, listed_at, files, dirs]
+        self.changed = True
+        return files, dirs
+
+    def _forget(self, directory: Path) -> None:
+        """Drop listings of a removed directory and everything under it"""
+        key = str(directory)
+        for stale in [k for k in self.entries if k == key or k.startswith(key + os.sep)]:
+            del self.entries[stale]
+
+    def walk(self, root: Path, excluded: Iterable[str] = ()) -> Iterator[Path]:
+        """Files under root top-down, like os.walk but reading only directories changed since the last walk"""
+        excluded = set(excluded)
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            files, dirs = self.listing(directory)
+            yield from (directory.joinpath(name) for name in files)
+            stack.extend(directory.joinpath(name) for name in reversed(dirs) if name not in excluded)
+
+
+def tracked_dirs(repo_path: Path) -> list[Path]:
+    try:
+        lines = repo_path.joinpath(TRACKED_DIRS_NAME).read_text().splitlines()
+    except FileNotFoundError:
+        return []
+
+    return [Path(line) for line in lines if line]
+
+
+def track_dir(repo_path: Path, directory: Path) -> None:
+    """Add directory relative to the repo root to the committed list of tracked directories"""
+    dirs = tracked_dirs(repo_path)
+    if directory not in dirs:
+        repo_path.joinpath(TRACKED_DIRS_NAME).write_text("".join(f"{path}\n" for path in sorted(dirs + [directory])))
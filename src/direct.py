@@ -0,0 +1,115 @@
+"""
+Backup straight into the object database: contents of changed system files are hashed into blobs, the index
+is updated with their ids and the commit is made from the index, the working tree is never read.
+"""
+import hashlib
+import json
+import os
+import stat
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from policies import COMPARE_HASH, COMPARE_MTIME
+from stat_cache import BUFFER_SIZE, state_path
+from throttle import DEFAULT_POLICY, IOPolicy
+
+MODE_FILE = "100644"
+MODE_EXECUTABLE = "100755"
+MODE_SYMLINK = "120000"
+# Mode of update-index entries removing the path
+MODE_REMOVED = "0"
+
+
+class Change(NamedTuple):
+    key: str
+    # A, M or D like in git diff --name-status
+    status: str
+    mode: str
+    # File to hash into a blob: the system file itself, or a temporary one with generated content
+    source: Optional[Path] = None
+
+
+def git_mode(st: os.stat_result) -> str:
+    if stat.S_ISLNK(st.st_mode):
+        return MODE_SYMLINK
+
+    return MODE_EXECUTABLE if st.st_mode & stat.S_IXUSR else MODE_FILE
+
+
+def blob_id(data: bytes) -> str:
+    """Id git gives to a blob with this content"""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def file_blob_id(path: Path, size: int, policy: IOPolicy = DEFAULT_POLICY) -> Optional[str]:
+    """Blob id of the file content, None if the file changed size since it was stat'ed"""
+    digest = hashlib.sha1(b"blob %d\0" % size)
+    read = 0
+    with open(path, "rb") as f:
+        while chunk := policy.read(f, BUFFER_SIZE):
+            digest.update(chunk)
+            read += len(chunk)
+        policy.release(f)
+
+    return digest.hexdigest() if read == size else None
+
+
+class BlobCache:
+    """
+    Blob ids of system files with size and mtime they had when hashed, and fingerprint of the way the content
+    was produced (filters, sidecar pointers). While those are unchanged the file is not read again.
+    """
+
+    FILE_NAME = "blob_cache.json"
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.entries: dict[str, list] = {}
+        self.changed = False
+
+    @classmethod
+    def for_repo(cls, repo_path: Path) -> "BlobCache":
+        cache = cls(state_path(repo_path, cls.FILE_NAME))
+        cache.load()
+        return cache
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def save(self) -> None:
+        if not self.changed:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+    def get(self, key: str, st: os.stat_result, fingerprint: str = "", compare: str = COMPARE_HASH) -> Optional[str]:
+        """Cached blob id, with compare other than hash only size or mtime of the file has to be unchanged"""
+        entry = self.entries.get(key)
+        if entry is None or entry[2] != fingerprint:
+            return None
+
+        size, mtime = entry[0], entry[1]
+        if compare == COMPARE_HASH:
+            unchanged = st.st_size == size and st.st_mtime_ns == mtime
+        else:
+            unchanged = st.st_mtime_ns == mtime if compare == COMPARE_MTIME else st.st_size == size
+        return entry[3] if unchanged else None
+
+    def update(self, key: str, st: os.stat_result, oid: str, fingerprint: str = "") -> None:
+        entry = [st.st_size, st.st_mtime_ns, fingerprint, oid]
+        if self.entries.get(key) != entry:
+            self.entries[key] = entry
+            self.changed = True
+
+    def discard(self, key: str) -> None:
+        if self.entries.pop(key, None) is not None:
+            self.changed = True
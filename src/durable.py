@@ -0,0 +1,120 @@
+import ctypes
+import os
+import secrets
+import stat
+from pathlib import Path
+from typing import Callable, Optional
+
+TMP_PREFIX = ".gikkon-"
+
+
+# syncfs is Linux only, elsewhere every file and directory is synced separately
+_syncfs: Optional[Callable[[int], int]] = getattr(ctypes.CDLL(None, use_errno=True), "syncfs", None)
+
+
+def temp_path(path: Path) -> Path:
+    """Unique hidden name next to path, so renaming it over path never crosses a filesystem"""
+    return path.with_name(f"{TMP_PREFIX}{path.name}.{secrets.token_hex(4)}")
+
+
+def replace_file(path: Path, write: Callable[[Path], None]) -> None:
+    """
+    Create the new version of path with write at a temporary name in the same directory and rename it over path.
+    A crash leaves either the old file or the new one, never a truncated one.
+    """
+    tmp_path = temp_path(path)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def copy_attributes(from_path: Path, to_path: Path) -> None:
+    """
+    Give to_path mode, owner and extended attributes of the regular file from_path, so renaming to_path over it
+    keeps them like writing into the file would. Owner and attributes we may not set are left as they are.
+    """
+    try:
+        st = os.lstat(from_path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISREG(st.st_mode):
+        return
+
+    # chown may drop setuid bits, so mode goes after it
+    try:
+        os.chown(to_path, st.st_uid, st.st_gid)
+    except PermissionError:
+        pass
+    os.chmod(to_path, stat.S_IMODE(st.st_mode))
+
+    try:
+        names = os.listxattr(from_path)
+    except (AttributeError, OSError):
+        return
+    for name in names:
+        try:
+            os.setxattr(to_path, name, os.getxattr(from_path, name))
+        except OSError:
+            pass
+
+
+def _fsync(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _sync_filesystem(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if _syncfs(fd) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(path))
+    finally:
+        os.close(fd)
+
+
+class SyncBatch:
+    """
+    Files replaced since the last flush, grouped by directory. Instead of fsync after every write,
+    flush syncs each file and then its directory once. At the end of a run each filesystem is synced once
+    with syncfs instead, where it is available.
+    """
+
+    def __init__(self) -> None:
+        self.directories: dict[Path, list[Path]] = {}
+
+    def add(self, path: Path) -> None:
+        self.directories.setdefault(Path(path).parent, []).append(Path(path))
+
+    def flush(self, whole_filesystem: bool = False) -> None:
+        """
+        Sync files added since the last flush. syncfs writes back every dirty page of the filesystem,
+        other programs' too, so it is only worth it once, with whole_filesystem, rather than at every checkpoint
+        """
+        if not self.directories:
+            return
+
+        try:
+            if whole_filesystem and _syncfs is not None:
+                devices = {}
+                for directory in self.directories:
+                    devices.setdefault(os.stat(directory).st_dev, directory)
+                for directory in devices.values():
+                    _sync_filesystem(directory)
+            else:
+                for directory, files in self.directories.items():
+                    for path in files:
+                        _fsync(path)
+                    _fsync(directory)
+        except PermissionError:
+            # Files written with sudo may be unreadable for us
+            os.sync()
+
+        self.directories = {}
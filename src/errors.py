@@ -0,0 +1,27 @@
+"""
+Errors which stop an operation. Library code raises them, the command line prints them and exits.
+"""
+
+
+class GikkonError(Exception):
+    pass
+
+
+class ConfigError(GikkonError):
+    """An option has a value gikkon doesn't understand"""
+
+
+class GitError(GikkonError):
+    """A git command failed, or the repo lacks an object it should have"""
+
+
+class FilterError(GikkonError):
+    """A filter couldn't be applied to a file"""
+
+
+class StoreError(GikkonError):
+    """A chunk of the sidecar store is missing or damaged"""
+
+
+class SudoError(GikkonError):
+    """A command run with sudo failed"""
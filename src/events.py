@@ -0,0 +1,238 @@
+"""
+Progress of a run as a stream of typed events. Code doing the work only emits events,
+sinks decide what is shown: text lines, a progress bar, nothing, or JSON lines for other tools.
+"""
+import atexit
+import json
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple, Optional, TextIO
+
+from config import format_size
+from errors import ConfigError
+
+OUTPUT_MODES = ("auto", "text", "progress", "quiet")
+# Seconds between redraws of the progress bar
+PROGRESS_INTERVAL = 0.1
+
+
+class ScanStarted(NamedTuple):
+    command: str
+    # None if the number of files is not known in advance
+    total: Optional[int] = None
+
+
+class FileCompared(NamedTuple):
+    path: Path
+    status: str
+
+
+class FileCopied(NamedTuple):
+    source: Path
+    destination: Path
+    size: Optional[int] = None
+    # Copied back to the system rather than into the repo
+    rollback: bool = False
+
+
+class FileDeleted(NamedTuple):
+    path: Path
+    rollback: bool = False
+
+
+class FileSkipped(NamedTuple):
+    path: Path
+    reason: str
+
+
+class BackupResumed(NamedTuple):
+    # Files processed by the interrupted run
+    done: int
+
+
+class DeadlineReached(NamedTuple):
+    left: int
+
+
+class RemovalStarted(NamedTuple):
+    files: int
+
+
+class MetadataSudoUsed(NamedTuple):
+    files: int
+
+
+class Warned(NamedTuple):
+    message: str
+
+
+class ScanFinished(NamedTuple):
+    command: str
+    files: int
+
+
+class GitCommandRun(NamedTuple):
+    args: list[str]
+    returncode: int
+    duration: float
+
+
+class PhaseFinished(NamedTuple):
+    command: str
+    phase: str
+    duration: float
+
+
+def event_name(event: NamedTuple) -> str:
+    """Snake case name of the event type, e.g. file_copied"""
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", type(event).__name__).lower()
+
+
+class TextSink:
+    """Lines users are used to: files changed on the system by rollback, skipped files, notes and warnings of runs"""
+
+    def __call__(self, event: NamedTuple) -> None:
+        line = self.line(event)
+        if line is not None:
+            print(line)
+
+    @staticmethod
+    def line(event: NamedTuple) -> Optional[str]:
+        if isinstance(event, FileCopied) and event.rollback:
+            return f"copying from {event.source} to {event.destination}"
+        if isinstance(event, FileDeleted) and event.rollback:
+            return f"removing {event.path}"
+        if isinstance(event, FileSkipped):
+            return f"skipping {event.path}, {event.reason}"
+        if isinstance(event, BackupResumed):
+            return f"Resuming backup, {event.done} file(s) already processed"
+        if isinstance(event, DeadlineReached):
+            return (
+                f"Deadline reached, {event.left} file(s) left for the next run, "
+                "continue with 'gikkon backup --resume'"
+            )
+        if isinstance(event, RemovalStarted):
+            return f"removing {event.files} file(s)"
+        if isinstance(event, MetadataSudoUsed):
+            return f"restoring metadata of {event.files} file(s) with sudo"
+        if isinstance(event, Warned):
+            return f"Warning: {event.message}"
+
+        return None
+
+    def close(self) -> None:
+        pass
+
+
+class ProgressSink(TextSink):
+    """Single line progress bar of scans redrawn at most every PROGRESS_INTERVAL, text lines are printed above it"""
+
+    def __init__(self, stream: TextIO = sys.stderr) -> None:
+        self.stream = stream
+        self.scan: Optional[ScanStarted] = None
+        self.compared = self.copied = self.bytes_copied = 0
+        self.drawn_at = 0.0
+        self.visible = False
+
+    def __call__(self, event: NamedTuple) -> None:
+        if isinstance(event, ScanStarted):
+            self.scan = event
+            self.compared = self.copied = self.bytes_copied = 0
+        elif isinstance(event, ScanFinished):
+            self._clear()
+            self.scan = None
+        elif isinstance(event, FileCompared):
+            self.compared += 1
+        elif isinstance(event, FileCopied) and not event.rollback:
+            self.copied += 1
+            self.bytes_copied += event.size or 0
+
+        line = self.line(event)
+        if line is not None:
+            self._clear()
+            print(line)
+
+        if self.scan is not None and time.monotonic() - self.drawn_at >= PROGRESS_INTERVAL:
+            self._draw()
+
+    def _draw(self) -> None:
+        total = f"/{self.scan.total}" if self.scan.total is not None else ""
+        # Buffered lines go first, so they don't end up after the bar
+        sys.stdout.flush()
+        self.stream.write(
+            f"\r\033[K{self.scan.command}: {self.compared}{total} files, "
+            f"{self.copied} copied ({format_size(self.bytes_copied)})"
+        )
+        self.stream.flush()
+        self.drawn_at = time.monotonic()
+        self.visible = True
+
+    def _clear(self) -> None:
+        if self.visible:
+            self.stream.write("\r\033[K")
+            self.stream.flush()
+            self.visible = False
+
+    def close(self) -> None:
+        self._clear()
+
+
+class JsonLinesSink:
+    """Every event as a JSON object with event name and unix time, one per line"""
+
+    def __init__(self, fd: int) -> None:
+        self.stream = open(fd, "w", closefd=False)
+
+    def __call__(self, event: NamedTuple) -> None:
+        record = {"event": event_name(event), "time": time.time(), **event._asdict()}
+        self.stream.write(json.dumps(record, default=str) + "\n")
+
+    def close(self) -> None:
+        self.stream.flush()
+
+
+class EventBus:
+    def __init__(self, sinks: Optional[list] = None) -> None:
+        self.sinks = sinks if sinks is not None else [TextSink()]
+        self.lock = threading.Lock()
+
+    def emit(self, event: NamedTuple) -> None:
+        # Git commands of concurrent pushes are reported from their threads
+        with self.lock:
+            for sink in self.sinks:
+                sink(event)
+
+    def close(self) -> None:
+        with self.lock:
+            for sink in self.sinks:
+                sink.close()
+
+
+# Silent until the command line configures sinks, library users add their own
+bus = EventBus([])
+
+
+def emit(event: NamedTuple) -> None:
+    bus.emit(event)
+
+
+def configure(mode: str = "auto", events_fd: Optional[int] = None) -> None:
+    """
+    Choose sinks of the bus: text lines, a progress bar on stderr ('auto' if it is a terminal) or nothing,
+    plus JSON lines written to events_fd. Sinks are flushed at exit.
+    """
+    if mode not in OUTPUT_MODES:
+        raise ConfigError(f"Output mode should be one of {', '.join(OUTPUT_MODES)}")
+
+    if mode == "auto":
+        mode = "progress" if sys.stderr.isatty() else "text"
+
+    sinks = {"text": [TextSink()], "progress": [ProgressSink()], "quiet": []}[mode]
+    if events_fd is not None:
+        sinks.append(JsonLinesSink(events_fd))
+
+    bus.sinks = sinks
+    atexit.register(bus.close)
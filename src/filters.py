@@ -0,0 +1,245 @@
+import hashlib
+import json
+import re
+import shutil
+import subprocess
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Any, Callable, NamedTuple, Optional
+
+from errors import FilterError
+from events import Warned, emit
+
+_SECTION = re.compile(r"^\s*\[+\s*([^\]]+?)\s*\]+\s*$")
+_KEY = re.compile(r"^\s*([^\s=:#;\[][^=:]*?)\s*[=:]")
+
+# Stat cache keeps fingerprints of filters in place of content digests of filtered copies
+FINGERPRINT_PREFIX = "filters:"
+
+# Filter options in the order they may appear in a config table
+FILTER_KINDS = ("delete_keys", "regex", "command")
+
+
+def _decode(data: bytes) -> str:
+    return data.decode("utf-8", errors="surrogateescape")
+
+
+def _encode(text: str) -> bytes:
+    return text.encode("utf-8", errors="surrogateescape")
+
+
+def _key_lines(text: str) -> list[tuple[str, Optional[str], str]]:
+    """Split INI or TOML like text into (section, dotted key or None, line) triples"""
+    section = ""
+    result = []
+    for line in text.splitlines(keepends=True):
+        match = _SECTION.match(line)
+        if match:
+            section = match.group(1).strip('"')
+            result.append((section, None, line))
+            continue
+
+        match = _KEY.match(line)
+        name = match.group(1).strip().strip('"') if match else None
+        result.append((section, f"{section}.{name}" if section and name else name, line))
+
+    return result
+
+
+def _delete_lines(text: str, keys: set[str]) -> str:
+    return "".join(line for _, key, line in _key_lines(text) if key not in keys)
+
+
+def _restore_lines(text: str, original: str, keys: set[str]) -> str:
+    """Put lines of deleted keys from the original text back to the end of their sections"""
+    missing: dict[str, list[str]] = {}
+    for section, key, line in _key_lines(original):
+        if key in keys:
+            missing.setdefault(section, []).append(line if line.endswith("\n") else line + "\n")
+
+    lines = _key_lines(text)
+    result = []
+    for i, (section, key, line) in enumerate(lines):
+        result.append(line)
+        is_section_end = i + 1 == len(lines) or (lines[i + 1][1] is None and lines[i + 1][0] != section)
+        if is_section_end and section in missing:
+            # Keep blank lines separating sections after the restored keys
+            position = len(result)
+            while position > 1 and not result[position - 1].strip():
+                position -= 1
+            if not result[position - 1].endswith("\n"):
+                result[position - 1] += "\n"
+            result[position:position] = missing.pop(section)
+
+    for section, section_lines in missing.items():
+        result.append(f"\n[{section}]\n" if section else "")
+        result.extend(section_lines)
+
+    return "".join(result)
+
+
+def _json_dump(data: Any, original: str) -> str:
+    indent = 2 if "\n" in original.strip() else None
+    return json.dumps(data, indent=indent, ensure_ascii=False) + ("\n" if original.endswith("\n") else "")
+
+
+def _json_pop(data: Any, key: str) -> tuple[bool, Any]:
+    *parents, name = key.split(".")
+    for parent in parents:
+        if not isinstance(data, dict) or parent not in data:
+            return False, None
+        data = data[parent]
+
+    if not isinstance(data, dict) or name not in data:
+        return False, None
+
+    return True, data.pop(name)
+
+
+def _json_put(data: Any, key: str, value: Any) -> None:
+    *parents, name = key.split(".")
+    for parent in parents:
+        data = data.setdefault(parent, {})
+    data[name] = value
+
+
+class Transform(NamedTuple):
+    """Filters of a single path: fingerprint of their config and the function applying them"""
+
+    fingerprint: str
+    apply: Callable[[bytes], bytes]
+
+
+class Pipeline:
+    """Sequence of filters applied to a system file before it is stored in the repo"""
+
+    def __init__(self, pattern: str, options: dict) -> None:
+        self.pattern = pattern
+        self.steps = [(kind, value) for kind, value in options.items() if kind in FILTER_KINDS]
+        self.is_json = options.get("format", "json" if pattern.endswith(".json") else "ini") == "json"
+        self.deleted_keys = set(options.get("delete_keys", []))
+        self.regexes = [
+            (re.compile(regex, re.MULTILINE), replacement) for regex, replacement in options.get("regex", [])
+        ]
+        digest = hashlib.blake2b(json.dumps(options, sort_keys=True).encode(), digest_size=16)
+        self.fingerprint = FINGERPRINT_PREFIX + digest.hexdigest()
+
+    def apply(self, data: bytes) -> bytes:
+        try:
+            return self._apply_steps(data)
+        except json.JSONDecodeError as ex:
+            raise FilterError(f"Filter delete_keys for {self.pattern} failed, the file is not valid JSON: {ex}")
+
+    def _apply_steps(self, data: bytes) -> bytes:
+        for kind, value in self.steps:
+            if kind == "delete_keys":
+                data = self._delete_keys(data)
+            elif kind == "regex":
+                text = _decode(data)
+                for regex, replacement in self.regexes:
+                    text = regex.sub(replacement, text)
+                data = _encode(text)
+            elif kind == "command":
+                result = subprocess.run(value, shell=True, input=data, capture_output=True)
+                if result.returncode != 0:
+                    raise FilterError(
+                        f"Filter '{value}' for {self.pattern} failed: {result.stderr.decode(errors='replace')}"
+                    )
+                data = result.stdout
+
+        return data
+
+    def invert(self, repo_data: bytes, system_data: Optional[bytes]) -> tuple[bytes, bool]:
+        """
+        Build system file content from the repo copy. Returns content and whether it is exact.
+        Deleted keys are taken back from the current system file, other filters can't be inverted.
+        If either file is not valid JSON, the repo copy is taken as it is.
+        """
+        try:
+            if system_data is not None and self._apply_steps(system_data) == repo_data:
+                return system_data, True
+        except json.JSONDecodeError:
+            pass
+
+        if system_data is None or not self.deleted_keys:
+            return repo_data, not self.steps
+
+        if self.is_json:
+            try:
+                data, original = json.loads(repo_data), json.loads(system_data)
+            except json.JSONDecodeError as ex:
+                emit(Warned(f"Deleted keys of {self.pattern} are not restored, the file is not valid JSON: {ex}"))
+                return repo_data, False
+
+            for key in self.deleted_keys:
+                found, value = _json_pop(original, key)
+                if found:
+                    _json_put(data, key, value)
+            restored = _encode(_json_dump(data, _decode(repo_data)))
+        else:
+            restored = _encode(_restore_lines(_decode(repo_data), _decode(system_data), self.deleted_keys))
+
+        return restored, all(kind == "delete_keys" for kind, _ in self.steps)
+
+    def _delete_keys(self, data: bytes) -> bytes:
+        text = _decode(data)
+        if not self.is_json:
+            return _encode(_delete_lines(text, self.deleted_keys))
+
+        parsed = json.loads(text)
+        for key in self.deleted_keys:
+            _json_pop(parsed, key)
+
+        return _encode(_json_dump(parsed, text))
+
+
+class FilterSet:
+    """
+    Filters of the [Filters] config section, keyed by globs over repo paths, first match wins.
+    Outputs are memoized on disk by hash of the input, so unchanged files are never filtered twice.
+    """
+
+    def __init__(self, config: dict[str, dict], cache_dir: Optional[Path] = None) -> None:
+        self.pipelines = [Pipeline(pattern, options) for pattern, options in config.items()]
+        self.cache_dir = cache_dir
+
+    def __bool__(self) -> bool:
+        return bool(self.pipelines)
+
+    def pipeline(self, key: str) -> Optional[Pipeline]:
+        for pipeline in self.pipelines:
+            if fnmatchcase(key, pipeline.pattern):
+                return pipeline
+
+        return None
+
+    def transform(self, key: str, memoize: bool = True) -> Optional[Transform]:
+        """Filters of key, without memoize outputs are still looked up on disk but never written"""
+        pipeline = self.pipeline(key)
+        if pipeline is None:
+            return None
+
+        return Transform(pipeline.fingerprint, lambda data: self._apply(key, pipeline, data, memoize))
+
+    def _apply(self, key: str, pipeline: Pipeline, data: bytes, memoize: bool = True) -> bytes:
+        if self.cache_dir is None:
+            return pipeline.apply(data)
+
+        path_dir = self.cache_dir.joinpath(hashlib.blake2b(key.encode(), digest_size=16).hexdigest())
+        digest = hashlib.blake2b(pipeline.fingerprint.encode() + data, digest_size=32).hexdigest()
+        cached = path_dir.joinpath(digest)
+        try:
+            return cached.read_bytes()
+        except FileNotFoundError:
+            pass
+
+        output = pipeline.apply(data)
+        if not memoize:
+            return output
+
+        # Only the output for the latest input of every path is kept
+        shutil.rmtree(path_dir, ignore_errors=True)
+        path_dir.mkdir(parents=True, exist_ok=True)
+        cached.write_bytes(output)
+
+        return output
@@ -1,17 +1,122 @@
 import os
 import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO, Callable, Iterable, Iterator, NamedTuple, Optional
 
 import user_texts
+from config import format_size
+from dir_cache import TRACKED_DIRS_NAME, DirCache
+from errors import ConfigError, GitError
+from events import GitCommandRun, emit
+from history import TimeIndex
 from interactor import UserInput
+from metadata import MANIFEST_NAME
+from stat_cache import BUFFER_SIZE, state_path
 
 DEFAULT_COMMIT_MESSAGE = "something changed"
+# Service files in the repo root which don't correspond to any system file
+SERVICE_FILES = (".gitignore", MANIFEST_NAME, TRACKED_DIRS_NAME)
+LAST_PUSH_FILE = "last_push"
+ZERO_OID = "0" * 40
+DEFAULT_REMOTES = {"origin": "main"}
+# Config making status, diff and add cheap on big work trees, see git-config(1)
+TUNING = {
+    "feature.manyFiles": "true",
+    "index.version": "4",
+    "core.untrackedCache": "true",
+    "core.splitIndex": "true",
+    "core.fsmonitor": "true",
+}
+# update-index options rewriting the index right away for settings which would apply on the next write otherwise
+INDEX_OPTIONS = {
+    "index.version": ["--index-version", "4"],
+    "core.untrackedCache": ["--untracked-cache"],
+    "core.splitIndex": ["--split-index"],
+}
+# What to do when a commit would add a blob larger than max_blob_size
+LARGE_BLOB_ACTIONS = ("ask", "refuse")
+
+
+class DiffStat(NamedTuple):
+    status: str
+    path: Path
+    # None for binary files
+    added: Optional[int]
+    deleted: Optional[int]
+
+
+class BlobUsage(NamedTuple):
+    path: str
+    # Size of the blob in HEAD, None if the path is not there anymore
+    current: Optional[int]
+    # Bytes all versions first seen under this path take in the object database, and how many there are
+    history: int
+    versions: int
+    # Versions missing from the object database of a partial clone, they are counted but their size is unknown
+    missing: int = 0
+
+
+class RemoteResult(NamedTuple):
+    remote: str
+    branch: str
+    ok: bool
+    duration: float
+    # Output on success, error description on failure
+    message: str = ""
+
+
+class Tuning(NamedTuple):
+    name: str
+    value: str
+    ok: bool
+    # Why the setting is not in effect
+    message: str = ""
 
 
 class GitWrapper:
-    def __init__(self, repo_path: Path):
+    def __init__(
+        self,
+        repo_path: Path,
+        sparse_paths: Optional[list[str]] = None,
+        remotes: Optional[dict[str, str]] = None,
+        push_timeout: Optional[float] = None,
+        max_blob_size: int = 0,
+        large_blobs: str = "ask",
+    ):
+        if large_blobs not in LARGE_BLOB_ACTIONS:
+            raise ConfigError(f"Action on large blobs should be one of {', '.join(LARGE_BLOB_ACTIONS)}")
+
         self.path = repo_path
+        self.sparse_paths = sparse_paths or []
+        # remote: branch, the first one is the primary remote
+        self.remotes = remotes or DEFAULT_REMOTES
+        self.push_timeout = push_timeout
+        # Commits adding blobs larger than this are refused or asked about, 0 disables the check
+        self.max_blob_size = max_blob_size
+        self.large_blobs = large_blobs
+        self.subprocess_count = 0
+        self._count_lock = threading.Lock()
+        # Listings of work tree directories, saved by commands which walk the whole tree
+        self.dir_cache = DirCache.for_repo(repo_path, "dir_cache.json")
+
+    def _run(self, command: list[str], **kwargs) -> subprocess.CompletedProcess:
+        with self._count_lock:
+            self.subprocess_count += 1
+        # Our buffered output has to go before whatever git prints itself
+        sys.stdout.flush()
+        start = time.monotonic()
+        result = subprocess.run(command, cwd=self.path, **kwargs)
+        emit(GitCommandRun(command, result.returncode, time.monotonic() - start))
+        return result
+
+    @property
+    def primary_remote(self) -> tuple[str, str]:
+        return next(iter(self.remotes.items()))
 
     def show_changes(self) -> bool:
         untracked_files = self._get_untracked_files()
@@ -33,96 +138,642 @@ class GitWrapper:
 
         return changes
 
-    def ensure_push(self, remote_name: Optional[str] = "origin", branch_name: Optional[str] = "main") -> None:
-        local_commit_hash = self._get_commit_hash(branch_name)
-        remote_commit_hash = self._get_remote_commit_hash(remote_name, branch_name)
-
-        if local_commit_hash != remote_commit_hash:
+    def ensure_push(self) -> None:
+        """Offer to push local commits to the remotes which don't have them, all remotes are checked concurrently"""
+        local_hashes = {branch: self._get_commit_hash(branch) for branch in dict.fromkeys(self.remotes.values())}
+        behind = {}
+        for result in self._on_remotes(self._get_remote_commit_hash, self.remotes):
+            if not result.ok:
+                print(f"Warning: failed to check {result.remote}/{result.branch}: {result.message}")
+            elif result.message != local_hashes[result.branch]:
+                behind[result.remote] = result.branch
+
+        if behind:
             need_to_push = UserInput.ask_bool(user_texts.push_changes, default=True)
             if need_to_push:
-                self._push_to_remote(remote_name, branch_name)
+                self._report(self.push_to_remotes(behind))
 
-    def commit_and_push(self, remote_name: Optional[str] = "origin", branch_name: Optional[str] = "main"):
+    def commit_and_push(self, remote_name: Optional[str] = None, branch_name: Optional[str] = None):
         commit_message = UserInput.raw(user_texts.commit_message, default=DEFAULT_COMMIT_MESSAGE)
         self.push(commit_message, remote_name, branch_name)
 
-    def push(self, message: str, remote_name: Optional[str] = "origin", branch_name: Optional[str] = "main") -> None:
+    def push(self, message: str, remote_name: Optional[str] = None, branch_name: Optional[str] = None) -> None:
+        """Commit all changes and push them to the given remote, or to all configured ones"""
         self._stage_all_changes()
+        if self.max_blob_size and not self.allow_blobs(self.staged_blob_sizes()):
+            self.unstage()
+            print("Abort changes")
+            sys.exit(1)
+
         self._create_commit(message)
-        self._push_to_remote(remote_name, branch_name)
+        self._report(self.publish(remote_name, branch_name))
 
         print("Changes committed and pushed")
 
+    def push_to_remotes(self, remotes: Optional[dict[str, str]] = None) -> list[RemoteResult]:
+        """Push to remotes concurrently, so mirrors don't add their latency to the primary one"""
+        return self._on_remotes(self._push_to_remote, remotes or self.remotes)
+
+    def stage(self) -> list[DiffStat]:
+        """Stage all changes of the working tree and return what is going to be committed"""
+        self._stage_all_changes()
+        return self.staged_changes()
+
+    def staged_changes(self) -> list[DiffStat]:
+        output = self._run(
+            ["git", "-c", "core.quotePath=false", "diff", "--cached", "--no-renames", "--raw", "--numstat"],
+            check=True,
+            text=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+
+        statuses = {}
+        changes = []
+        for line in output.splitlines():
+            if line.startswith(":"):
+                info, path = line.split("\t", 1)
+                statuses[path] = info.split()[-1]
+                continue
+
+            added, deleted, path = line.split("\t", 2)
+            changes.append(
+                DiffStat(
+                    status=statuses.get(path, "M"),
+                    path=Path(path),
+                    added=int(added) if added != "-" else None,
+                    deleted=int(deleted) if deleted != "-" else None,
+                )
+            )
+
+        return changes
+
+    def staged_blob_sizes(self) -> dict[str, int]:
+        """Sizes of blobs added or changed by staged changes, by path. Only the pending change set is looked at"""
+        output = self._run(
+            ["git", "diff", "--cached", "--no-renames", "--raw", "-z", "--no-abbrev"],
+            check=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+
+        # Every change is ":<old mode> <new mode> <old id> <new id> <status>\0<path>\0"
+        fields = output.decode().split("\0")
+        blobs = {}
+        for info, path in zip(fields[::2], fields[1::2]):
+            _old_mode, new_mode, _old_oid, new_oid, status = info.lstrip(":").split()
+            # Submodules are commits, not blobs
+            if status != "D" and new_mode != "160000":
+                blobs[path] = new_oid
+
+        sizes = self.blob_sizes(blobs.values())
+        return {path: sizes[oid] for path, oid in blobs.items() if oid in sizes}
+
+    def allow_blobs(self, sizes: dict[str, int]) -> bool:
+        """
+        Whether blobs with given sizes by path may be committed. Blobs above max_blob_size stay in history
+        forever once pushed, so they are refused or asked about.
+        """
+        large = {path: size for path, size in sizes.items() if self.max_blob_size and size > self.max_blob_size}
+        if not large:
+            return True
+
+        print(f"\n{user_texts.large_blobs_info.format(format_size(self.max_blob_size))}\n")
+        for path, size in sorted(large.items()):
+            print(f"{format_size(size):>8}  {path}")
+
+        if self.large_blobs == "refuse":
+            print("Error: Refusing to commit files larger than max_blob_size, move them to the sidecar store")
+            return False
+
+        return UserInput.ask_bool(user_texts.commit_large_blobs, default=False)
+
+    def unstage(self) -> None:
+        self._run(["git", "reset", "-q"], check=True)
+
+    def commit(self, message: str) -> str:
+        """Commit staged changes, returns hash of the new commit. Output of git is kept off stdout"""
+        result = self._run(["git", "commit", "-q", "-m", message], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise GitError(f"Failed to commit: {(result.stderr or result.stdout).strip()}")
+        return self._get_commit_hash("HEAD")
+
+    def publish(self, remote_name: Optional[str] = None, branch_name: Optional[str] = None) -> list[RemoteResult]:
+        remotes = {remote_name: branch_name or self.remotes.get(remote_name, "main")} if remote_name else None
+        results = self.push_to_remotes(remotes)
+        self.write_commit_graph()
+        return results
+
+    def index_entries(self) -> dict[str, tuple[str, str]]:
+        """Mode and blob id of every path in the index"""
+        output = self._run(["git", "ls-files", "--stage", "-z"], check=True, stdout=subprocess.PIPE).stdout
+        entries = {}
+        for record in output.decode().split("\0"):
+            if record:
+                info, path = record.split("\t", 1)
+                mode, oid, _stage = info.split()
+                entries[path] = (mode, oid)
+
+        return entries
+
+    def hash_objects(self, paths: list[Path]) -> list[str]:
+        """Write contents of files as blobs into the object database with a single git call, returns their ids"""
+        if not paths:
+            return []
+
+        output = self._run(
+            ["git", "hash-object", "-w", "--no-filters", "--stdin-paths"],
+            input="".join(f"{path}\n" for path in paths),
+            check=True,
+            text=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+        return output.split()
+
+    def update_index(self, entries: list[tuple[str, str, str]]) -> None:
+        """Set (mode, blob id, path) entries of the index, mode '0' removes the path"""
+        self._run(
+            ["git", "update-index", "-z", "--index-info"],
+            input="".join(f"{mode} {oid}\t{path}\0" for mode, oid, path in entries).encode(),
+            check=True,
+        )
+
+    def commit_index(self, message: str) -> Optional[str]:
+        """
+        Commit the index without looking at the working tree: write-tree, commit-tree and update-ref of HEAD.
+        Returns hash of the new commit, None if the tree is the same as in HEAD.
+        """
+        tree = self._run(["git", "write-tree"], check=True, text=True, stdout=subprocess.PIPE).stdout.strip()
+        # Fails in a repo without commits
+        head = self._run(["git", "rev-parse", "HEAD", "HEAD^{tree}"], text=True, capture_output=True)
+        parent, parent_tree = head.stdout.split() if head.returncode == 0 else ("", "")
+        if tree == parent_tree:
+            return None
+
+        parents = ["-p", parent] if parent else []
+        commit = self._run(
+            ["git", "commit-tree", tree, *parents, "-m", message], check=True, text=True, stdout=subprocess.PIPE
+        ).stdout.strip()
+        # The old value makes the update fail if HEAD moved meanwhile
+        self._run(["git", "update-ref", "-m", f"commit: {message}", "HEAD", commit, parent or ZERO_OID], check=True)
+        return commit
+
+    def checkout_index(self, paths: list[str]) -> None:
+        """Write index versions of paths into the working tree"""
+        if paths:
+            self._run(
+                ["git", "checkout-index", "-f", "-u", "-z", "--stdin"],
+                input="".join(f"{path}\0" for path in paths).encode(),
+                check=True,
+            )
+
+    def remove_files(self, paths: list[Path]) -> None:
+        """Remove files from the index and the working tree with a single git call"""
+        relative = [str(path.relative_to(self.path)) for path in paths]
+        self._run(
+            [
+                "git",
+                "--literal-pathspecs",
+                "rm",
+                "-q",
+                "--ignore-unmatch",
+                "--pathspec-from-file=-",
+                "--pathspec-file-nul",
+            ],
+            input="\0".join(relative),
+            text=True,
+            check=True,
+        )
+
+        # Files that were never committed are not known to git rm
+        for path in paths:
+            if path.exists():
+                os.remove(path)
+
     def discard_changes(self) -> None:
-        subprocess.run(["git", "checkout", "--", "."], cwd=self.path, check=True)
+        self._run(["git", "checkout", "--", "."], check=True)
 
-    def files(self) -> Path:
+    def files(self) -> Iterator[Path]:
         excluded = (".git", ".gitignore")
-        for dirpath, dirs, files in os.walk(self.path):
-            dirs[:] = [d for d in dirs if d not in excluded]
-
-            for filename in files:
-                yield Path(os.path.join(dirpath, filename)).relative_to(self.path)
+        # Sparse checkout keeps only these subtrees on disk, so there is no need to walk anything else
+        roots = [self.path.joinpath(p) for p in self.sparse_paths] or [self.path]
+        for root in roots:
+            for file_path in self.dir_cache.walk(root, excluded):
+                path = file_path.relative_to(self.path)
+                if str(path) not in SERVICE_FILES:
+                    yield path
 
     def get_changed_files(self) -> list[tuple[str, Path]]:
-        git_diff_files = subprocess.run(["git", "diff", "--name-status"], capture_output=True, text=True, cwd=self.path)
-        git_untracked_files = subprocess.run(
-            ["git", "ls-files", "--others"], capture_output=True, text=True, cwd=self.path
-        )
+        git_diff_files = self._run(["git", "diff", "--name-status"], capture_output=True, text=True)
+        git_untracked_files = self._run(["git", "ls-files", "--others"], capture_output=True, text=True)
 
         changed_files = []
 
         for line in git_diff_files.stdout.splitlines():
             status, file_path = line.split(maxsplit=1)
-            if status != "D":  # Exclude deleted files
+            if status != "D" and file_path not in SERVICE_FILES:  # Exclude deleted files
                 changed_files.append((status, Path(file_path)))
 
         for line in git_untracked_files.stdout.splitlines():
-            changed_files.append(("?", Path(line)))
+            if line not in SERVICE_FILES:
+                changed_files.append(("?", Path(line)))
 
         return changed_files
 
+    def last_push_time(self) -> Optional[float]:
+        try:
+            return float(state_path(self.path, LAST_PUSH_FILE).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def unpushed_commits(self, remote_name: Optional[str] = None, branch_name: Optional[str] = None) -> int:
+        """Count commits ahead of the remote-tracking branch of the primary remote, without contacting the remote"""
+        if remote_name is None:
+            remote_name, branch_name = self.primary_remote
+        result = self._run(
+            ["git", "rev-list", "--count", f"{remote_name}/{branch_name}..{branch_name}"],
+            capture_output=True,
+            text=True,
+        )
+        return int(result.stdout) if result.returncode == 0 else 0
+
+    def write_commit_graph(self) -> None:
+        """Changed-path Bloom filters let path-limited git log skip commits without reading their trees"""
+        self._run(["git", "commit-graph", "write", "--reachable", "--changed-paths", "--split", "--no-progress"])
+
+    def status_duration(self) -> float:
+        start = time.monotonic()
+        self._run(["git", "status", "--porcelain"], capture_output=True, check=True)
+        return time.monotonic() - start
+
+    def tune(self) -> list[Tuning]:
+        """Apply TUNING to the repo config and check that every setting is in effect"""
+        fsmonitor_supported = self.fsmonitor_supported()
+
+        applied = []
+        results = {}
+        for name, value in TUNING.items():
+            if name == "core.fsmonitor" and not fsmonitor_supported:
+                results[name] = Tuning(name, value, False, "builtin fsmonitor is not available on this platform")
+                continue
+
+            self._run(["git", "config", "--local", name, value], check=True)
+            applied.append(name)
+
+        self._run(
+            ["git", "update-index", *(option for name in applied for option in INDEX_OPTIONS.get(name, []))],
+            capture_output=True,
+            check=True,
+        )
+        # The first status fills the untracked cache and starts fsmonitor daemon
+        self.status_duration()
+
+        for name in applied:
+            message = self._check_tuning(name)
+            results[name] = Tuning(name, TUNING[name], not message, message)
+
+        return [results[name] for name in TUNING]
+
+    def fsmonitor_supported(self) -> bool:
+        """
+        Whether git is built with the builtin fsmonitor daemon. Builds having it list it among their features,
+        unlike error messages of the daemon this doesn't depend on the locale
+        """
+        options = self._run(["git", "version", "--build-options"], capture_output=True, text=True)
+        return "feature: fsmonitor--daemon" in options.stdout.splitlines()
+
+    def _check_tuning(self, name: str) -> str:
+        """Empty string if the setting is in effect, what is wrong otherwise"""
+        value = self._run(["git", "config", "--get", name], capture_output=True, text=True).stdout.strip()
+        if value != TUNING[name]:
+            return f"config reads '{value}'"
+
+        git_dir = self.path.joinpath(".git")
+        index = git_dir.joinpath("index").read_bytes()
+        if name == "index.version" and int.from_bytes(index[4:8], "big") != 4:
+            return f"index version is {int.from_bytes(index[4:8], 'big')}"
+        if name == "core.untrackedCache" and b"UNTR" not in index:
+            return "index has no untracked cache, mtime of directories may be unreliable on this filesystem"
+        if name == "core.splitIndex" and not any(git_dir.glob("sharedindex.*")):
+            return "index is not split"
+        if name == "core.fsmonitor":
+            daemon = self._run(["git", "fsmonitor--daemon", "status"], capture_output=True, text=True)
+            if daemon.returncode != 0:
+                return daemon.stderr.strip() or daemon.stdout.strip()
+
+        return ""
+
+    def log(self, path: Path, max_count: int) -> str:
+        info_path = self.path.joinpath(".git", "objects", "info")
+        if not info_path.joinpath("commit-graph").exists() and not info_path.joinpath("commit-graphs").exists():
+            self.write_commit_graph()
+
+        return self._run(
+            ["git", "log", f"--max-count={max_count}", "--date=short", "--format=%h %ad %s", "--", str(path)],
+            check=True,
+            text=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+
+    def resolve_revision(self, at: str) -> Optional[str]:
+        """
+        Resolve a revision, or a date in any format git understands, to a commit hash.
+        None if no commit was made by the date, exits if at is neither.
+        """
+        revision = self._run(
+            ["git", "rev-parse", "--verify", "--quiet", f"{at}^{{commit}}"],
+            text=True,
+            stdout=subprocess.PIPE,
+        )
+        if revision.returncode == 0:
+            return revision.stdout.strip()
+
+        # Unlike rev-parse --since, which takes anything it can't parse for now, expiry dates are parsed strictly
+        timestamp = self._run(
+            ["git", "-c", f"gikkon.at={at}", "config", "--type=expiry-date", "gikkon.at"],
+            text=True,
+            capture_output=True,
+        )
+        if timestamp.returncode != 0:
+            raise GitError(f"'{at}' is neither a revision nor a date")
+
+        index = TimeIndex(self.path, self._run)
+        index.refresh()
+        return index.commit_at(int(timestamp.stdout))
+
+    def show_file(self, revision: str, path: Path) -> Optional[bytes]:
+        result = self._run(["git", "cat-file", "blob", f"{revision}:{path}"], capture_output=True)
+        return result.stdout if result.returncode == 0 else None
+
+    def tree_entries(self, revision: str) -> list[tuple[str, str, str]]:
+        """(mode, blob id, path) of every file of the revision, nothing is checked out"""
+        output = self._run(["git", "ls-tree", "-r", "-z", revision], check=True, stdout=subprocess.PIPE).stdout
+        entries = []
+        for record in output.decode().split("\0"):
+            if record:
+                info, path = record.split("\t", 1)
+                mode, object_type, oid = info.split()
+                # Submodules are commits, not files
+                if object_type == "blob":
+                    entries.append((mode, oid, path))
+
+        return entries
+
+    def commit_time(self, revision: str) -> int:
+        return int(
+            self._run(
+                ["git", "show", "-s", "--format=%ct", revision], check=True, text=True, stdout=subprocess.PIPE
+            ).stdout
+        )
+
+    def stream_blobs(self, oids: Iterable[str]) -> Iterator[tuple[int, BinaryIO]]:
+        """
+        Size and content stream of every blob from a single cat-file process, blobs are never loaded into memory.
+        Exactly size bytes have to be read from the stream before the next blob is taken. Blob ids are sent
+        one by one as blobs are taken, so oids may be a lazy iterator.
+        """
+        with self._count_lock:
+            self.subprocess_count += 1
+        sys.stdout.flush()
+        command = ["git", "cat-file", "--batch"]
+        start = time.monotonic()
+        process = subprocess.Popen(command, cwd=self.path, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            for oid in oids:
+                process.stdin.write(f"{oid}\n".encode())
+                process.stdin.flush()
+                # "<name> blob <size>\n<content>\n", or "<name> missing\n"
+                header = process.stdout.readline().split()
+                if len(header) != 3:
+                    raise GitError(f"Object {oid} is missing from the repo")
+
+                yield int(header[2]), process.stdout
+                process.stdout.read(1)
+        finally:
+            # Closing stdout stops git even if the caller didn't take all blobs
+            process.stdin.close()
+            process.stdout.close()
+            emit(GitCommandRun(command, process.wait(), time.monotonic() - start))
+
+    def blobs_starting_with(self, prefix: bytes, max_size: int) -> Iterator[bytes]:
+        """
+        Contents of blobs in the object database up to max_size bytes which start with prefix, unreachable ones
+        included. Blobs are streamed and only the matching ones are ever held in memory.
+        """
+        objects = self._run(
+            ["git", "cat-file", "--batch-all-objects", "--batch-check=%(objectname) %(objecttype) %(objectsize)"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        names = [
+            name
+            for name, object_type, size in zip(objects[::3], objects[1::3], objects[2::3])
+            if object_type == "blob" and len(prefix) <= int(size) <= max_size
+        ]
+        if not names:
+            return
+
+        for size, stream in self.stream_blobs(names):
+            head = stream.read(len(prefix))
+            if head == prefix:
+                yield head + stream.read(size - len(prefix))
+                continue
+
+            left = size - len(head)
+            while left:
+                left -= len(stream.read(min(left, BUFFER_SIZE)))
+
+    def is_partial_clone(self) -> bool:
+        """Whether a clone or fetch with --filter may have left objects out of the local object database"""
+        filters = self._run(
+            ["git", "config", "--get-regexp", r"^remote\..*\.partialclonefilter$"], capture_output=True, text=True
+        )
+        return bool(filters.stdout.strip())
+
+    def missing_objects(self) -> list[str]:
+        """Ids of objects reachable from refs which are not fetched, nothing is fetched to find them"""
+        output = self._run(
+            ["git", "rev-list", "--objects", "--all", "--missing=print"], capture_output=True, text=True, check=True
+        ).stdout
+        return [line[1:] for line in output.splitlines() if line.startswith("?")]
+
+    def blob_sizes(self, oids: Iterable[str]) -> dict[str, int]:
+        """Sizes of objects by id from a single cat-file stream, missing objects are left out"""
+        oids = list(dict.fromkeys(oids))
+        if not oids:
+            return {}
+
+        output = self._run(
+            ["git", "cat-file", "--batch-check=%(objectname) %(objectsize)"],
+            input="".join(f"{oid}\n" for oid in oids),
+            check=True,
+            text=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+
+        # Missing objects are printed as "<name> missing"
+        sizes = {}
+        for line in output.splitlines():
+            oid, size = line.split()
+            if size != "missing":
+                sizes[oid] = int(size)
+
+        return sizes
+
+    def blob_usage(self) -> tuple[list[BlobUsage], int]:
+        """
+        Size of every path in HEAD and of all its versions in history. rev-list names every object reachable
+        from any ref with the path it was first seen under, and a single cat-file stream sizes all of them.
+        A blob shared by several paths or versions is counted once. Objects a partial clone did not fetch are
+        never fetched here, rev-list gives them without a path, so only those in HEAD are put under theirs.
+        Returns usages and the number of missing objects no path is known for.
+        """
+        head = self._run(["git", "ls-tree", "-r", "-z", "HEAD"], capture_output=True)
+        current = {}
+        # Fails in a repo without commits
+        if head.returncode == 0:
+            for record in head.stdout.decode().split("\0"):
+                if record:
+                    info, path = record.split("\t", 1)
+                    _mode, object_type, oid = info.split()
+                    if object_type == "blob":
+                        current[path] = oid
+
+        objects = self._run(
+            ["git", "rev-list", "--objects", "--all", "--missing=print"], check=True, stdout=subprocess.PIPE
+        ).stdout
+        # Missing objects are printed as "?<name>", asking cat-file about them would fetch them
+        missing = {line[1:] for line in objects.decode().splitlines() if line.startswith("?")}
+        present = b"".join(line + b"\n" for line in objects.splitlines() if not line.startswith(b"?"))
+        output = self._run(
+            ["git", "cat-file", "--batch-check=%(objectname) %(objecttype) %(objectsize) %(objectsize:disk) %(rest)"],
+            input=present,
+            check=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+
+        sizes = {}
+        history = defaultdict(int)
+        versions = defaultdict(int)
+        for line in output.decode().splitlines():
+            fields = line.split(" ", 4)
+            if len(fields) < 5 or fields[1] != "blob":
+                continue
+
+            oid, _object_type, size, disk_size, path = fields
+            sizes[oid] = int(size)
+            history[path] += int(disk_size)
+            versions[path] += 1
+
+        missing_current = {path for path, oid in current.items() if oid in missing}
+        for path in missing_current:
+            versions[path] += 1
+
+        usages = [
+            BlobUsage(path, sizes.get(current.get(path)), history[path], versions[path], int(path in missing_current))
+            for path in sorted(set(current) | set(history))
+        ]
+        return usages, len(missing - {current[path] for path in missing_current})
+
     @staticmethod
-    def clone(repo, directory):
+    def clone(
+        repo: str,
+        directory: str,
+        filter_spec: Optional[str] = None,
+        depth: Optional[int] = None,
+        sparse_paths: Optional[list[str]] = None,
+    ) -> None:
         if not repo.endswith(".git"):
             repo += ".git"
 
-        subprocess.run(["git", "clone", repo, directory])
+        command = ["git", "clone"]
+        if filter_spec:
+            command.append(f"--filter={filter_spec}")
+        if depth:
+            command += ["--depth", str(depth)]
+        if sparse_paths:
+            command.append("--sparse")
+
+        # Git explains what went wrong on stderr itself
+        if subprocess.run(command + [repo, directory]).returncode != 0:
+            raise GitError(f"Failed to clone {repo}")
+
+        if sparse_paths:
+            sparse = subprocess.run(["git", "sparse-checkout", "set", "--cone", *sparse_paths], cwd=directory)
+            if sparse.returncode != 0:
+                raise GitError(f"Failed to set up sparse checkout of {', '.join(sparse_paths)} in {directory}")
 
     def _get_untracked_files(self) -> list[str]:
-        git_untracked_files = subprocess.run(
-            ["git", "ls-files", "--others"], capture_output=True, text=True, cwd=self.path
-        )
+        git_untracked_files = self._run(["git", "ls-files", "--others"], capture_output=True, text=True)
         return [line for line in git_untracked_files.stdout.splitlines()]
 
     def _get_combined_diff_output(self) -> str:
-        git_diff_staged = subprocess.run(["git", "diff", "--staged"], capture_output=True, text=True, cwd=self.path)
-        git_diff_unstaged = subprocess.run(["git", "diff"], capture_output=True, text=True, cwd=self.path)
+        git_diff_staged = self._run(["git", "diff", "--staged"], capture_output=True, text=True)
+        git_diff_unstaged = self._run(["git", "diff"], capture_output=True, text=True)
         return git_diff_staged.stdout + git_diff_unstaged.stdout
 
     def _get_commit_hash(self, branch_name: str) -> str:
-        return subprocess.run(
-            ["git", "rev-parse", branch_name], cwd=self.path, check=True, text=True, stdout=subprocess.PIPE
+        return self._run(
+            ["git", "rev-parse", branch_name], check=True, text=True, stdout=subprocess.PIPE
         ).stdout.strip()
 
     def _get_remote_commit_hash(self, remote_name: str, branch_name: str) -> str:
         return (
-            subprocess.run(
+            self._run(
                 ["git", "ls-remote", remote_name, branch_name],
-                cwd=self.path,
                 check=True,
                 text=True,
                 stdout=subprocess.PIPE,
+                timeout=self.push_timeout,
             )
             .stdout.strip()
             .split("\t")[0]
         )
 
+    @staticmethod
+    def _report(results: list[RemoteResult]) -> None:
+        """Print how pushes went, exit if no remote accepted the push"""
+        for result in results:
+            if result.ok:
+                print(f"pushed to {result.remote}/{result.branch} in {result.duration:.1f}s")
+            else:
+                print(f"Error: Failed to push to {result.remote}/{result.branch}: {result.message}")
+
+        if not any(result.ok for result in results):
+            sys.exit(1)
+
+    def _on_remotes(self, func: Callable[[str, str], Optional[str]], remotes: dict[str, str]) -> list[RemoteResult]:
+        """Call func(remote, branch) for every remote in its own thread, failures and timeouts are collected"""
+
+        def call(remote: str, branch: str) -> RemoteResult:
+            start = time.monotonic()
+            try:
+                message = func(remote, branch) or ""
+                return RemoteResult(remote, branch, True, time.monotonic() - start, message)
+            except subprocess.TimeoutExpired:
+                message = f"timed out after {self.push_timeout:g}s"
+            except subprocess.CalledProcessError as e:
+                message = (e.stderr or "").strip() or str(e)
+
+            return RemoteResult(remote, branch, False, time.monotonic() - start, message)
+
+        with ThreadPoolExecutor(max_workers=len(remotes)) as executor:
+            return list(executor.map(lambda item: call(*item), remotes.items()))
+
     def _push_to_remote(self, remote_name: str, branch_name: str) -> None:
-        subprocess.run(["git", "push", remote_name, branch_name], cwd=self.path, check=True)
+        self._run(
+            ["git", "push", "--quiet", remote_name, branch_name],
+            check=True,
+            text=True,
+            capture_output=True,
+            timeout=self.push_timeout,
+        )
+
+        path = state_path(self.path, LAST_PUSH_FILE)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(str(time.time()))
 
     def _stage_all_changes(self) -> None:
-        subprocess.run(["git", "add", "-A"], cwd=self.path, check=True)
+        self._run(["git", "add", "-A"], check=True)
 
     def _create_commit(self, message: str) -> None:
-        subprocess.run(["git", "commit", "-m", message], cwd=self.path, check=True)
+        self._run(["git", "commit", "-m", message], check=True)
@@ -0,0 +1,76 @@
+import subprocess
+from bisect import bisect_right
+from pathlib import Path
+from typing import Callable, Optional
+
+from stat_cache import state_path
+
+
+class TimeIndex:
+    """
+    Timestamps of first-parent commits of HEAD in chronological order, stored in .git/gikkon.
+    Only commits made since the last lookup are read from git, so resolving a date is a binary search.
+    The search needs timestamps to never decrease along the first-parent chain. A commit made with the clock
+    behind its parent gets the parent's timestamp, so it is found as if it was made right after the parent.
+    Git commands go through run, which runs them in the repo.
+    """
+
+    FILE_NAME = "time_index"
+
+    def __init__(self, repo_path: Path, run: Callable[..., subprocess.CompletedProcess]) -> None:
+        self.repo_path = repo_path
+        self.run = run
+        self.path = state_path(repo_path, self.FILE_NAME)
+        self.timestamps: list[int] = []
+        self.commits: list[str] = []
+
+    def load(self) -> None:
+        self.timestamps, self.commits = [], []
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    timestamp, commit = line.split()
+                    self.timestamps.append(int(timestamp))
+                    self.commits.append(commit)
+        except FileNotFoundError:
+            pass
+
+    def refresh(self) -> None:
+        self.load()
+
+        rev_range = "HEAD"
+        if self.commits:
+            is_ancestor = self.run(["git", "merge-base", "--is-ancestor", self.commits[-1], "HEAD"])
+            if is_ancestor.returncode == 0:
+                rev_range = f"{self.commits[-1]}..HEAD"
+            else:
+                # History was rewritten, start over
+                self.timestamps, self.commits = [], []
+
+        new_commits = self.run(
+            ["git", "log", "--first-parent", "--reverse", "--format=%ct %H", rev_range],
+            check=True,
+            text=True,
+            stdout=subprocess.PIPE,
+        ).stdout.split()
+
+        if not new_commits and self.path.exists():
+            return
+
+        for timestamp, commit in zip(new_commits[::2], new_commits[1::2]):
+            self.timestamps.append(max(int(timestamp), self.timestamps[-1]) if self.timestamps else int(timestamp))
+            self.commits.append(commit)
+
+        self._save()
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            f.writelines(f"{timestamp} {commit}\n" for timestamp, commit in zip(self.timestamps, self.commits))
+        tmp_path.replace(self.path)
+
+    def commit_at(self, timestamp: int) -> Optional[str]:
+        """Last commit made not later than timestamp"""
+        position = bisect_right(self.timestamps, timestamp)
+        return self.commits[position - 1] if position else None
@@ -1,9 +1,14 @@
-import re
 from pathlib import Path
-from typing import List, Optional
+from typing import List
 
 import user_texts
-from validator import ALLOWED_SEPARATORS, NO_VARIANTS, YES_VARIANTS, RollbackValidator
+from selector import SelectionError, parse_selection
+from validator import NO_VARIANTS, YES_VARIANTS
+
+PAGE_SIZE = 50
+NEXT_PAGE = ">"
+PREVIOUS_PAGE = "<"
+SELECT_ALL = "all"
 
 
 class UserInput:
@@ -32,30 +37,40 @@ class UserInput:
         return default
 
     @staticmethod
-    def ask_rollback(
-            rollback_candidates: List[Path],
-            validator: Optional[RollbackValidator] = None,
-    ) -> tuple[Optional[set[int]], bool]:
-        while True:
-            prompt = [user_texts.specify_rollback]
-
-            for i, path in enumerate(rollback_candidates):
-                prompt += f"{i} {path}"
-
-            user_input = UserInput.raw("\n".join(prompt) + "\n")
-            if not validator or validator.is_valid(user_input):
-                break
+    def select(candidates: List[Path], header: str, page_size: int = PAGE_SIZE, default_all: bool = True) -> list[int]:
+        """
+        Ask user to pick candidates by numbers, ranges, globs and their negations. Returns indices of selected ones.
+        Long lists are shown page by page. 'all' picks every candidate, so does an empty answer unless default_all
+        is off, then it picks none, which suits destructive prompts.
+        """
+        print(f"\n{header}")
+        page = 0
+        pages = max(1, -(-len(candidates) // page_size))
+        UserInput.print_page(candidates, page, page_size)
 
-            print(validator.error_message + "\n\n")
-
-        if not user_input:
-            user_input = ALLOWED_SEPARATORS[0].join(
-                map(str, range(len(rollback_candidates)))
-            )
+        while True:
+            prompt = user_texts.select_files if default_all else user_texts.select_files_or_skip
+            if pages > 1:
+                prompt = user_texts.select_page.format(page + 1, pages) + prompt
 
-        if user_input in NO_VARIANTS:
-            return None, False
+            # Raw input is not lowercased, globs are case-sensitive
+            user_input = input(prompt).strip()
+            if user_input in (NEXT_PAGE, PREVIOUS_PAGE):
+                page = min(pages - 1, page + 1) if user_input == NEXT_PAGE else max(0, page - 1)
+                UserInput.print_page(candidates, page, page_size)
+                continue
+            if user_input.lower() == SELECT_ALL or (not user_input and default_all):
+                return list(range(len(candidates)))
+            if not user_input or user_input.lower() in NO_VARIANTS + ("q",):
+                return []
 
-        user_input = re.split("|".join(ALLOWED_SEPARATORS), user_input)
+            try:
+                return parse_selection(user_input, candidates)
+            except SelectionError as ex:
+                print(ex)
 
-        return set(map(int, filter(bool, user_input))), True
+    @staticmethod
+    def print_page(candidates: List[Path], page: int, page_size: int = PAGE_SIZE) -> None:
+        start = page * page_size
+        for i, path in enumerate(candidates[start : start + page_size], start=start + 1):
+            print(f"{i}. {path}")
@@ -0,0 +1,53 @@
+import os
+from pathlib import Path
+
+from stat_cache import state_path
+
+
+class Journal:
+    """
+    Repo paths processed by the current backup run, stored in .git/gikkon, so an interrupted run can be resumed.
+    Paths are written only on checkpoints, after their repo copies, stat cache and manifest are saved,
+    so the journal never claims more than what is on disk.
+    """
+
+    FILE_NAME = "journal"
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.done: set[str] = set()
+        self.pending: list[str] = []
+
+    @classmethod
+    def for_repo(cls, repo_path: Path) -> "Journal":
+        return cls(state_path(repo_path, cls.FILE_NAME))
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as f:
+                self.done = set(f.read().splitlines())
+        except FileNotFoundError:
+            self.done = set()
+
+    def reset(self) -> None:
+        self.done, self.pending = set(), []
+        self.remove()
+
+    def record(self, key: str) -> None:
+        self.pending.append(key)
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            f.writelines(f"{key}\n" for key in self.pending)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.done.update(self.pending)
+        self.pending = []
+
+    def remove(self) -> None:
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,87 @@
+import json
+from collections import deque
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, Optional
+
+FORMATS = ("text", "json", "jsonl", "null")
+WORKERS = 16
+
+# policy is a short description of the effective backup policy, e.g. "size,every=7"
+ListEntry = namedtuple("ListEntry", ["inner", "outer", "status", "size", "mtime", "policy"], defaults=[None])
+
+
+def bounded_map(func: Callable, items: Iterable, workers: int = WORKERS) -> Iterator:
+    """
+    Like Executor.map, but keeps only a window of pending tasks,
+    so results are streamed while the input is still being produced
+    """
+    window = workers * 4
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def _as_dict(entry: ListEntry) -> dict:
+    return {
+        "system_path": str(entry.outer),
+        "repo_path": str(entry.inner),
+        "status": entry.status,
+        "size": entry.size,
+        "mtime": entry.mtime,
+        "policy": entry.policy,
+    }
+
+
+def print_text(entries: Iterable[ListEntry], repo_paths: bool, long: bool = False) -> None:
+    empty = True
+    for entry in entries:
+        if empty:
+            print("\nFiles under gikkon control:")
+            empty = False
+
+        path = str(entry.inner) if repo_paths else str(entry.outer)
+        if not long:
+            print(path)
+            continue
+
+        size = "-" if entry.size is None else entry.size
+        mtime = "-" if entry.mtime is None else datetime.fromtimestamp(entry.mtime).isoformat(timespec="seconds")
+        policy = "" if entry.policy is None else f"{entry.policy:<12}  "
+        print(f"{entry.status:<8}  {size:>10}  {mtime:<19}  {policy}{path}")
+
+    if empty:
+        print("\nNo files under gikkon control")
+
+
+def print_json(entries: Iterable[ListEntry], repo_paths: Optional[bool] = None) -> None:
+    separator = "[\n"
+    for entry in entries:
+        print(separator + json.dumps(_as_dict(entry)), end="")
+        separator = ",\n"
+
+    print("[]" if separator == "[\n" else "\n]")
+
+
+def print_jsonl(entries: Iterable[ListEntry], repo_paths: Optional[bool] = None) -> None:
+    for entry in entries:
+        print(json.dumps(_as_dict(entry)))
+
+
+def print_null(entries: Iterable[ListEntry], repo_paths: bool = False) -> None:
+    for entry in entries:
+        print(str(entry.inner) if repo_paths else str(entry.outer), end="\0")
+
+
+PRINTERS = {
+    "json": print_json,
+    "jsonl": print_jsonl,
+    "null": print_null,
+}
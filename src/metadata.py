@@ -0,0 +1,217 @@
+import base64
+import grp
+import os
+import pwd
+import re
+import shlex
+import stat
+import subprocess
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional
+
+from durable import replace_file
+from errors import SudoError
+from events import MetadataSudoUsed, emit
+
+MANIFEST_NAME = ".gikkon-meta"
+HEADER = "# gikkon metadata v1: path, mode, user, group, symlink target, xattrs"
+
+_ESCAPES = {"\\": "\\\\", "\t": "\\t", "\n": "\\n"}
+_UNESCAPES = {v: k for k, v in _ESCAPES.items()}
+
+
+class Entry(NamedTuple):
+    mode: int
+    user: str
+    group: str
+    link: str = ""
+    xattrs: str = ""
+
+
+def _escape(value: str) -> str:
+    return re.sub(r"[\\\t\n]", lambda m: _ESCAPES[m.group()], value)
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r"\\[\\tn]", lambda m: _UNESCAPES[m.group()], value)
+
+
+@lru_cache(maxsize=None)
+def _user_name(uid: int) -> str:
+    try:
+        return pwd.getpwuid(uid).pw_name
+    except KeyError:
+        return str(uid)
+
+
+@lru_cache(maxsize=None)
+def _group_name(gid: int) -> str:
+    try:
+        return grp.getgrgid(gid).gr_name
+    except KeyError:
+        return str(gid)
+
+
+def _uid(user: str) -> int:
+    try:
+        return pwd.getpwnam(user).pw_uid
+    except KeyError:
+        return int(user) if user.isdigit() else -1
+
+
+def _gid(group: str) -> int:
+    try:
+        return grp.getgrnam(group).gr_gid
+    except KeyError:
+        return int(group) if group.isdigit() else -1
+
+
+def _read_xattrs(path: Path) -> str:
+    try:
+        names = sorted(os.listxattr(path, follow_symlinks=False))
+        return ";".join(
+            f"{name}={base64.b64encode(os.getxattr(path, name, follow_symlinks=False)).decode()}" for name in names
+        )
+    except (AttributeError, OSError):
+        return ""
+
+
+def entry_from_stat(path: Path, st: os.stat_result, xattrs: bool = False) -> Entry:
+    link = os.readlink(path) if stat.S_ISLNK(st.st_mode) else ""
+    return Entry(
+        mode=stat.S_IMODE(st.st_mode),
+        user=_user_name(st.st_uid),
+        group=_group_name(st.st_gid),
+        link=link,
+        xattrs=_read_xattrs(path) if xattrs else "",
+    )
+
+
+class Manifest:
+    """
+    Mode, ownership, symlink targets and extended attributes of tracked files, which git itself doesn't keep.
+    Stored as sorted tab separated lines in the repo root and committed together with the files.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.entries: dict[str, Entry] = {}
+        self.changed = False
+
+    @classmethod
+    def for_repo(cls, repo_path: Path) -> "Manifest":
+        manifest = cls(repo_path.joinpath(MANIFEST_NAME))
+        manifest.load()
+        return manifest
+
+    def load(self) -> None:
+        self.entries = {}
+        try:
+            with open(self.path) as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return
+
+        self.entries = parse(lines)
+
+    def save(self) -> None:
+        if not self.changed:
+            return
+
+        replace_file(self.path, lambda tmp_path: tmp_path.write_text(dump(self.entries)))
+        self.changed = False
+
+    def get(self, key: str) -> Optional[Entry]:
+        return self.entries.get(key)
+
+    def update(self, key: str, path: Path, st: Optional[os.stat_result] = None, xattrs: bool = False) -> Entry:
+        entry = entry_from_stat(path, st or os.lstat(path), xattrs)
+        if self.entries.get(key) != entry:
+            self.entries[key] = entry
+            self.changed = True
+
+        return entry
+
+    def remove(self, key: str) -> None:
+        if self.entries.pop(key, None) is not None:
+            self.changed = True
+
+
+def parse(lines: Iterable[str]) -> dict[str, Entry]:
+    entries = {}
+    for line in lines:
+        if not line or line.startswith("#"):
+            continue
+
+        key, mode, user, group, link, xattrs = (_unescape(field) for field in line.split("\t"))
+        entries[key] = Entry(int(mode, 8), user, group, link, xattrs)
+
+    return entries
+
+
+def dump(entries: dict[str, Entry]) -> str:
+    lines = [HEADER]
+    for key in sorted(entries):
+        entry = entries[key]
+        fields = (key, f"{entry.mode:04o}", entry.user, entry.group, entry.link, entry.xattrs)
+        lines.append("\t".join(_escape(field) for field in fields))
+
+    return "\n".join(lines) + "\n"
+
+
+def _apply_one(path: Path, entry: Entry) -> None:
+    if entry.link:
+        replace_file(path, lambda tmp_path: os.symlink(entry.link, tmp_path))
+    else:
+        os.chmod(path, entry.mode)
+
+    uid, gid = _uid(entry.user), _gid(entry.group)
+    st = os.lstat(path)
+    if (uid, gid) != (st.st_uid, st.st_gid) and (uid, gid) != (-1, -1):
+        os.chown(path, uid, gid, follow_symlinks=False)
+
+    for name, value in _split_xattrs(entry.xattrs):
+        os.setxattr(path, name, base64.b64decode(value), follow_symlinks=False)
+
+
+def _split_xattrs(xattrs: str) -> list[tuple[str, str]]:
+    return [tuple(item.split("=", 1)) for item in xattrs.split(";") if item]
+
+
+def _shell_commands(path: Path, entry: Entry) -> list[str]:
+    quoted = shlex.quote(str(path))
+    if entry.link:
+        # Without -T a directory at the path would get the link inside instead of being replaced
+        commands = [f"ln -sfnT {shlex.quote(entry.link)} {quoted}"]
+    else:
+        commands = [f"chmod {entry.mode:04o} {quoted}"]
+
+    commands.append(f"chown -h {shlex.quote(entry.user)}:{shlex.quote(entry.group)} {quoted}")
+    for name, value in _split_xattrs(entry.xattrs):
+        commands.append(f"setfattr -h -n {shlex.quote(name)} -v 0s{value} {quoted}")
+
+    return commands
+
+
+def apply(entries: list[tuple[Path, Entry]]) -> None:
+    """
+    Restore metadata on system files. Whatever can't be done by the current user is done
+    by a single sudo shell instead of a sudo call per file.
+    """
+    privileged = []
+    for path, entry in entries:
+        try:
+            _apply_one(path, entry)
+        except PermissionError:
+            privileged.append((path, entry))
+
+    if not privileged:
+        return
+
+    script = "\n".join(command for path, entry in privileged for command in _shell_commands(path, entry))
+    emit(MetadataSudoUsed(len(privileged)))
+    try:
+        subprocess.run(["sudo", "sh", "-e"], input=script + "\n", text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        raise SudoError(f"Failed to restore metadata with sudo: {e}")
@@ -0,0 +1,93 @@
+import os
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from events import PhaseFinished, emit
+
+# name: (type, help)
+METRICS = {
+    "gikkon_files_tracked": ("gauge", "Number of files under gikkon control"),
+    "gikkon_files_changed": ("gauge", "Number of tracked files which differ from the system ones"),
+    "gikkon_files_missing": ("gauge", "Number of tracked files which are not present in the system"),
+    "gikkon_files_copied": ("gauge", "Number of files copied into the repo by the last run"),
+    "gikkon_files_deleted": ("gauge", "Number of files removed from the repo by the last run"),
+    "gikkon_bytes_copied": ("gauge", "Number of bytes copied into the repo by the last run"),
+    "gikkon_files_skipped": ("gauge", "Number of files left unchecked by their backup policies in the last run"),
+    "gikkon_git_subprocesses": ("gauge", "Number of git processes started by the last run"),
+    "gikkon_unpushed_commits": ("gauge", "Number of local commits not pushed to the remote"),
+    "gikkon_last_push_timestamp_seconds": ("gauge", "Unix time of the last successful push"),
+    "gikkon_last_run_timestamp_seconds": ("gauge", "Unix time when the last run finished"),
+    "gikkon_phase_duration_seconds": ("gauge", "Duration of phases of the last run"),
+}
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metrics:
+    """Collects numbers of a single run and exports them for node_exporter textfile collector"""
+
+    def __init__(self, command: str, names: Iterable[str] = ()) -> None:
+        self.command = command
+        self.values: dict[str, float] = defaultdict(float)
+        # Series should not disappear from the file when nothing was counted during the run
+        for name in names:
+            self.values[name] = 0
+        self.phases: dict[str, float] = defaultdict(float)
+
+    def inc(self, name: str, value: float = 1) -> None:
+        self.values[name] += value
+
+    def set(self, name: str, value: float) -> None:
+        self.values[name] = value
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - start
+            self.phases[name] += duration
+            emit(PhaseFinished(self.command, name, duration))
+
+    def render(self) -> str:
+        samples = {name: [(f'command="{self.command}"', value)] for name, value in self.values.items()}
+        samples["gikkon_phase_duration_seconds"] = [
+            (f'command="{self.command}",phase="{phase}"', value) for phase, value in self.phases.items()
+        ]
+
+        lines = []
+        for name in sorted(samples):
+            if not samples[name]:
+                continue
+
+            metric_type, description = METRICS[name]
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(f"{name}{{{labels}}} {_format(value)}" for labels, value in samples[name])
+
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, directory: Path) -> None:
+        """
+        Write metrics to gikkon_<command>.prom in the directory. The file is replaced atomically,
+        so the collector never reads a partially written one.
+        """
+        self.set("gikkon_last_run_timestamp_seconds", time.time())
+
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".gikkon_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.render())
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, directory.joinpath(f"gikkon_{self.command}.prom"))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
@@ -0,0 +1,106 @@
+import os
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+from config import expand_host
+
+# Inner root -> outer root, roots of the config are added over them. Everything not covered by a root
+# is mapped relative to '/'
+DEFAULT_ROOTS = {"home": "~"}
+
+_TARGET = object()
+
+
+class _PrefixTrie:
+    """Trie over path components, returns the target of the longest matching prefix"""
+
+    def __init__(self) -> None:
+        self.root: dict = {}
+
+    def insert(self, parts: tuple[str, ...], target: Path) -> None:
+        node = self.root
+        for part in parts:
+            node = node.setdefault(part, {})
+
+        # First declared root wins when several roots share a prefix
+        node.setdefault(_TARGET, target)
+
+    def lookup(self, parts: tuple[str, ...]) -> tuple[Optional[Path], int]:
+        matches = self.lookup_all(parts)
+        return matches[0] if matches else (None, 0)
+
+    def lookup_all(self, parts: tuple[str, ...]) -> list[tuple[Optional[Path], int]]:
+        """Targets of all matching prefixes, the longest first"""
+        node = self.root
+        matches = [(node[_TARGET], 0)] if _TARGET in node else []
+        for i, part in enumerate(parts, start=1):
+            node = node.get(part)
+            if node is None:
+                break
+            if _TARGET in node:
+                matches.append((node[_TARGET], i))
+
+        return matches[::-1]
+
+
+class PathMapper:
+    """
+    Translates paths between the git repo (inner, relative to repo root) and the system (outer, absolute).
+    Roots are resolved once on creation, so mapping a file is a pure dictionary walk.
+    """
+
+    def __init__(self, roots: dict[str, str]) -> None:
+        self._to_outer = _PrefixTrie()
+        self._to_inner = _PrefixTrie()
+
+        for inner, outer in roots.items():
+            inner_path = Path(inner)
+            outer_path = Path(outer)
+            self._to_outer.insert(inner_path.parts, outer_path)
+            self._to_inner.insert(outer_path.parts, inner_path)
+
+        self._to_outer.insert((), Path("/"))
+        self._to_inner.insert(("/",), Path())
+
+    @classmethod
+    def from_config(cls, roots: Optional[dict[str, str]] = None) -> "PathMapper":
+        resolved = {}
+        for inner, outer in {**DEFAULT_ROOTS, **(roots or {})}.items():
+            outer = os.path.expandvars(os.path.expanduser(outer))
+            # Skip roots pointing to unset environment variables instead of mapping into a relative path
+            if not os.path.isabs(outer):
+                continue
+
+            inner = expand_host([inner.strip("/")])[0]
+            resolved[inner] = outer
+
+        return cls(resolved)
+
+    def to_outer(self, inner: Path) -> Path:
+        target, depth = self._to_outer.lookup(inner.parts)
+        return target.joinpath(*inner.parts[depth:])
+
+    def to_inner(self, outer: Path, exists: Optional[Callable[[Path], bool]] = None) -> Path:
+        """
+        Where roots overlap, e.g. an XDG directory inside home, the longest one wins. With exists telling whether
+        a path is in the repo, a file which is there, or whose directory is, keeps its path under the shorter root,
+        so adding a root doesn't change paths of tracked files.
+        """
+        paths = [target.joinpath(*outer.parts[depth:]) for target, depth in self._to_inner.lookup_all(outer.parts)]
+        if exists is not None and len(paths) > 1:
+            for path in paths:
+                if exists(path) or (path.parent != Path() and exists(path.parent)):
+                    return path
+
+        return paths[0]
+
+    def to_outer_many(self, inner_paths: Iterable[Path]) -> Iterator[tuple[Path, Path]]:
+        """Map a stream of inner paths, reusing the lookup for files sharing a directory"""
+        parents: dict[Path, Path] = {}
+        for inner in inner_paths:
+            inner = Path(inner)
+            parent = parents.get(inner.parent)
+            if parent is None:
+                parent = parents[inner.parent] = self.to_outer(inner.parent)
+
+            yield inner, parent.joinpath(inner.name)
@@ -0,0 +1,109 @@
+import re
+import zlib
+from fnmatch import translate
+from pathlib import Path
+from typing import NamedTuple
+
+from config import parse_size
+from errors import ConfigError
+
+COMPARE_HASH = "hash"
+COMPARE_SIZE = "size"
+COMPARE_MTIME = "mtime-only"
+COMPARE_MODES = (COMPARE_HASH, COMPARE_SIZE, COMPARE_MTIME)
+# Bytes read to tell binary files from text ones, the same heuristic as git uses
+BINARY_PROBE_SIZE = 8000
+
+
+class PathPolicy(NamedTuple):
+    """
+    How backup treats files matching a glob. compare decides when a file is considered changed:
+    hash compares contents, size and mtime-only trust stat data alone. Files larger than max_size
+    and binary ones with skip_binary are not copied, every=N checks files only every Nth run,
+    and files with higher priority go first.
+    """
+
+    compare: str = COMPARE_HASH
+    max_size: int = 0
+    skip_binary: bool = False
+    every: int = 1
+    priority: int = 0
+
+    @classmethod
+    def from_config(cls, pattern: str, options: dict) -> "PathPolicy":
+        unknown = set(options) - set(cls._fields)
+        if unknown:
+            raise ConfigError(f"Unknown options of policy {pattern}: {', '.join(sorted(unknown))}")
+
+        compare = options.get("compare", COMPARE_HASH)
+        if compare not in COMPARE_MODES:
+            raise ConfigError(f"Compare mode of policy {pattern} should be one of {', '.join(COMPARE_MODES)}")
+
+        return cls(
+            compare=compare,
+            max_size=parse_size(options.get("max_size", 0)),
+            skip_binary=bool(options.get("skip_binary", False)),
+            every=max(int(options.get("every", 1)), 1),
+            priority=int(options.get("priority", 0)),
+        )
+
+    def is_due(self, key: str, run: int) -> bool:
+        # Files are spread over runs by hash of their path, so each run checks a similar share of them
+        return (run + zlib.crc32(key.encode())) % self.every == 0
+
+    def describe(self) -> str:
+        parts = [self.compare]
+        if self.max_size:
+            parts.append(f"max_size={self.max_size}")
+        if self.skip_binary:
+            parts.append("skip_binary")
+        if self.every > 1:
+            parts.append(f"every={self.every}")
+        if self.priority:
+            parts.append(f"priority={self.priority}")
+
+        return ",".join(parts)
+
+
+DEFAULT_PATH_POLICY = PathPolicy()
+
+
+class PolicySet:
+    """
+    Policies of the [Policies] config section keyed by globs over repo paths, first match wins.
+    All globs are compiled into a single regex, so a lookup is one match whatever the number of policies.
+    """
+
+    def __init__(self, config: dict[str, dict]) -> None:
+        self.policies = [PathPolicy.from_config(pattern, options) for pattern, options in config.items()]
+        self.has_priorities = any(policy.priority for policy in self.policies)
+        self._match = None
+        if self.policies:
+            # Alternatives are tried in order, the group of the first matching glob tells its policy
+            pattern = "|".join(f"(?P<p{i}>{translate(glob)})" for i, glob in enumerate(config))
+            self._match = re.compile(pattern).match
+
+    def policy(self, key: str) -> PathPolicy:
+        match = self._match(key) if self._match else None
+        return self.policies[int(match.lastgroup[1:])] if match else DEFAULT_PATH_POLICY
+
+
+def is_binary(path: Path) -> bool:
+    with open(path, "rb") as f:
+        return b"\0" in f.read(BINARY_PROBE_SIZE)
+
+
+def next_run(path: Path, resume: bool = False) -> int:
+    """Number of the current backup run, kept in path. A resumed run keeps the number of the interrupted one"""
+    try:
+        run = int(path.read_text())
+    except (FileNotFoundError, ValueError):
+        run = 0
+
+    if resume:
+        return run
+
+    run += 1
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(f"{run}\n")
+    return run
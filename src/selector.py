@@ -0,0 +1,100 @@
+import re
+from fnmatch import translate
+from typing import Iterator, NamedTuple, Sequence
+
+SEPARATORS = " ,"
+RANGE_SEPARATOR = "-"
+NEGATION = "!"
+
+
+class SelectionError(ValueError):
+    pass
+
+
+class Token(NamedTuple):
+    text: str
+    negated: bool
+    # Numbers are ranges of a single number, globs have no range
+    first: int = -1
+    last: int = -1
+
+    @property
+    def is_glob(self) -> bool:
+        return self.first < 0
+
+
+def _number(text: str) -> int:
+    return int(text) if text.isdigit() else -1
+
+
+def _token(text: str) -> Token:
+    negated = text.startswith(NEGATION)
+    body = text[1:] if negated else text
+
+    start, separator, end = body.partition(RANGE_SEPARATOR)
+    first, last = _number(start), _number(end) if separator else _number(start)
+    if first < 0 or last < 0:
+        return Token(body, negated)
+
+    return Token(body, negated, min(first, last), max(first, last))
+
+
+def tokenize(user_input: str) -> Iterator[Token]:
+    """
+    Split input into tokens in a single pass: numbers, ranges like '3-40' and globs,
+    separated by spaces or commas. Token starting with '!' deselects what it matches.
+    """
+    start = None
+    for i, char in enumerate(user_input):
+        if char in SEPARATORS:
+            if start is not None:
+                yield _token(user_input[start:i])
+                start = None
+        elif start is None:
+            start = i
+
+    if start is not None:
+        yield _token(user_input[start:])
+
+
+def parse_selection(user_input: str, candidates: Sequence, first: int = 1) -> list[int]:
+    """
+    Parse input into sorted indices of selected candidates. Numbers start from first.
+    Globs are matched against candidate paths with and without the leading '/'.
+    Tokens apply from left to right, if the first one is negated everything else is selected initially.
+    """
+    limit = len(candidates)
+    selected = None
+    names = None
+
+    for token in tokenize(user_input):
+        if selected is None:
+            selected = bytearray(b"\x01" * limit if token.negated else limit)
+        mark = 0 if token.negated else 1
+
+        if not token.is_glob:
+            for number in (token.first, token.last):
+                if not first <= number < limit + first:
+                    raise SelectionError(
+                        f"Number {number} is out of range, choose between {first} and {limit + first - 1}"
+                    )
+            selected[token.first - first : token.last - first + 1] = bytes([mark]) * (token.last - token.first + 1)
+            continue
+
+        if names is None:
+            names = [str(candidate) for candidate in candidates]
+
+        match = re.compile(translate(token.text)).match
+        matched = False
+        for i, name in enumerate(names):
+            if match(name) or (name.startswith("/") and match(name.lstrip("/"))):
+                selected[i] = mark
+                matched = True
+
+        if not matched:
+            raise SelectionError(f"Pattern '{token.text}' matches nothing")
+
+    if selected is None:
+        return []
+
+    return [i for i, value in enumerate(selected) if value]
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import zlib
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+from durable import replace_file
+from errors import StoreError
+from throttle import DEFAULT_POLICY, IOPolicy
+
+POINTER_HEADER = b"gikkon-sidecar v1\n"
+# Cached digests of files kept in the store are prefixed, so they are never taken for plain content hashes
+DIGEST_PREFIX = "sidecar:"
+CHUNK_SIZE = 256 * 1024
+# Pointers have a line per chunk, anything larger is not a pointer, so files up to about 4G can be stored
+MAX_POINTER_SIZE = 1024 * 1024
+
+
+class Pointer(NamedTuple):
+    """What is committed instead of a large file: its size, sha256 and sha256 of its chunks"""
+
+    size: int
+    digest: str
+    chunks: list[str]
+
+    def dump(self) -> bytes:
+        lines = [f"size {self.size}", f"sha256 {self.digest}"] + self.chunks
+        return POINTER_HEADER + "".join(f"{line}\n" for line in lines).encode()
+
+
+def parse_pointer(data: bytes) -> Optional[Pointer]:
+    if not data.startswith(POINTER_HEADER):
+        return None
+
+    try:
+        size_line, digest_line, *chunks = data[len(POINTER_HEADER) :].decode().splitlines()
+        return Pointer(int(size_line.removeprefix("size ")), digest_line.removeprefix("sha256 "), chunks)
+    except ValueError:
+        return None
+
+
+def read_pointer(path: Path) -> Optional[Pointer]:
+    """Pointer stored in the file, None if it is a regular copy"""
+    try:
+        if os.path.islink(path) or os.path.getsize(path) > MAX_POINTER_SIZE:
+            return None
+
+        with open(path, "rb") as f:
+            if f.read(len(POINTER_HEADER)) != POINTER_HEADER:
+                return None
+            return parse_pointer(POINTER_HEADER + f.read())
+    except FileNotFoundError:
+        return None
+
+
+def file_digest(path: Path, policy: IOPolicy = DEFAULT_POLICY) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := policy.read(f, CHUNK_SIZE):
+            digest.update(chunk)
+        policy.release(f)
+
+    return digest.hexdigest()
+
+
+class Store:
+    """
+    Content-addressed store of large files outside of git history. Files are split into chunks named
+    by their sha256 and compressed with zlib, so a chunk shared by several versions is stored once.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def _chunk_path(self, digest: str) -> Path:
+        return self.path.joinpath(digest[:2], digest[2:])
+
+    def put(self, source: Path, policy: IOPolicy = DEFAULT_POLICY) -> Pointer:
+        digest = hashlib.sha256()
+        chunks = []
+        size = 0
+        with open(source, "rb") as f:
+            while chunk := policy.read(f, CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+                chunks.append(self._put_chunk(chunk))
+            policy.release(f)
+
+        return Pointer(size, digest.hexdigest(), chunks)
+
+    def _put_chunk(self, chunk: bytes) -> str:
+        digest = hashlib.sha256(chunk).hexdigest()
+        path = self._chunk_path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            replace_file(path, lambda tmp_path: tmp_path.write_bytes(zlib.compress(chunk)))
+
+        return digest
+
+    def read(self, pointer: Pointer) -> Iterator[bytes]:
+        """Content of the file, every chunk is verified"""
+        for digest in pointer.chunks:
+            try:
+                chunk = zlib.decompress(self._chunk_path(digest).read_bytes())
+            except (FileNotFoundError, zlib.error):
+                chunk = None
+
+            if chunk is None or hashlib.sha256(chunk).hexdigest() != digest:
+                raise StoreError(f"Chunk {digest} is missing or damaged in the sidecar store {self.path}")
+
+            yield chunk
+
+    def write(self, pointer: Pointer, to_file: Path) -> None:
+        with open(to_file, "wb") as f:
+            for chunk in self.read(pointer):
+                f.write(chunk)
+
+    def chunks(self) -> Iterator[Path]:
+        if not self.path.is_dir():
+            return
+
+        for directory in sorted(self.path.iterdir()):
+            if directory.is_dir():
+                yield from sorted(path for path in directory.iterdir() if not path.name.startswith("."))
+
+    def unreferenced(self, pointers: Iterable[Pointer]) -> list[Path]:
+        referenced = {digest for pointer in pointers for digest in pointer.chunks}
+        return [path for path in self.chunks() if path.parent.name + path.name not in referenced]
+
+    def gc(self, pointers: Iterable[Pointer]) -> tuple[int, int]:
+        """Remove chunks not referenced by any of pointers, returns number of removed chunks and freed bytes"""
+        unreferenced = self.unreferenced(pointers)
+        freed = 0
+        for path in unreferenced:
+            freed += path.stat().st_size
+            path.unlink()
+
+        for directory in {path.parent for path in unreferenced}:
+            if not any(directory.iterdir()):
+                directory.rmdir()
+
+        return len(unreferenced), freed
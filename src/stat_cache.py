@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import stat
+from enum import Enum
+from pathlib import Path
+from typing import Optional
+
+from filters import FINGERPRINT_PREFIX, Transform
+from policies import COMPARE_HASH, COMPARE_MTIME
+from sidecar import DIGEST_PREFIX, file_digest, read_pointer
+from throttle import DEFAULT_POLICY, IOPolicy
+
+# Local state of gikkon lives inside .git, so it is never committed and never shows up in git status
+STATE_DIR = Path(".git", "gikkon")
+BUFFER_SIZE = 128 * 1024
+
+
+class SyncStatus(Enum):
+    IN_SYNC = "in sync"
+    MODIFIED = "modified"
+    MISSING = "missing"
+    UNREADABLE = "unreadable"
+
+
+def state_path(repo_path: Path, name: str) -> Path:
+    return repo_path.joinpath(STATE_DIR, name)
+
+
+class StatCache:
+    """
+    Remembers stat data of the system file and its repo copy at the moment they were known to be equal.
+    While both stats are unchanged the files are considered in sync without reading them.
+    """
+
+    FILE_NAME = "stat_cache.json"
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.entries: dict[str, list[int]] = {}
+        self.changed = False
+
+    @classmethod
+    def for_repo(cls, repo_path: Path) -> "StatCache":
+        cache = cls(state_path(repo_path, cls.FILE_NAME))
+        cache.load()
+        return cache
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def save(self) -> None:
+        if not self.changed:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+    def is_fresh(self, key: str, outer_stat: os.stat_result, inner_stat: os.stat_result) -> bool:
+        entry = self.entries.get(key)
+        return entry is not None and entry[:4] == _signature(outer_stat, inner_stat)
+
+    def digest(self, key: str, inner_stat: os.stat_result) -> str:
+        """Content hash of the repo copy, if the copy wasn't changed since it was hashed"""
+        entry = self.entries.get(key)
+        if entry is None or len(entry) < 5 or entry[2:4] != [inner_stat.st_size, inner_stat.st_mtime_ns]:
+            return ""
+
+        return entry[4]
+
+    def known_outer(self, key: str, inner_stat: os.stat_result) -> Optional[tuple[int, int]]:
+        """Size and mtime of the system file when it was last equal to the repo copy, if the copy is unchanged since"""
+        entry = self.entries.get(key)
+        if entry is None or entry[2:4] != [inner_stat.st_size, inner_stat.st_mtime_ns]:
+            return None
+
+        return entry[0], entry[1]
+
+    def update(self, key: str, outer_stat: os.stat_result, inner_stat: os.stat_result, digest: str = "") -> None:
+        signature = _signature(outer_stat, inner_stat) + [digest]
+        if self.entries.get(key) != signature:
+            self.entries[key] = signature
+            self.changed = True
+
+    def discard(self, key: str) -> None:
+        if self.entries.pop(key, None) is not None:
+            self.changed = True
+
+
+def _signature(outer_stat: os.stat_result, inner_stat: os.stat_result) -> list[int]:
+    return [outer_stat.st_size, outer_stat.st_mtime_ns, inner_stat.st_size, inner_stat.st_mtime_ns]
+
+
+def _hash(path: Path, policy: IOPolicy = DEFAULT_POLICY) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := policy.read(f, BUFFER_SIZE):
+            digest.update(chunk)
+        policy.release(f)
+
+    return digest.hexdigest()
+
+
+def _compare(outer: Path, inner: Path, policy: IOPolicy = DEFAULT_POLICY) -> tuple[bool, str]:
+    """Compare files and hash the content on the way, so the next check needs to read only one of them"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(outer, "rb") as outer_file, open(inner, "rb") as inner_file:
+        try:
+            while True:
+                chunk = policy.read(outer_file, BUFFER_SIZE)
+                if chunk != policy.read(inner_file, BUFFER_SIZE):
+                    return False, ""
+                if not chunk:
+                    return True, digest.hexdigest()
+
+                digest.update(chunk)
+        finally:
+            policy.release(outer_file)
+            policy.release(inner_file)
+
+
+def read_file(path: Path, policy: IOPolicy = DEFAULT_POLICY) -> bytes:
+    chunks = []
+    with open(path, "rb") as f:
+        while chunk := policy.read(f, BUFFER_SIZE):
+            chunks.append(chunk)
+        policy.release(f)
+
+    return b"".join(chunks)
+
+
+def sync_status(
+    key: str,
+    outer: Path,
+    inner: Path,
+    cache: StatCache,
+    outer_stat: Optional[os.stat_result] = None,
+    policy: IOPolicy = DEFAULT_POLICY,
+    transform: Optional[Transform] = None,
+    compare: str = COMPARE_HASH,
+) -> SyncStatus:
+    """
+    Compare system file with its repo copy, reading contents only when the cache can't answer.
+    Symlinks are compared by their targets, like backup copies them.
+    If the repo copy is a filtered system file, it is compared with the transformed system file.
+    If it is a pointer to the sidecar store, the system file is compared with the digest in the pointer.
+    With compare other than hash, once the files were known to be equal, only size or mtime of the system file
+    is compared with the cached one. Files we may not read are UNREADABLE.
+    """
+    try:
+        return _sync_status(key, outer, inner, cache, outer_stat, policy, transform, compare)
+    except PermissionError:
+        return SyncStatus.UNREADABLE
+
+
+def _sync_status(
+    key: str,
+    outer: Path,
+    inner: Path,
+    cache: StatCache,
+    outer_stat: Optional[os.stat_result],
+    policy: IOPolicy,
+    transform: Optional[Transform],
+    compare: str,
+) -> SyncStatus:
+    try:
+        outer_stat = outer_stat or os.lstat(outer)
+        inner_stat = os.lstat(inner)
+    except FileNotFoundError:
+        return SyncStatus.MISSING
+
+    if stat.S_ISLNK(outer_stat.st_mode):
+        same = stat.S_ISLNK(inner_stat.st_mode) and os.readlink(inner) == os.readlink(outer)
+        return SyncStatus.IN_SYNC if same else SyncStatus.MODIFIED
+
+    if not stat.S_ISREG(outer_stat.st_mode):
+        return SyncStatus.MISSING
+
+    if not stat.S_ISREG(inner_stat.st_mode):
+        return SyncStatus.MODIFIED
+
+    # Filtered copies are cached with fingerprint of the filters, so changing filters makes the entry stale
+    digest = cache.digest(key, inner_stat)
+    is_filtered = digest.startswith(FINGERPRINT_PREFIX)
+    is_current = digest == transform.fingerprint if transform is not None else not is_filtered
+    if cache.is_fresh(key, outer_stat, inner_stat) and is_current:
+        return SyncStatus.IN_SYNC
+
+    known = cache.known_outer(key, inner_stat)
+    if compare != COMPARE_HASH and known and is_current:
+        size, mtime = known
+        unchanged = outer_stat.st_mtime_ns == mtime if compare == COMPARE_MTIME else outer_stat.st_size == size
+        return SyncStatus.IN_SYNC if unchanged else SyncStatus.MODIFIED
+
+    if transform is not None:
+        if transform.apply(read_file(outer, policy)) != read_file(inner, policy):
+            return SyncStatus.MODIFIED
+
+        cache.update(key, outer_stat, inner_stat, transform.fingerprint)
+        return SyncStatus.IN_SYNC
+
+    if outer_stat.st_size != inner_stat.st_size:
+        # Pointers are much smaller than files they point to, equal sizes mean a regular copy
+        pointer = read_pointer(inner)
+        if pointer is None or pointer.size != outer_stat.st_size or pointer.digest != file_digest(outer, policy):
+            return SyncStatus.MODIFIED
+
+        cache.update(key, outer_stat, inner_stat, DIGEST_PREFIX + pointer.digest)
+        return SyncStatus.IN_SYNC
+
+    if digest and not is_filtered and not digest.startswith(DIGEST_PREFIX):
+        equal = _hash(outer, policy) == digest
+    else:
+        equal, digest = _compare(outer, inner, policy)
+
+    if not equal:
+        return SyncStatus.MODIFIED
+
+    cache.update(key, outer_stat, inner_stat, digest)
+    return SyncStatus.IN_SYNC
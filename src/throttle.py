@@ -0,0 +1,88 @@
+import ctypes
+import os
+import platform
+import threading
+import time
+from typing import BinaryIO, Optional
+
+# ioprio_set syscall numbers, there is no wrapper in libc
+IOPRIO_SET_SYSCALLS = {
+    "x86_64": 251,
+    "i386": 289,
+    "i686": 289,
+    "aarch64": 30,
+    "riscv64": 30,
+    "armv7l": 314,
+    "ppc64le": 273,
+    "s390x": 282,
+}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+LOWEST_CPU_PRIORITY = 19
+
+
+def lower_priority() -> None:
+    """
+    Switch the process to idle I/O class and the lowest CPU priority. Both are inherited
+    by threads and git processes started afterwards, so it should be called before any work.
+    """
+    os.setpriority(os.PRIO_PROCESS, 0, LOWEST_CPU_PRIORITY)
+
+    syscall_number = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if syscall_number is None:
+        return
+
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.syscall(syscall_number, IOPRIO_WHO_PROCESS, 0, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT) != 0:
+        print(f"Warning: failed to set idle I/O priority: {os.strerror(ctypes.get_errno())}")
+
+
+class TokenBucket:
+    """Limits throughput in bytes per second, shared by all threads"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.timestamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount: int) -> None:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+            self.timestamp = now
+            # Going into debt lets the caller proceed after sleeping, while others wait for the debt to be paid
+            self.tokens -= amount
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+
+        if delay:
+            time.sleep(delay)
+
+
+class IOPolicy:
+    """How files are read while comparing and copying: bandwidth limit and page cache usage"""
+
+    def __init__(self, drop_cache: bool = False, bucket: Optional[TokenBucket] = None) -> None:
+        self.drop_cache = drop_cache and hasattr(os, "posix_fadvise")
+        self.bucket = bucket
+
+    @property
+    def is_default(self) -> bool:
+        return not self.drop_cache and self.bucket is None
+
+    def read(self, f: BinaryIO, size: int) -> bytes:
+        chunk = f.read(size)
+        if self.bucket and chunk:
+            self.bucket.consume(len(chunk))
+
+        return chunk
+
+    def release(self, f: BinaryIO) -> None:
+        """Tell the kernel the file won't be needed soon, so backups don't evict hot pages of other processes"""
+        if self.drop_cache:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+DEFAULT_POLICY = IOPolicy()
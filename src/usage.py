@@ -0,0 +1,70 @@
+"""Sizes of repo paths for the du command, rolled up into their directories like du does"""
+from collections import defaultdict
+from pathlib import PurePosixPath
+from typing import Iterable, Optional
+
+from config import format_size
+from git_wrapper import BlobUsage
+
+
+def summarize(usages: Iterable[BlobUsage], max_depth: Optional[int] = None) -> list[BlobUsage]:
+    """
+    Files and directories, with '/' after names of directories, in tree order. Entries deeper than max_depth
+    are counted in their directories only. Current size of a directory is None if none of its files is in HEAD.
+    """
+    entries = []
+    current = defaultdict(lambda: None)
+    history = defaultdict(int)
+    versions = defaultdict(int)
+    missing = defaultdict(int)
+    for usage in usages:
+        parts = PurePosixPath(usage.path).parts
+        if max_depth is None or len(parts) <= max_depth:
+            entries.append(usage)
+
+        for depth in range(len(parts)):
+            directory = "/".join(parts[:depth]) + "/"
+            if usage.current is not None:
+                current[directory] = (current[directory] or 0) + usage.current
+            history[directory] += usage.history
+            versions[directory] += usage.versions
+            missing[directory] += usage.missing
+
+    entries += [
+        BlobUsage(directory, current[directory], history[directory], versions[directory], missing[directory])
+        for directory in history
+        if directory != "/" and (max_depth is None or directory.count("/") <= max_depth)
+    ]
+    entries.sort(key=lambda entry: PurePosixPath(entry.path).parts)
+    if history:
+        entries.append(BlobUsage("total", current["/"], history["/"], versions["/"], missing["/"]))
+
+    return entries
+
+
+def print_usage(
+    usages: Iterable[BlobUsage], max_depth: Optional[int] = None, by_size: bool = False, unknown: int = 0
+) -> None:
+    """
+    Print the du table. Sizes of versions missing from a partial clone are unknown, a file whose current version
+    is missing shows '?', and the unknown objects are summed up under the table.
+    """
+    entries = summarize(usages, max_depth)
+    if not entries:
+        print("\nNo files in the repo")
+        return
+
+    if by_size:
+        # The total stays last
+        entries[:-1] = sorted(entries[:-1], key=lambda entry: entry.history, reverse=True)
+
+    print(f"{'current':>10}  {'history':>10}  {'versions':>8}  path")
+    for entry in entries:
+        current = "-" if entry.current is None else format_size(entry.current)
+        if entry.current is None and entry.missing:
+            current = "?"
+        print(f"{current:>10}  {format_size(entry.history):>10}  {entry.versions:>8}  {entry.path}")
+
+    unknown += entries[-1].missing
+    if unknown:
+        print(f"\n{unknown} object(s) are not fetched into this partial clone, their sizes are not counted")
@@ -5,13 +5,20 @@ change_files_info = "Changing files:"
 accept_changes = "Accept changes"
 commit_message = "Write a custom commit message (or press Enter to use the default):"
 revert_changes = "Do you want to revert any files in the system?"
+large_blobs_info = "These files are larger than {} and would stay in git history for good:"
+commit_large_blobs = "Commit them anyway?"
 push_changes = "You have unpushed changes. Do you want to push them first?"
-specify_rollback = """
-    Press Enter to roll back all changes.
-    Type the number(s) of change(s), separated by ',' or ' ', to roll back specific files.
-    Type 'no' to skip this step.\n
-"""
-index_out_of_bounds = "Please enter a number between {} and {}."
+select_files = (
+    "Enter numbers, ranges (3-40) or globs (etc/systemd/*), '!' before any of them to exclude, "
+    "press Enter for all, or type 'q' to skip: "
+)
+select_files_or_skip = (
+    "Enter numbers, ranges (3-40) or globs (etc/systemd/*), '!' before any of them to exclude, "
+    "type 'all' for all, or press Enter to skip: "
+)
+select_page = "Page {} of {}, type '>' or '<' to show the next or previous one. "
+revert_files = "Select files to revert:"
+remove_missing_files = "These files are not present in the system anymore. Select files to remove from the repo:"
 init_repo = """
     To use Gikkon, you need to set up a Git repository with config files.
     Please provide the link to a new or existing repository, or press Enter to exit:  
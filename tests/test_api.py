@@ -0,0 +1,138 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from api import Repo
+from errors import ConfigError, FilterError
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "test",
+    "GIT_AUTHOR_EMAIL": "test@test",
+    "GIT_COMMITTER_NAME": "test",
+    "GIT_COMMITTER_EMAIL": "test@test",
+}
+
+
+def _git(*args, cwd):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, text=True, capture_output=True).stdout.strip()
+
+
+@patch("builtins.print")
+class TestRepo(unittest.TestCase):
+    def setUp(self):
+        env_patcher = patch.dict(os.environ, GIT_ENV)
+        env_patcher.start()
+        self.addCleanup(env_patcher.stop)
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        root = Path(self.tmp_dir.name)
+        self.remote, self.path, self.home = root.joinpath("remote.git"), root.joinpath("repo"), root.joinpath("home")
+
+        _git("init", "-q", "--bare", "-b", "main", str(self.remote), cwd=root)
+        _git("clone", "-q", str(self.remote), str(self.path), cwd=root)
+        _git("checkout", "-q", "-b", "main", cwd=self.path)
+
+        self.path.joinpath("home").mkdir()
+        self.path.joinpath("home", ".bashrc").write_text("old\n")
+        self.path.joinpath("home", ".gone").write_text("gone\n")
+        _git("add", "-A", cwd=self.path)
+        _git("commit", "-q", "-m", "initial", cwd=self.path)
+        _git("push", "-q", "origin", "main", cwd=self.path)
+
+        self.home.mkdir()
+        self.home.joinpath(".bashrc").write_text("new\n")
+
+        self.repo = Repo(self.path, roots={"home": str(self.home)}, metadata=False)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_scan(self, _print_mock):
+        result = self.repo.scan()
+
+        self.assertEqual([file.path for file in result.modified], [Path("home/.bashrc")])
+        self.assertEqual([file.outer for file in result.missing], [self.home.joinpath(".gone")])
+
+    def test_stage_and_commit(self, _print_mock):
+        staged = self.repo.stage(remove_missing=lambda paths: paths)
+
+        self.assertEqual(
+            sorted((change.status, change.path, change.added, change.deleted) for change in staged.changes),
+            [("D", Path("home/.gone"), 0, 1), ("M", Path("home/.bashrc"), 1, 1)],
+        )
+        self.assertEqual((staged.copied, staged.deleted, staged.missing), (1, 1, 1))
+
+        committed = self.repo.commit("backup")
+
+        self.assertTrue(committed.pushed)
+        self.assertEqual(_git("rev-parse", "main", cwd=self.remote), committed.commit)
+        self.assertEqual(self.repo.scan().modified, [])
+
+    def test_nothing_to_commit(self, _print_mock):
+        self.home.joinpath(".bashrc").write_text("old\n")
+        self.repo.stage()
+
+        self.assertIsNone(self.repo.commit().commit)
+
+    def test_rollback(self, _print_mock):
+        self.repo.stage()
+
+        result = self.repo.rollback()
+
+        self.assertEqual([change.outer for change in result.reverted], [self.home.joinpath(".bashrc")])
+        self.assertEqual(self.home.joinpath(".bashrc").read_text(), "old\n")
+        self.assertEqual(self.repo.scan().modified, [])
+
+    def test_rollback_keeps_files_with_one_way_filters(self, _print_mock):
+        self.path.joinpath("home", ".netrc").write_text("token=REDACTED\nname=b\n")
+        _git("add", "-A", cwd=self.path)
+        _git("commit", "-q", "-m", "netrc", cwd=self.path)
+        self.home.joinpath(".netrc").write_text("token=SECRET2\nname=a\n")
+        repo = Repo(
+            self.path,
+            roots={"home": str(self.home)},
+            metadata=False,
+            filters={"home/.netrc": {"regex": [["^token=.*$", "token=REDACTED"]]}},
+        )
+        repo.stage()
+
+        result = repo.rollback()
+
+        self.assertEqual([change.path for change in result.kept], [Path("home/.netrc")])
+        self.assertEqual(self.home.joinpath(".netrc").read_text(), "token=SECRET2\nname=a\n")
+
+    def test_prints_nothing(self, print_mock):
+        with tempfile.TemporaryFile() as stdout:
+            # Git writes to the file descriptor itself, past any patching of print
+            saved = os.dup(1)
+            os.dup2(stdout.fileno(), 1)
+            try:
+                self.repo.stage(remove_missing=lambda paths: paths)
+                self.repo.commit("backup")
+                self.home.joinpath(".bashrc").write_text("newer\n")
+                self.repo.stage()
+                self.repo.rollback()
+            finally:
+                os.dup2(saved, 1)
+                os.close(saved)
+
+            stdout.seek(0)
+            self.assertEqual(stdout.read(), b"")
+        print_mock.assert_not_called()
+
+    def test_errors_are_raised(self, _print_mock):
+        with self.assertRaises(ConfigError):
+            Repo(self.path, policies={"*": {"compare": "content"}})
+
+        repo = Repo(
+            self.path, roots={"home": str(self.home)}, metadata=False, filters={"home/.bashrc": {"command": "false"}}
+        )
+        with self.assertRaises(FilterError):
+            repo.stage()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import io
+import tarfile
+import unittest
+from pathlib import Path
+
+from archive import ChunkReader, compression_for, open_tar, read_exactly, tar_info
+from metadata import Entry
+
+
+class TestChunkReader(unittest.TestCase):
+    def test_read(self):
+        reader = ChunkReader([b"abc", b"de", b"fghij"])
+
+        self.assertEqual(reader.read(2), b"ab")
+        self.assertEqual(reader.read(4), b"cdef")
+        self.assertEqual(reader.read(), b"ghij")
+        self.assertEqual(reader.read(1), b"")
+
+    def test_read_exactly(self):
+        stream = io.BytesIO(b"12345")
+
+        self.assertEqual(b"".join(read_exactly(stream, 3)), b"123")
+        self.assertEqual(stream.read(), b"45")
+        with self.assertRaises(EOFError):
+            list(read_exactly(io.BytesIO(b"1"), 2))
+
+
+class TestTarInfo(unittest.TestCase):
+    def test_without_metadata(self):
+        info = tar_info("etc/run.sh", "100755", 10, 1700000000)
+
+        self.assertEqual((info.mode, info.size, info.uname, info.mtime), (0o755, 10, "root", 1700000000))
+
+    def test_with_metadata(self):
+        info = tar_info("etc/shadow", "100644", 10, 0, Entry(0o640, "root", "42"))
+
+        self.assertEqual((info.mode, info.uname, info.gname, info.uid, info.gid), (0o640, "root", "42", 0, 42))
+
+    def test_symlink(self):
+        info = tar_info("home/link", "120000", 5, 0, Entry(0o777, "user", "user", "a.conf"))
+
+        self.assertTrue(info.issym())
+        self.assertEqual((info.mode, info.size, info.uname), (0o777, 0, "user"))
+
+    def test_compression_for(self):
+        self.assertEqual(compression_for(None), "none")
+        self.assertEqual(compression_for(Path("configs.tar.xz")), "xz")
+        self.assertEqual(compression_for(Path("configs.tgz")), "gz")
+        self.assertEqual(compression_for(Path("configs.tar")), "none")
+
+    def test_stream(self):
+        output = io.BytesIO()
+        with open_tar(output, "gz") as tar:
+            tar.addfile(tar_info("a", "100644", 3, 0), ChunkReader([b"a", b"bc"]))
+
+        with tarfile.open(fileobj=io.BytesIO(output.getvalue()), mode="r:gz") as tar:
+            self.assertEqual(tar.extractfile("a").read(), b"abc")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,97 +1,129 @@
+import tarfile
+import tempfile
 import unittest
-from unittest.mock import PropertyMock, call
+from unittest.mock import MagicMock, PropertyMock, call
 from unittest.mock import patch
 
 from backuper import *
-from backuper import _copy, _select_files_to_revert, _copy_file, _copy_file_with_sudo, _delete_file, \
-    _delete_file_with_sudo
+from errors import GikkonError, GitError, SudoError
+from completion import read_index
+from events import FileCopied, FileDeleted, TextSink
+from git_wrapper import Tuning
+from metadata import Entry
+from backuper import _copy, _restore_filtered, _select_files_to_revert, _copy_file, _copy_file_with_sudo, \
+    _delete_file, _delete_file_with_sudo
 
 
+def _git(*args, cwd):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, text=True, capture_output=True).stdout.strip()
+
+
+@patch("backuper.Manifest")
 @patch("backuper._copy")
 @patch("pathlib.Path.mkdir")
-@patch("pathlib.Path.home", return_value=Path("/home/user"))
-@patch("pathlib.Path.joinpath", return_value=Path("/home/user/test/file.txt"))
-@patch("pathlib.Path.resolve", return_value=Path("/test/file.txt"))
 class TestAdd(unittest.TestCase):
 
     def setUp(self) -> None:
-        self.backuper = Backuper(Path("/backup"))
+        self.backuper = Backuper(Path("/backup"), roots={"home": "/home/user"})
 
     @patch("builtins.print")
-    @patch("pathlib.Path.parent", new_callable=PropertyMock)
-    @patch("pathlib.Path.is_relative_to", return_value=False)
-    def test_dry_run(self, path_is_relative_to_mock,
-                     path_parent_mock, print_mock, path_resolve_mock, path_joinpath_mock, path_home_mock,
-                     path_mkdir_mock, copy_mock):
+    @patch("pathlib.Path.is_dir", return_value=True)
+    @patch("pathlib.Path.resolve", return_value=Path("/test/file.txt"))
+    def test_dry_run(self, path_resolve_mock, _path_is_dir_mock, print_mock, path_mkdir_mock, copy_mock,
+                     manifest_mock):
         self.backuper.dry_run = True
 
         self.backuper.add(Path("test.txt"))
 
         path_resolve_mock.assert_called_once()
-        path_joinpath_mock.assert_called_once_with(Path("test/file.txt"))
-        path_is_relative_to_mock.assert_called_once_with(path_home_mock.return_value)
-        path_home_mock.assert_called_once()
-        path_parent_mock.assert_called_once()
-        print_mock.assert_called_once_with(
-            f"Dry run: Copying {path_resolve_mock.return_value} to {path_joinpath_mock.return_value}")
+        print_mock.assert_called_once_with("Dry run: Copying /test/file.txt to /backup/test/file.txt")
         path_mkdir_mock.assert_not_called()
         copy_mock.assert_not_called()
+        manifest_mock.for_repo.assert_not_called()
 
     @patch("builtins.print")
     @patch("pathlib.Path.is_dir")
-    @patch("pathlib.Path.is_relative_to", return_value=False)
-    def test_not_dry_run(self, _path_is_relative_to_mock,
-                         path_is_dir, print_mock, path_resolve_mock, path_joinpath_mock, _path_home_mock,
-                         path_mkdir_mock, copy_mock):
+    @patch("pathlib.Path.resolve", return_value=Path("/test/file.txt"))
+    def test_not_dry_run(self, _path_resolve_mock, path_is_dir, print_mock, path_mkdir_mock, copy_mock,
+                         manifest_mock):
         self.backuper.add(Path("test.txt"))
 
         path_mkdir_mock.assert_called_once_with(parents=True, exist_ok=True)
-        copy_mock.assert_called_once_with(path_resolve_mock.return_value, path_joinpath_mock.return_value)
+        copy_mock.assert_called_once_with(Path("/test/file.txt"), Path("/backup/test/file.txt"))
+        manifest_mock.for_repo.return_value.update.assert_called_once_with(
+            "test/file.txt", Path("/test/file.txt"), xattrs=False)
+        manifest_mock.for_repo.return_value.save.assert_called_once()
 
         path_is_dir.assert_not_called()
         print_mock.assert_not_called()
 
-    @patch("pathlib.Path.is_relative_to", return_value=True)
-    @patch("pathlib.Path.relative_to", return_value=Path("test/file.txt"))
-    def test_home(self, mock_relative_to, _path_is_relative_to_mock,
-                  _path_resolve_mock, path_joinpath_mock, path_home_mock,
-                  path_mkdir_mock, copy_mock):
+    @patch("pathlib.Path.resolve", return_value=Path("/home/user/test/file.txt"))
+    def test_home(self, _path_resolve_mock, path_mkdir_mock, copy_mock, _manifest_mock):
         self.backuper.add(Path("test.txt"))
 
-        assert len(path_home_mock.call_args_list) == 2
-        assert len(path_joinpath_mock.call_args_list) == 2
-        assert path_joinpath_mock.call_args_list[0], call("test/file.txt")
-        assert path_joinpath_mock.call_args_list[0], call(HOME, mock_relative_to.return_value)
-
         path_mkdir_mock.assert_called_once()
-        copy_mock.assert_called_once()
+        copy_mock.assert_called_once_with(Path("/home/user/test/file.txt"), Path("/backup/home/test/file.txt"))
+
+
+class TestAbsolutePathsFromInner(unittest.TestCase):
+    def setUp(self) -> None:
+        self.backuper = Backuper(Path("/backup"), roots={"home": "/home/user"})
+
+    def test_home(self):
+        paths = self.backuper._absolute_paths_from_inner(Path("home/.bashrc"))
+        self.assertEqual(paths, Paths(inner=Path("/backup/home/.bashrc"), outer=Path("/home/user/.bashrc")))
+
+    def test_not_home_prefix(self):
+        paths = self.backuper._absolute_paths_from_inner(Path("homebrew/config"))
+        self.assertEqual(paths, Paths(inner=Path("/backup/homebrew/config"), outer=Path("/homebrew/config")))
+
+
+class TestExportMetrics(unittest.TestCase):
+    @patch("backuper.Metrics.write_textfile")
+    @patch("backuper.GitWrapper.last_push_time", return_value=1700000000.0)
+    @patch("backuper.GitWrapper.unpushed_commits", return_value=2)
+    @patch("backuper.Backuper._backup")
+    def test_backup_exports_metrics(self, _backup_mock, _unpushed_commits_mock, _last_push_time_mock,
+                                    write_textfile_mock):
+        backuper = Backuper(Path("/some/repo"), metrics_dir=Path("/metrics"))
+
+        backuper.backup()
+
+        write_textfile_mock.assert_called_once_with(Path("/metrics"))
+        self.assertEqual(backuper.metrics.command, "backup")
+        self.assertEqual(backuper.metrics.values["gikkon_unpushed_commits"], 2)
+        self.assertEqual(backuper.metrics.values["gikkon_last_push_timestamp_seconds"], 1700000000.0)
+
+    @patch("backuper.Metrics.write_textfile")
+    @patch("backuper.Backuper._backup")
+    def test_no_metrics_dir(self, _backup_mock, write_textfile_mock):
+        Backuper(Path("/some/repo")).backup()
+
+        write_textfile_mock.assert_not_called()
 
 
 class TestPrintFiles(unittest.TestCase):
 
-    @patch("backuper.Path.is_file")
-    @patch("backuper.Backuper._absolute_paths_from_inner")
-    @patch("backuper.GitWrapper.files")
+    @patch("backuper.StatCache.for_repo")
+    @patch("backuper.Backuper._all_paths")
     @patch("builtins.print")
-    def test_print_files_no_files(self, print_mock, git_files_mock, absolute_paths_mock, is_file_mock):
-        git_files_mock.return_value = []
+    def test_print_files_no_files(self, print_mock, all_paths_mock, _for_repo_mock):
+        all_paths_mock.return_value = []
         backuper = Backuper(Path("/some/repo"))
 
         backuper.print_files(print_all=False, repo_paths=False)
 
         print_mock.assert_called_once_with("\nNo files under gikkon control")
 
-    @patch("backuper.Path.is_file")
-    @patch("backuper.Backuper._absolute_paths_from_inner")
-    @patch("backuper.GitWrapper.files")
+    @patch("backuper.StatCache.for_repo")
+    @patch("backuper.os.lstat", return_value=MagicMock(st_mode=stat.S_IFREG, st_size=1, st_mtime=0))
+    @patch("backuper.Backuper._all_paths")
     @patch("builtins.print")
-    def test_print_files_some_files(self, print_mock, git_files_mock, absolute_paths_mock, is_file_mock):
-        git_files_mock.return_value = ["file1.txt", "file2.txt"]
-        absolute_paths_mock.side_effect = [
+    def test_print_files_some_files(self, print_mock, all_paths_mock, _stat_mock, _for_repo_mock):
+        all_paths_mock.return_value = [
             Paths(inner=Path("/some/repo/file1.txt"), outer=Path("/file1.txt")),
             Paths(inner=Path("/some/repo/file2.txt"), outer=Path("/file2.txt")),
         ]
-        is_file_mock.return_value = True
         backuper = Backuper(Path("/some/repo"))
 
         backuper.print_files(print_all=False, repo_paths=False)
@@ -103,16 +135,37 @@ class TestPrintFiles(unittest.TestCase):
         ]
         print_mock.assert_has_calls(print_calls, any_order=False)
 
+    @patch("backuper.StatCache.for_repo")
+    @patch("backuper.os.lstat", side_effect=[MagicMock(st_mode=stat.S_IFREG, st_size=1, st_mtime=0), OSError])
+    @patch("backuper.sync_status", return_value=SyncStatus.MODIFIED)
+    @patch("backuper.Backuper._all_paths")
+    @patch("builtins.print")
+    def test_print_files_jsonl(self, print_mock, all_paths_mock, _sync_status_mock, _stat_mock, _for_repo_mock):
+        all_paths_mock.return_value = [
+            Paths(inner=Path("/some/repo/file1.txt"), outer=Path("/file1.txt")),
+            Paths(inner=Path("/some/repo/file2.txt"), outer=Path("/file2.txt")),
+        ]
+        backuper = Backuper(Path("/some/repo"))
+
+        backuper.print_files(print_all=True, repo_paths=True, output_format="jsonl")
+
+        print_mock.assert_has_calls([
+            call('{"system_path": "/file1.txt", "repo_path": "/some/repo/file1.txt", "status": "modified", '
+                 '"size": 1, "mtime": 0, "policy": "hash"}'),
+            call('{"system_path": "/file2.txt", "repo_path": "/some/repo/file2.txt", "status": "missing", '
+                 '"size": null, "mtime": null, "policy": "hash"}'),
+        ])
+
 
 class TestBackup(unittest.TestCase):
-    @patch("backuper.Backuper._revert_files")
+    @patch("backuper.Backuper.revert_files")
     @patch("backuper._select_files_to_revert")
     @patch("backuper.GitWrapper.get_changed_files")
     @patch("backuper.GitWrapper.discard_changes")
     @patch("backuper.UserInput.ask_bool", return_value=True)
     @patch("backuper.GitWrapper.commit_and_push")
     @patch("backuper.GitWrapper.show_changes")
-    @patch("backuper.Backuper._copy_files")
+    @patch("backuper.Backuper.copy_files")
     @patch("backuper.GitWrapper.ensure_push")
     def test_backup_commit(self, ensure_push_mock, copy_files_mock, show_changes_mock, commit_and_push_mock,
                            ask_bool_mock, discard_changes_mock, get_changed_files_mock,
@@ -122,7 +175,7 @@ class TestBackup(unittest.TestCase):
         backuper.backup(ask_rollback=True, delete_not_present=False)
 
         ensure_push_mock.assert_called_once()
-        copy_files_mock.assert_called_once_with(False)
+        copy_files_mock.assert_called_once_with(False, resume=False, deadline=None)
         show_changes_mock.assert_called_once()
         ask_bool_mock.assert_has_calls([unittest.mock.call(unittest.mock.ANY, default=True)])
         commit_and_push_mock.assert_called_once()
@@ -131,29 +184,31 @@ class TestBackup(unittest.TestCase):
         select_files_to_revert_mock.assert_not_called()
         revert_files_mock.assert_not_called()
 
-    @patch("backuper.Backuper._revert_files")
+    @patch("backuper.Backuper.revert_files")
     @patch("backuper._select_files_to_revert")
     @patch("backuper.GitWrapper.get_changed_files")
+    @patch("backuper.GitWrapper.unstage")
     @patch("backuper.GitWrapper.discard_changes")
     @patch("backuper.UserInput.ask_bool", side_effect=[False, True])
     @patch("backuper.GitWrapper.commit_and_push")
     @patch("backuper.GitWrapper.show_changes")
-    @patch("backuper.Backuper._copy_files")
+    @patch("backuper.Backuper.copy_files")
     @patch("backuper.GitWrapper.ensure_push")
     def test_backup_abort_and_rollback(self, ensure_push_mock, copy_files_mock, show_changes_mock,
                                        commit_and_push_mock,
-                                       ask_bool_mock, discard_changes_mock, get_changed_files_mock,
+                                       ask_bool_mock, discard_changes_mock, unstage_mock, get_changed_files_mock,
                                        select_files_to_revert_mock, revert_files_mock):
         backuper = Backuper(Path("/some/repo"))
 
         backuper.backup(ask_rollback=True, delete_not_present=False)
 
         ensure_push_mock.assert_called_once()
-        copy_files_mock.assert_called_once_with(False)
+        copy_files_mock.assert_called_once_with(False, resume=False, deadline=None)
         show_changes_mock.assert_called_once()
         ask_bool_mock.assert_has_calls([unittest.mock.call(unittest.mock.ANY, default=True),
                                         unittest.mock.call(unittest.mock.ANY, default=False)])
         commit_and_push_mock.assert_not_called()
+        unstage_mock.assert_called_once()
         discard_changes_mock.assert_called_once()
         get_changed_files_mock.assert_called_once()
         select_files_to_revert_mock.assert_called_once_with(get_changed_files_mock.return_value)
@@ -163,8 +218,8 @@ class TestBackup(unittest.TestCase):
     @patch("backuper.GitWrapper.show_changes", return_value=False)
     @patch("backuper.GitWrapper.commit_and_push")
     @patch("backuper.GitWrapper.discard_changes")
-    @patch("backuper.Backuper._copy_files")
-    @patch("backuper.Backuper._revert_files")
+    @patch("backuper.Backuper.copy_files")
+    @patch("backuper.Backuper.revert_files")
     @patch("backuper.UserInput.ask_bool")
     def test_backup_no_changes(self, ask_bool_mock, revert_files_mock, copy_files_mock, discard_changes_mock,
                                commit_and_push_mock, show_changes_mock, ensure_push_mock):
@@ -172,7 +227,7 @@ class TestBackup(unittest.TestCase):
         backuper.backup()
 
         ensure_push_mock.assert_called_once()
-        copy_files_mock.assert_called_once_with(False)
+        copy_files_mock.assert_called_once_with(False, resume=False, deadline=None)
         show_changes_mock.assert_called_once()
 
         commit_and_push_mock.assert_not_called()
@@ -184,8 +239,8 @@ class TestBackup(unittest.TestCase):
     @patch("backuper.GitWrapper.show_changes", return_value=True)
     @patch("backuper.GitWrapper.commit_and_push")
     @patch("backuper.GitWrapper.discard_changes")
-    @patch("backuper.Backuper._copy_files")
-    @patch("backuper.Backuper._revert_files")
+    @patch("backuper.Backuper.copy_files")
+    @patch("backuper.Backuper.revert_files")
     @patch("backuper.UserInput.ask_bool", side_effect=[False, False])
     def test_backup_decline_changes(self, ask_bool_mock, revert_files_mock, copy_files_mock, discard_changes_mock,
                                     commit_and_push_mock, show_changes_mock, ensure_push_mock):
@@ -193,7 +248,7 @@ class TestBackup(unittest.TestCase):
         backuper.backup()
 
         ensure_push_mock.assert_called_once()
-        copy_files_mock.assert_called_once_with(False)
+        copy_files_mock.assert_called_once_with(False, resume=False, deadline=None)
         show_changes_mock.assert_called_once()
 
         commit_and_push_mock.assert_not_called()
@@ -204,20 +259,22 @@ class TestBackup(unittest.TestCase):
     @patch("backuper.GitWrapper.ensure_push")
     @patch("backuper.GitWrapper.show_changes", return_value=True)
     @patch("backuper.GitWrapper.commit_and_push")
+    @patch("backuper.GitWrapper.unstage")
     @patch("backuper.GitWrapper.discard_changes")
     @patch("backuper.GitWrapper.get_changed_files", return_value=[("M", "file1.txt"), ("A", "file2.txt")])
-    @patch("backuper.Backuper._copy_files")
-    @patch("backuper.Backuper._revert_files")
+    @patch("backuper.Backuper.copy_files")
+    @patch("backuper.Backuper.revert_files")
     @patch("backuper.UserInput.ask_bool", side_effect=[False, True])
     @patch("backuper._select_files_to_revert", return_value=[("M", "file1.txt"), ("A", "file2.txt")])
     def test_backup_decline_changes_and_rollback(self, select_files_to_revert_mock, ask_bool_mock, revert_files_mock,
                                                  copy_files_mock, get_changed_files_mock, discard_changes_mock,
-                                                 commit_and_push_mock, show_changes_mock, ensure_push_mock):
+                                                 unstage_mock, commit_and_push_mock, show_changes_mock,
+                                                 ensure_push_mock):
         backuper = Backuper(Path("test_repo"))
         backuper.backup()
 
         ensure_push_mock.assert_called_once()
-        copy_files_mock.assert_called_once_with(False)
+        copy_files_mock.assert_called_once_with(False, resume=False, deadline=None)
         show_changes_mock.assert_called_once()
 
         commit_and_push_mock.assert_not_called()
@@ -228,6 +285,377 @@ class TestBackup(unittest.TestCase):
         ask_bool_mock.assert_called()
 
 
+class TestCopyFiles(unittest.TestCase):
+    @patch("backuper.StatCache.for_repo")
+    @patch("backuper.GitWrapper.remove_files")
+    @patch("backuper.UserInput.select", return_value=[1])
+    @patch("pathlib.Path.exists", return_value=False)
+    @patch("backuper.Backuper._all_paths")
+    def test_remove_missing_in_batch(self, all_paths_mock, _exists_mock, select_mock, remove_files_mock,
+                                     _for_repo_mock):
+        all_paths_mock.return_value = [
+            Paths(inner=Path("/some/repo/etc/a"), outer=Path("/etc/a")),
+            Paths(inner=Path("/some/repo/etc/b"), outer=Path("/etc/b")),
+        ]
+        backuper = Backuper(Path("/some/repo"))
+
+        backuper.copy_files(delete_not_present=True)
+
+        select_mock.assert_called_once_with(
+            [Path("/etc/a"), Path("/etc/b")], user_texts.remove_missing_files, default_all=False
+        )
+        remove_files_mock.assert_called_once_with([Path("/some/repo/etc/b")])
+
+    @patch("builtins.print")
+    @patch("backuper.StatCache.for_repo")
+    @patch("backuper.GitWrapper.remove_files")
+    @patch("backuper.UserInput.select", return_value=[0])
+    @patch("pathlib.Path.exists", return_value=False)
+    @patch("backuper.Backuper._all_paths")
+    def test_remove_missing_dry_run(self, all_paths_mock, _exists_mock, _select_mock, remove_files_mock,
+                                    _for_repo_mock, print_mock):
+        all_paths_mock.return_value = [Paths(inner=Path("/some/repo/etc/a"), outer=Path("/etc/a"))]
+        backuper = Backuper(Path("/some/repo"), dry_run=True)
+
+        backuper.copy_files(delete_not_present=True)
+
+        remove_files_mock.assert_not_called()
+        print_mock.assert_called_once_with("Dry run: removing /some/repo/etc/a")
+
+
+    @patch("backuper.Backuper._all_paths")
+    def test_filtered_copy(self, all_paths_mock):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            repo, outer = Path(tmp_dir, "repo"), Path(tmp_dir, "app.ini")
+            inner = repo.joinpath("app.ini")
+            repo.joinpath(".git").mkdir(parents=True)
+            outer.write_text("[General]\nname = a\ngeometry = 1x1\n")
+            inner.write_text("[General]\nname = b\n")
+            all_paths_mock.return_value = [Paths(inner=inner, outer=outer)]
+            backuper = Backuper(repo, metadata=False, filters={"*.ini": {"delete_keys": ["General.geometry"]}})
+
+            backuper.copy_files()
+            self.assertEqual(inner.read_text(), "[General]\nname = a\n")
+
+            backuper.metrics = Metrics("backup")
+            backuper.copy_files()
+            self.assertNotIn("gikkon_files_copied", backuper.metrics.values)
+
+    @patch("builtins.print")
+    @patch("backuper.Backuper._all_paths")
+    def test_large_file_kept_in_store(self, all_paths_mock, _print_mock):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            repo, outer = Path(tmp_dir, "repo"), Path(tmp_dir, "keyring.db")
+            inner = repo.joinpath("keyring.db")
+            repo.joinpath(".git").mkdir(parents=True)
+            outer.write_bytes(b"v1" * 1000)
+            inner.write_bytes(b"")
+            all_paths_mock.return_value = [Paths(inner=inner, outer=outer)]
+            backuper = Backuper(repo, metadata=False, large_file_size=1000)
+
+            backuper.copy_files()
+            pointer = read_pointer(inner)
+            self.assertEqual(b"".join(backuper.store.read(pointer)), outer.read_bytes())
+
+            backuper.metrics = Metrics("backup")
+            backuper.copy_files()
+            self.assertNotIn("gikkon_files_copied", backuper.metrics.values)
+
+            outer.write_bytes(b"v2" * 1000)
+            with patch("backuper.Backuper._absolute_paths_from_inner", return_value=Paths(inner, outer)):
+                backuper.revert_files([("M", Path("keyring.db"))])
+            self.assertEqual(outer.read_bytes(), b"v1" * 1000)
+
+    @patch("builtins.print")
+    def test_tracked_directory(self, _print_mock):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            repo, home = Path(tmp_dir, "repo"), Path(tmp_dir, "home")
+            repo.joinpath(".git").mkdir(parents=True)
+            home.joinpath("app").mkdir(parents=True)
+            home.joinpath("app", "a.conf").write_text("a")
+            backuper = Backuper(repo, roots={"home": str(home)}, metadata=False)
+
+            backuper.add(home.joinpath("app"))
+            self.assertEqual(repo.joinpath(".gikkon-dirs").read_text(), "home/app\n")
+            self.assertEqual(repo.joinpath("home", "app", "a.conf").read_text(), "a")
+
+            home.joinpath("app", "sub").mkdir()
+            home.joinpath("app", "sub", "b.conf").write_text("b")
+            self.assertEqual(backuper.status(quiet=True), STATUS_MODIFIED)
+
+            backuper.copy_files()
+            self.assertEqual(repo.joinpath("home", "app", "sub", "b.conf").read_text(), "b")
+            self.assertEqual(backuper.status(quiet=True), 0)
+
+    @patch("builtins.print")
+    def test_root_added_inside_home(self, _print_mock):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            repo, home = Path(tmp_dir, "repo"), Path(tmp_dir, "home")
+            repo.joinpath(".git").mkdir(parents=True)
+            home.joinpath(".config", "app").mkdir(parents=True)
+            home.joinpath(".config", "app", "a.conf").write_text("a")
+            Backuper(repo, roots={"home": str(home)}, metadata=False).add(home.joinpath(".config", "app"))
+
+            # Files tracked under home keep their paths, also new ones of the tracked directory
+            roots = {"home": str(home), "xdg": str(home.joinpath(".config"))}
+            backuper = Backuper(repo, roots=roots, metadata=False)
+            home.joinpath(".config", "app", "b.conf").write_text("b")
+            self.assertEqual([backuper._key(paths) for paths in backuper._new_paths()], ["home/.config/app/b.conf"])
+            backuper.copy_files()
+            home.joinpath(".config", "other").mkdir()
+            home.joinpath(".config", "other", "d.conf").write_text("d")
+            backuper.add(home.joinpath(".config", "other", "d.conf"))
+
+            self.assertEqual(backuper.status(quiet=True), 0)
+            self.assertEqual(
+                sorted(str(path.relative_to(repo)) for path in repo.rglob("*.conf")),
+                ["home/.config/app/a.conf", "home/.config/app/b.conf", "xdg/other/d.conf"],
+            )
+
+    @patch("builtins.print")
+    def test_tracked_directory_with_fifo(self, _print_mock):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            repo, home = Path(tmp_dir, "repo"), Path(tmp_dir, "home")
+            repo.joinpath(".git").mkdir(parents=True)
+            home.joinpath("app").mkdir(parents=True)
+            home.joinpath("app", "a.conf").write_text("a")
+            os.mkfifo(home.joinpath("app", "pipe"))
+            backuper = Backuper(repo, roots={"home": str(home)}, metadata=False)
+
+            backuper.add(home.joinpath("app"))
+
+            self.assertEqual(sorted(p.name for p in repo.joinpath("home", "app").iterdir()), ["a.conf"])
+            self.assertEqual(backuper.status(quiet=True), 0)
+            with self.assertRaises(GikkonError):
+                backuper.add(home.joinpath("app", "pipe"))
+
+    @patch("builtins.print")
+    @patch("backuper.GitWrapper.blobs_starting_with")
+    @patch("backuper.GitWrapper.files")
+    def test_gc(self, files_mock, blobs_mock, print_mock):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            repo, outer = Path(tmp_dir, "repo"), Path(tmp_dir, "image.png")
+            repo.mkdir()
+            backuper = Backuper(repo)
+            pointers = []
+            for content in (b"current", b"committed", b"unreferenced"):
+                outer.write_bytes(content)
+                pointers.append(backuper.store.put(outer))
+            repo.joinpath("image.png").write_bytes(pointers[0].dump())
+            files_mock.return_value = [Path("image.png")]
+            blobs_mock.return_value = [pointers[1].dump()]
+
+            backuper.gc()
+
+            self.assertEqual(len(list(backuper.store.chunks())), 2)
+            self.assertTrue(print_mock.call_args.args[0].startswith("removed 1 chunk(s), "))
+            blobs_mock.assert_called_once_with(POINTER_HEADER, MAX_POINTER_SIZE)
+
+    @patch("builtins.print")
+    def test_gc_refused_in_partial_clone(self, _print_mock):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            origin, repo, outer = Path(tmp_dir, "origin"), Path(tmp_dir, "repo"), Path(tmp_dir, "image.png")
+            _git("init", "-q", str(origin), cwd=tmp_dir)
+            _git("config", "uploadpack.allowFilter", "true", cwd=origin)
+            outer.write_bytes(b"large")
+            pointer = Backuper(origin).store.put(outer)
+            origin.joinpath("image.png").write_bytes(pointer.dump())
+            _git("add", "-A", cwd=origin)
+            _git("-c", "user.name=test", "-c", "user.email=test@test", "commit", "-q", "-m", "image", cwd=origin)
+            origin.joinpath("image.png").unlink()
+            _git("-c", "user.name=test", "-c", "user.email=test@test", "commit", "-q", "-am", "gone", cwd=origin)
+            _git("clone", "-q", "--filter=blob:none", f"file://{origin}", str(repo), cwd=tmp_dir)
+            backuper = Backuper(repo)
+            backuper.store.put(outer)
+
+            with self.assertRaises(GitError):
+                backuper.gc()
+
+            self.assertEqual(len(list(backuper.store.chunks())), 1)
+
+    def _make_files(self, tmp_dir):
+        repo = Path(tmp_dir, "repo")
+        repo.joinpath(".git").mkdir(parents=True)
+        all_paths = []
+        for i, name in enumerate(["old", "new"]):
+            outer = Path(tmp_dir, name)
+            outer.write_text(name)
+            os.utime(outer, (i, i))
+            all_paths.append(Paths(inner=repo.joinpath(name), outer=outer))
+
+        return repo, all_paths
+
+    @patch("builtins.print")
+    @patch("backuper.GitWrapper.remove_files")
+    @patch("backuper.write_index")
+    @patch("backuper.Backuper._copy_one")
+    @patch("backuper.Backuper._all_paths")
+    def test_index_updated(self, all_paths_mock, _copy_one_mock, write_index_mock, _remove_files_mock, _print_mock):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            repo, all_paths = self._make_files(tmp_dir)
+            all_paths_mock.return_value = all_paths + [Paths(inner=repo.joinpath("gone"), outer=Path(tmp_dir, "gone"))]
+
+            Backuper(repo, update_index=True).copy_files(delete_not_present=True, select_missing=lambda paths: [0])
+
+        self.assertEqual(write_index_mock.call_args.args[0], repo)
+        self.assertEqual(list(write_index_mock.call_args.args[1]), [paths.outer for paths in all_paths])
+
+    @patch("backuper.Backuper._copy_one")
+    @patch("backuper.Backuper._all_paths")
+    def test_resume_skips_processed_files(self, all_paths_mock, copy_one_mock):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            repo, all_paths_mock.return_value = self._make_files(tmp_dir)
+            journal = Journal.for_repo(repo)
+            journal.record("old")
+            journal.flush()
+
+            with patch("builtins.print") as print_mock, patch("events.bus.sinks", [TextSink()]):
+                Backuper(repo).copy_files(resume=True)
+
+            print_mock.assert_called_once_with("Resuming backup, 1 file(s) already processed")
+            self.assertEqual([c.args[0] for c in copy_one_mock.call_args_list], ["new"])
+            self.assertFalse(journal.path.exists())
+
+    @patch("backuper.Backuper._copy_one")
+    @patch("backuper.Backuper._all_paths")
+    def test_deadline(self, all_paths_mock, copy_one_mock):
+        clock = [0]
+        copy_one_mock.side_effect = lambda *args: clock.__setitem__(0, clock[0] + 10)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            repo, all_paths_mock.return_value = self._make_files(tmp_dir)
+
+            with patch("backuper.time.monotonic", side_effect=lambda: clock[0]), patch("builtins.print") as print_mock:
+                with patch("events.bus.sinks", [TextSink()]):
+                    Backuper(repo).copy_files(deadline=5)
+
+            self.assertEqual([c.args[0] for c in copy_one_mock.call_args_list], ["new"])
+            print_mock.assert_called_once_with(
+                "Deadline reached, 1 file(s) left for the next run, continue with 'gikkon backup --resume'"
+            )
+            self.assertEqual(Journal.for_repo(repo).path.read_text(), "new\n")
+
+    @patch("backuper.Backuper._copy_one")
+    @patch("backuper.Backuper._all_paths")
+    def test_policies(self, all_paths_mock, copy_one_mock):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            repo, all_paths = self._make_files(tmp_dir)
+            all_paths[1].outer.write_bytes(b"new\0")
+            all_paths_mock.return_value = all_paths
+            backuper = Backuper(repo, policies={"old": {"priority": 1}, "new": {"skip_binary": True}})
+
+            with patch("builtins.print") as print_mock, patch("events.bus.sinks", [TextSink()]):
+                backuper.copy_files()
+
+            print_mock.assert_called_once_with(f"skipping {all_paths[1].outer}, it is a binary file")
+            self.assertEqual([c.args[0] for c in copy_one_mock.call_args_list], ["old"])
+            self.assertEqual(backuper.metrics.values["gikkon_files_skipped"], 1)
+
+    @patch("backuper.SyncBatch.flush")
+    @patch("backuper.Backuper._copy_one")
+    @patch("backuper.Backuper._all_paths")
+    def test_filesystem_synced_once_at_end(self, all_paths_mock, copy_one_mock, flush_mock):
+        clock = [0]
+        copy_one_mock.side_effect = lambda *args: clock.__setitem__(0, clock[0] + CHECKPOINT_INTERVAL)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            repo, all_paths_mock.return_value = self._make_files(tmp_dir)
+
+            with patch("backuper.time.monotonic", side_effect=lambda: clock[0]):
+                Backuper(repo).copy_files()
+
+        # A checkpoint after each of two files syncs only their copies, the whole filesystem goes once at the end
+        self.assertEqual(
+            flush_mock.call_args_list,
+            [call(whole_filesystem=False), call(whole_filesystem=False), call(whole_filesystem=True)],
+        )
+
+    @patch("backuper.Backuper._copy_one")
+    @patch("backuper.Backuper._all_paths")
+    def test_priority_before_mtime(self, all_paths_mock, copy_one_mock):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            repo, all_paths_mock.return_value = self._make_files(tmp_dir)
+
+            Backuper(repo, policies={"old": {"priority": 1}}).copy_files(deadline=60)
+
+            self.assertEqual([c.args[0] for c in copy_one_mock.call_args_list], ["old", "new"])
+
+    @patch("builtins.print")
+    @patch("backuper.Backuper._copy_one")
+    @patch("backuper.Backuper._all_paths")
+    def test_checked_every_nth_run(self, all_paths_mock, copy_one_mock, _print_mock):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            repo, all_paths_mock.return_value = self._make_files(tmp_dir)
+            backuper = Backuper(repo, policies={"*": {"every": 3}})
+
+            for _ in range(6):
+                backuper.copy_files()
+
+            self.assertEqual(sorted(c.args[0] for c in copy_one_mock.call_args_list), ["new", "new", "old", "old"])
+
+
+class TestStatus(unittest.TestCase):
+    @patch("backuper.StatCache.for_repo")
+    @patch(
+        "backuper.sync_status",
+        side_effect=[SyncStatus.IN_SYNC, SyncStatus.MISSING, SyncStatus.MODIFIED, SyncStatus.UNREADABLE],
+    )
+    @patch("backuper.Backuper._all_paths")
+    @patch("builtins.print")
+    def test_status(self, print_mock, all_paths_mock, _sync_status_mock, for_repo_mock):
+        all_paths_mock.return_value = [
+            Paths(inner=Path("/some/repo/etc/a"), outer=Path("/etc/a")),
+            Paths(inner=Path("/some/repo/etc/b"), outer=Path("/etc/b")),
+            Paths(inner=Path("/some/repo/etc/c"), outer=Path("/etc/c")),
+            Paths(inner=Path("/some/repo/etc/d"), outer=Path("/etc/d")),
+        ]
+
+        code = Backuper(Path("/some/repo")).status()
+
+        self.assertEqual(code, STATUS_MODIFIED | STATUS_MISSING | STATUS_UNREADABLE)
+        print_mock.assert_has_calls([
+            call("in sync   /etc/a"),
+            call("missing   /etc/b"),
+            call("modified  /etc/c"),
+            call("unreadable  /etc/d"),
+        ])
+        for_repo_mock.return_value.save.assert_not_called()
+
+    @patch("backuper.StatCache.for_repo")
+    @patch("backuper.sync_status", return_value=SyncStatus.IN_SYNC)
+    @patch("backuper.Backuper._all_paths")
+    @patch("builtins.print")
+    def test_status_quiet(self, print_mock, all_paths_mock, _sync_status_mock, _for_repo_mock):
+        all_paths_mock.return_value = [Paths(inner=Path("/some/repo/etc/a"), outer=Path("/etc/a"))]
+
+        self.assertEqual(Backuper(Path("/some/repo")).status(quiet=True), 0)
+        print_mock.assert_not_called()
+
+
+class TestDiff(unittest.TestCase):
+    @patch("pathlib.Path.read_bytes", return_value=b"a\nc\n")
+    @patch("backuper.GitWrapper.show_file", return_value=b"a\nb\n")
+    @patch("backuper.GitWrapper.resolve_revision", return_value="1234567890")
+    @patch("backuper.sys.stdout")
+    def test_diff(self, stdout_mock, resolve_revision_mock, show_file_mock, _read_bytes_mock):
+        backuper = Backuper(Path("/some/repo"), roots={"home": "/home/user"})
+
+        backuper.diff(Path("/home/user/.bashrc"), at="yesterday")
+
+        resolve_revision_mock.assert_called_once_with("yesterday")
+        show_file_mock.assert_called_once_with("1234567890", Path("home/.bashrc"))
+        self.assertEqual(
+            list(stdout_mock.writelines.call_args.args[0]),
+            ["--- 1234567:/home/user/.bashrc\n", "+++ /home/user/.bashrc\n", "@@ -1,2 +1,2 @@\n", " a\n", "-b\n",
+             "+c\n"],
+        )
+
+    @patch("builtins.print")
+    @patch("backuper.GitWrapper.resolve_revision", return_value=None)
+    def test_diff_no_revision(self, _resolve_revision_mock, print_mock):
+        Backuper(Path("/some/repo")).diff(Path("/etc/hosts"), at="1990-01-01")
+
+        print_mock.assert_called_once_with("No commits found at 1990-01-01")
+
+
 class TestSelectFilesToRevert(unittest.TestCase):
     changed_files = [
         ("M", Path("file1.txt")),
@@ -259,94 +687,214 @@ class TestSelectFilesToRevert(unittest.TestCase):
 
 
 class TestCopy(unittest.TestCase):
+    def test_copy(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            from_path = Path(tmp_dir, "from.txt")
+            to_path = Path(tmp_dir, "to.txt")
+            from_path.write_text("new content")
+            to_path.write_text("old content")
+
+            _copy(from_path, to_path)
+
+            self.assertEqual(to_path.read_text(), "new content")
+            self.assertEqual(sorted(os.listdir(tmp_dir)), ["from.txt", "to.txt"])
+
     @patch("shutil.copy")
-    def test_copy(self, shutil_copy_mock):
-        from_path = Path("from.txt")
-        to_path = Path("to.txt")
+    def test_copy_failure_keeps_old_file(self, shutil_copy_mock):
+        def write_partially(_src, dst):
+            Path(dst).write_text("new")
+            raise OSError("No space left on device")
+
+        shutil_copy_mock.side_effect = write_partially
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            from_path = Path(tmp_dir, "from.txt")
+            to_path = Path(tmp_dir, "to.txt")
+            from_path.write_text("new content")
+            to_path.write_text("old content")
+
+            with self.assertRaises(OSError):
+                _copy(from_path, to_path)
+
+            self.assertEqual(to_path.read_text(), "old content")
+            self.assertEqual(sorted(os.listdir(tmp_dir)), ["from.txt", "to.txt"])
+
+    def test_copy_with_policy(self):
+        policy = IOPolicy(bucket=MagicMock())
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            from_path = Path(tmp_dir, "from")
+            to_path = Path(tmp_dir, "to")
+            from_path.write_text("content")
+            os.chmod(from_path, 0o600)
+
+            _copy(from_path, to_path, policy)
+
+            self.assertEqual(to_path.read_text(), "content")
+            self.assertEqual(stat.S_IMODE(os.stat(to_path).st_mode), 0o600)
 
-        _copy(from_path, to_path)
+        policy.bucket.consume.assert_called_once_with(len("content"))
 
-        shutil_copy_mock.assert_called_once_with(from_path, to_path)
+    def test_copy_symlink(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            from_path = Path(tmp_dir, "from")
+            to_path = Path(tmp_dir, "to")
+            os.symlink("/etc/hosts", from_path)
+            to_path.write_text("old content")
+
+            _copy(from_path, to_path)
+
+            self.assertEqual(os.readlink(to_path), "/etc/hosts")
+
+
+class TestRestoreFiltered(unittest.TestCase):
+    @patch("builtins.print")
+    def test_deleted_keys_taken_from_system_file(self, _print_mock):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            inner, outer = Path(tmp_dir, "inner.ini"), Path(tmp_dir, "outer.ini")
+            inner.write_text("[General]\nname = b\n")
+            outer.write_text("[General]\nname = a\ntoken = secret\n")
+
+            _restore_filtered(inner, outer, Pipeline("*.ini", {"delete_keys": ["General.token"]}))
+
+            self.assertEqual(outer.read_text(), "[General]\nname = b\ntoken = secret\n")
+
+    @patch("events.bus.sinks", [TextSink()])
+    @patch("builtins.print")
+    def test_keeps_system_file_when_filters_cant_be_undone(self, print_mock):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            inner, outer = Path(tmp_dir, "inner"), Path(tmp_dir, "outer")
+            inner.write_text("token=REDACTED\nname=b\n")
+            outer.write_text("token=SECRET2\nname=a\n")
+
+            restored = _restore_filtered(inner, outer, Pipeline("*", {"regex": [["^token=.*$", "token=REDACTED"]]}))
+
+            self.assertFalse(restored)
+            self.assertEqual(outer.read_text(), "token=SECRET2\nname=a\n")
+        print_mock.assert_called_once_with(f"Warning: filters of {outer} can't be undone, keeping it as it is")
+
+    @patch("events.bus.sinks", [TextSink()])
+    @patch("backuper._copy_file")
+    @patch("builtins.print")
+    def test_restores_filtered_content_of_missing_file(self, print_mock, copy_file_mock):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            inner, outer = Path(tmp_dir, "inner"), Path(tmp_dir, "outer")
+            inner.write_text("token=REDACTED\nname=b\n")
+
+            restored = _restore_filtered(inner, outer, Pipeline("*", {"regex": [["^token=.*$", "token=REDACTED"]]}))
+
+        self.assertTrue(restored)
+        print_mock.assert_called_once_with(
+            f"Warning: filters of {outer} can't be undone, restoring the filtered content"
+        )
+        copy_file_mock.assert_called_once()
 
 
 class TestCopyFile(unittest.TestCase):
-    @patch("backuper.print")
+    @patch("backuper.emit")
     @patch("backuper._copy")
-    @patch("backuper._has_write_access", return_value=True)
-    def test_copy_file_with_write_access(self, has_write_access_mock, copy_mock, print_mock):
+    @patch("backuper._can_replace", return_value=True)
+    def test_copy_file_with_write_access(self, can_replace_mock, copy_mock, emit_mock):
         src = Path("src.txt")
         dst = Path("dst.txt")
 
         _copy_file(src, dst)
 
-        print_mock.assert_called_once_with(f"copying from {src} to {dst}")
-        has_write_access_mock.assert_called_once_with(dst)
-        copy_mock.assert_called_once_with(src, dst)
+        emit_mock.assert_called_once_with(FileCopied(src, dst, rollback=True))
+        can_replace_mock.assert_called_once_with(dst)
+        copy_mock.assert_called_once_with(src, dst, keep_attributes=True)
+
+    @patch("backuper.emit")
+    def test_rollback_keeps_mode_and_owner(self, _emit_mock):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src, dst = Path(tmp_dir, "repo_copy"), Path(tmp_dir, "secret")
+            src.write_text("new")
+            os.chmod(src, 0o644)
+            dst.write_text("old")
+            os.chmod(dst, 0o600)
+            owner = os.stat(dst).st_uid, os.stat(dst).st_gid
+
+            _copy_file(src, dst)
+
+            self.assertEqual(dst.read_text(), "new")
+            self.assertEqual(stat.S_IMODE(os.stat(dst).st_mode), 0o600)
+            self.assertEqual((os.stat(dst).st_uid, os.stat(dst).st_gid), owner)
 
-    @patch("backuper.print")
+    @patch("backuper.emit")
     @patch("backuper._copy_file_with_sudo")
-    @patch("backuper._has_write_access", return_value=False)
-    def test_copy_file_without_write_access(self, has_write_access_mock, copy_file_with_sudo_mock, print_mock):
+    @patch("backuper._can_replace", return_value=False)
+    def test_copy_file_without_write_access(self, can_replace_mock, copy_file_with_sudo_mock, emit_mock):
         src = Path("src.txt")
         dst = Path("dst.txt")
 
         _copy_file(src, dst)
 
-        print_mock.assert_called_once_with(f"copying from {src} to {dst}")
-        has_write_access_mock.assert_called_once_with(dst)
+        emit_mock.assert_called_once_with(FileCopied(src, dst, rollback=True))
+        can_replace_mock.assert_called_once_with(dst)
         copy_file_with_sudo_mock.assert_called_once_with(src, dst)
 
 
+@patch("backuper.temp_path", return_value=Path(".gikkon-dst.txt.tmp"))
 class TestCopyFileWithSudo(unittest.TestCase):
     @patch("backuper.subprocess.check_call")
-    @patch("backuper.print")
-    def test_copy_file_with_sudo_success(self, print_mock, check_call_mock):
+    def test_copy_file_with_sudo_success(self, check_call_mock, temp_path_mock):
         src = "src.txt"
         dst = "dst.txt"
+        tmp = temp_path_mock.return_value
 
         _copy_file_with_sudo(src, dst)
 
-        check_call_mock.assert_called_once_with(["sudo", "cp", src, dst])
-        print_mock.assert_called_once_with(f"copying from {src} to {dst}")
+        check_call_mock.assert_has_calls([call(["sudo", "cp", src, tmp]), call(["sudo", "mv", "-f", tmp, dst])])
 
-    @patch("backuper.sys.exit")
-    @patch("backuper.print")
+    @patch("backuper.subprocess.check_call")
+    def test_copy_file_with_sudo_keeps_attributes(self, check_call_mock, temp_path_mock):
+        tmp = temp_path_mock.return_value
+        with tempfile.NamedTemporaryFile() as dst:
+            _copy_file_with_sudo("src.txt", dst.name)
+
+        check_call_mock.assert_has_calls([
+            call(["sudo", "cp", "src.txt", tmp]),
+            call(["sudo", "cp", "--attributes-only", "--preserve=mode,ownership,xattr", dst.name, tmp]),
+            call(["sudo", "mv", "-f", tmp, dst.name]),
+        ])
+
+    @patch("backuper.subprocess.call")
     @patch("backuper.subprocess.check_call", side_effect=subprocess.CalledProcessError(1, "sudo cp"))
-    def test_copy_file_with_sudo_failure(self, check_call_mock, print_mock, sys_exit_mock):
+    def test_copy_file_with_sudo_failure(self, check_call_mock, call_mock, temp_path_mock):
         src = "src.txt"
         dst = "dst.txt"
+        tmp = temp_path_mock.return_value
 
-        _copy_file_with_sudo(src, dst)
+        with self.assertRaises(SudoError) as raised:
+            _copy_file_with_sudo(src, dst)
 
-        check_call_mock.assert_called_once_with(["sudo", "cp", src, dst])
-        print_mock.assert_has_calls([call(f"copying from {src} to {dst}"),
-                                     call(
-                                         "Error: Failed to copy file with sudo: Command 'sudo cp' returned non-zero exit status 1.")])
-        sys_exit_mock.assert_called_once_with(1)
+        check_call_mock.assert_called_once_with(["sudo", "cp", src, tmp])
+        call_mock.assert_called_once_with(["sudo", "rm", "-f", tmp])
+        self.assertEqual(
+            str(raised.exception), "Failed to copy file with sudo: Command 'sudo cp' returned non-zero exit status 1."
+        )
 
 
 class TestDeleteFile(unittest.TestCase):
-    @patch("backuper.print")
+    @patch("backuper.emit")
     @patch("backuper.os.remove")
     @patch("backuper._has_write_access", return_value=True)
-    def test_delete_file_with_write_access(self, has_write_access_mock, remove_mock, print_mock):
+    def test_delete_file_with_write_access(self, has_write_access_mock, remove_mock, emit_mock):
         file_path = Path("test.txt")
 
         _delete_file(file_path)
 
-        print_mock.assert_called_once_with(f"removing {file_path}")
+        emit_mock.assert_called_once_with(FileDeleted(file_path, rollback=True))
         remove_mock.assert_called_once_with(file_path)
         has_write_access_mock.assert_called_once_with(file_path)
 
-    @patch("backuper.print")
+    @patch("backuper.emit")
     @patch("backuper._delete_file_with_sudo")
     @patch("backuper._has_write_access", return_value=False)
-    def test_delete_file_without_write_access(self, has_write_access_mock, delete_file_with_sudo_mock, print_mock):
+    def test_delete_file_without_write_access(self, has_write_access_mock, delete_file_with_sudo_mock, emit_mock):
         file_path = Path("test.txt")
 
         _delete_file(file_path)
 
-        print_mock.assert_called_once_with(f"removing {file_path}")
+        emit_mock.assert_called_once_with(FileDeleted(file_path, rollback=True))
         delete_file_with_sudo_mock.assert_called_once_with(file_path)
         has_write_access_mock.assert_called_once_with(file_path)
 
@@ -360,18 +908,232 @@ class TestDeleteFileWithSudo(unittest.TestCase):
 
         check_call_mock.assert_called_once_with(["sudo", "rm", file_path])
 
-    @patch("backuper.sys.exit")
-    @patch("backuper.print")
     @patch("backuper.subprocess.check_call", side_effect=subprocess.CalledProcessError(1, "rm"))
-    def test_delete_file_with_sudo_failure(self, check_call_mock, print_mock, sys_exit_mock):
+    def test_delete_file_with_sudo_failure(self, check_call_mock):
         file_path = "test.txt"
 
-        _delete_file_with_sudo(file_path)
+        with self.assertRaises(SudoError) as raised:
+            _delete_file_with_sudo(file_path)
 
         check_call_mock.assert_called_once_with(["sudo", "rm", file_path])
-        print_mock.assert_called_once_with(
-            "Error: Failed to delete file with sudo: Command 'rm' returned non-zero exit status 1.")
-        sys_exit_mock.assert_called_once_with(1)
+        self.assertEqual(
+            str(raised.exception), "Failed to delete file with sudo: Command 'rm' returned non-zero exit status 1."
+        )
+
+
+@patch("builtins.print")
+class TestBackupDirect(unittest.TestCase):
+    def setUp(self):
+        env_patcher = patch.dict(os.environ, {
+            "GIT_AUTHOR_NAME": "test",
+            "GIT_AUTHOR_EMAIL": "test@test",
+            "GIT_COMMITTER_NAME": "test",
+            "GIT_COMMITTER_EMAIL": "test@test",
+        })
+        env_patcher.start()
+        self.addCleanup(env_patcher.stop)
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        root = Path(self.tmp_dir.name)
+        self.remote, self.repo, self.home = root.joinpath("remote.git"), root.joinpath("repo"), root.joinpath("home")
+
+        _git("init", "-q", "--bare", "-b", "main", str(self.remote), cwd=root)
+        _git("clone", "-q", str(self.remote), str(self.repo), cwd=root)
+        _git("checkout", "-q", "-b", "main", cwd=self.repo)
+        for name, content in ((".bashrc", "old\n"), (".vimrc", "same\n"), (".gone", "gone\n")):
+            self.repo.joinpath("home").mkdir(exist_ok=True)
+            self.repo.joinpath("home", name).write_text(content)
+        self.repo.joinpath(".gikkon-dirs").write_text("home/app\n")
+        _git("add", "-A", cwd=self.repo)
+        _git("commit", "-q", "-m", "initial", cwd=self.repo)
+        _git("push", "-q", "origin", "main", cwd=self.repo)
+
+        self.home.joinpath("app").mkdir(parents=True)
+        self.home.joinpath(".bashrc").write_text("new\n")
+        self.home.joinpath(".vimrc").write_text("same\n")
+        self.home.joinpath("app", "a.conf").write_text("a\n")
+        self.home.joinpath("app", "link").symlink_to("a.conf")
+        self.backuper = Backuper(self.repo, roots={"home": str(self.home)}, metadata=False)
+
+    def _show(self, path: str) -> str:
+        return _git("show", f"HEAD:{path}", cwd=self.repo)
+
+    @patch("backuper.UserInput.select", return_value=[0])
+    @patch("backuper.UserInput.raw", return_value="direct")
+    @patch("backuper.UserInput.ask_bool", return_value=True)
+    def test_without_worktree(self, ask_bool_mock, _raw_mock, _select_mock, _print_mock):
+        self.backuper.backup(delete_not_present=True, direct=True, update_worktree=False)
+
+        self.assertEqual(self._show("home/.bashrc"), "new")
+        self.assertEqual(self._show("home/app/a.conf"), "a")
+        self.assertEqual(_git("ls-tree", "HEAD", "home/.gone", cwd=self.repo), "")
+        self.assertEqual(_git("ls-tree", "HEAD", "home/app/link", cwd=self.repo).split()[0], "120000")
+        self.assertEqual(self._show("home/app/link"), "a.conf")
+        self.assertEqual(_git("log", "-1", "--format=%s", cwd=self.repo), "direct")
+        self.assertEqual(_git("rev-parse", "main", cwd=self.remote), _git("rev-parse", "HEAD", cwd=self.repo))
+        # The working tree is left as it was
+        self.assertEqual(self.repo.joinpath("home", ".bashrc").read_text(), "old\n")
+        self.assertFalse(self.repo.joinpath("home", "app").exists())
+
+        ask_bool_mock.reset_mock()
+        self.backuper.backup(direct=True, update_worktree=False)
+        ask_bool_mock.assert_not_called()
+
+    @patch("backuper.UserInput.raw", return_value="direct")
+    @patch("backuper.UserInput.ask_bool", return_value=True)
+    def test_with_worktree(self, _ask_bool_mock, _raw_mock, _print_mock):
+        self.backuper.backup(direct=True)
+
+        self.assertEqual(self.repo.joinpath("home", ".bashrc").read_text(), "new\n")
+        self.assertEqual(self.repo.joinpath("home", "app", "a.conf").read_text(), "a\n")
+        self.assertEqual(_git("status", "--porcelain", cwd=self.repo), "")
+
+    @patch("backuper.UserInput.select", return_value=[0])
+    @patch("backuper.UserInput.raw", return_value="direct")
+    @patch("backuper.UserInput.ask_bool", return_value=True)
+    def test_index_updated(self, _ask_bool_mock, _raw_mock, _select_mock, _print_mock):
+        with patch.dict(os.environ, {"XDG_CACHE_HOME": self.tmp_dir.name}):
+            backuper = Backuper(self.repo, roots={"home": str(self.home)}, metadata=False, update_index=True)
+            backuper.backup(delete_not_present=True, direct=True, update_worktree=False)
+
+            self.assertEqual(
+                read_index(self.repo),
+                [str(self.home.joinpath(name)) for name in (".bashrc", ".vimrc", "app/a.conf", "app/link")],
+            )
+
+    @patch("backuper.UserInput.ask_bool", return_value=False)
+    def test_declined(self, _ask_bool_mock, print_mock):
+        head = _git("rev-parse", "HEAD", cwd=self.repo)
+
+        self.backuper.backup(direct=True)
+
+        print_mock.assert_any_call("M home/.bashrc")
+        print_mock.assert_any_call("A home/app/a.conf")
+        print_mock.assert_called_with("Abort changes")
+        self.assertEqual(_git("rev-parse", "HEAD", cwd=self.repo), head)
+        self.assertEqual(_git("diff", "--cached", "--name-only", cwd=self.repo), "")
+
+    @patch("backuper.UserInput.raw", return_value="direct")
+    @patch("backuper.UserInput.ask_bool", return_value=True)
+    def test_policies(self, _ask_bool_mock, _raw_mock, _print_mock):
+        self.home.joinpath("app", "a.conf").write_text("x" * 100)
+        backuper = Backuper(
+            self.repo, roots={"home": str(self.home)}, metadata=False, policies={"home/app/*": {"max_size": 10}}
+        )
+
+        backuper.backup(direct=True, update_worktree=False)
+
+        self.assertEqual(self._show("home/.bashrc"), "new")
+        self.assertEqual(_git("ls-tree", "HEAD", "home/app/a.conf", cwd=self.repo), "")
+        self.assertEqual(backuper.metrics.values["gikkon_files_skipped"], 1)
+
+    @patch("backuper.UserInput.ask_bool")
+    def test_large_blob_refused(self, ask_bool_mock, print_mock):
+        head = _git("rev-parse", "HEAD", cwd=self.repo)
+        self.home.joinpath(".bashrc").write_text("x" * 100)
+        backuper = Backuper(
+            self.repo, roots={"home": str(self.home)}, metadata=False, max_blob_size=10, large_blobs="refuse"
+        )
+
+        with self.assertRaises(SystemExit):
+            backuper.backup(direct=True)
+
+        print_mock.assert_any_call("    100B  home/.bashrc")
+        ask_bool_mock.assert_not_called()
+        self.assertEqual(_git("rev-parse", "HEAD", cwd=self.repo), head)
+
+
+@patch("builtins.print")
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        env_patcher = patch.dict(os.environ, {
+            "GIT_AUTHOR_NAME": "test",
+            "GIT_AUTHOR_EMAIL": "test@test",
+            "GIT_COMMITTER_NAME": "test",
+            "GIT_COMMITTER_EMAIL": "test@test",
+        })
+        env_patcher.start()
+        self.addCleanup(env_patcher.stop)
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        root = Path(self.tmp_dir.name)
+        self.repo, self.archive = root.joinpath("repo"), root.joinpath("configs.tar.gz")
+        _git("init", "-q", "-b", "main", str(self.repo), cwd=root)
+
+        big = root.joinpath("big")
+        big.write_bytes(b"large" * 100000)
+        self.backuper = Backuper(self.repo, roots={"home": "/home/user"}, store=root.joinpath("store"))
+        self.repo.joinpath("home", "app").mkdir(parents=True)
+        self.repo.joinpath("home", ".bashrc").write_text("alias ll='ls -l'\n")
+        self.repo.joinpath("home", "app", "link").symlink_to("../.bashrc")
+        self.repo.joinpath("home", "big").write_bytes(self.backuper.store.put(big).dump())
+        self.repo.joinpath(MANIFEST_NAME).write_text(
+            dump_metadata({"home/.bashrc": Entry(0o600, "user", "1000"), "home/app/link": Entry(0o777, "user", "1000")})
+        )
+        _git("add", "-A", cwd=self.repo)
+        _git("commit", "-q", "-m", "initial", cwd=self.repo)
+
+    def _members(self) -> dict[str, tarfile.TarInfo]:
+        with tarfile.open(self.archive) as tar:
+            return {member.name: member for member in tar.getmembers()}
+
+    def test_repo_paths(self, _print_mock):
+        self.backuper.export(archive=self.archive)
+
+        members = self._members()
+        self.assertEqual(sorted(members), [MANIFEST_NAME, "home/.bashrc", "home/app/link", "home/big"])
+        self.assertEqual((members["home/.bashrc"].mode, members["home/.bashrc"].gid), (0o600, 1000))
+        self.assertEqual(members["home/app/link"].linkname, "../.bashrc")
+        # The pointer is exported as it is committed
+        self.assertLess(members["home/big"].size, 1000)
+
+    def test_system_paths(self, _print_mock):
+        self.backuper.export(system_paths=True, archive=self.archive, compression="gz")
+
+        members = self._members()
+        self.assertEqual(sorted(members), ["home/user/.bashrc", "home/user/app/link", "home/user/big"])
+        self.assertEqual(members["home/user/big"].size, 500000)
+        with tarfile.open(self.archive) as tar:
+            self.assertEqual(tar.extractfile("home/user/big").read(), b"large" * 100000)
+            self.assertEqual(tar.extractfile("home/user/.bashrc").read(), b"alias ll='ls -l'\n")
+
+    def test_unknown_revision(self, print_mock):
+        with patch("backuper.GitWrapper.resolve_revision", return_value=None), self.assertRaises(GitError) as raised:
+            self.backuper.export(at="v2", archive=self.archive)
+
+        self.assertEqual(str(raised.exception), "No commits found at v2")
+        print_mock.assert_not_called()
+        self.assertFalse(self.archive.exists())
+
+
+class TestTune(unittest.TestCase):
+    @patch("builtins.print")
+    @patch("backuper.GitWrapper.status_duration", side_effect=[0.5, 0.125])
+    @patch("backuper.GitWrapper.tune")
+    def test_tune(self, tune_mock, _status_duration_mock, print_mock):
+        tune_mock.return_value = [
+            Tuning("core.untrackedCache", "true", True),
+            Tuning("core.fsmonitor", "true", False, "not available"),
+        ]
+
+        Backuper(Path("/some/repo")).tune()
+
+        print_mock.assert_has_calls([
+            call("core.untrackedCache = true"),
+            call("Warning: core.fsmonitor = true is not in effect: not available"),
+            call("git status took 0.500s before tuning and 0.125s after"),
+        ])
+
+    @patch("builtins.print")
+    @patch("backuper.GitWrapper.tune")
+    def test_tune_dry_run(self, tune_mock, print_mock):
+        Backuper(Path("/some/repo"), dry_run=True).tune()
+
+        tune_mock.assert_not_called()
+        print_mock.assert_any_call("Dry run: setting index.version = 4")
+
 
 
 if __name__ == '__main__':
@@ -0,0 +1,56 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from completion import add_to_index, index_path, read_index, script, write_index
+
+
+class TestIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.repo = Path(self.tmp_dir.name, "repo")
+        env_patcher = patch.dict(os.environ, {"XDG_CACHE_HOME": self.tmp_dir.name})
+        env_patcher.start()
+        self.addCleanup(env_patcher.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_index_path(self):
+        self.assertEqual(index_path(self.repo).parent, Path(self.tmp_dir.name, "gikkon", "indexes"))
+        self.assertEqual(index_path(self.repo), index_path(self.repo.joinpath("sub", "..")))
+        self.assertNotEqual(index_path(self.repo), index_path(Path(self.tmp_dir.name, "other")))
+
+    def test_write_and_add(self):
+        write_index(self.repo, [Path("/etc/b"), Path("/etc/a"), Path("/etc/bad\nname")])
+        add_to_index(self.repo, Path("/etc/c"))
+        add_to_index(self.repo, Path("/etc/a"))
+
+        self.assertEqual(read_index(self.repo), ["/etc/a", "/etc/b", "/etc/c"])
+
+    def test_no_index(self):
+        self.assertEqual(read_index(self.repo), [])
+
+    def test_repos_have_own_indexes(self):
+        other = Path(self.tmp_dir.name, "other")
+        write_index(self.repo, [Path("/etc/a")])
+        write_index(other, [Path("/srv/b")])
+
+        self.assertEqual(read_index(self.repo), ["/etc/a"])
+        self.assertEqual(read_index(other), ["/srv/b"])
+
+    def test_bash_completes_tracked_paths(self):
+        write_index(self.repo, [Path("/etc/a"), Path("/etc/b"), Path("/home/c")])
+        completion = script("bash", ["add", "diff", "log"], self.repo)
+        test = 'COMP_WORDS=(gikkon -c x diff /etc/); COMP_CWORD=4; _gikkon; printf "%s\\n" "${COMPREPLY[@]}"'
+
+        result = subprocess.run(["bash", "-c", f"{completion}\n{test}"], capture_output=True, text=True, check=True)
+
+        self.assertEqual(result.stdout.splitlines(), ["/etc/a", "/etc/b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
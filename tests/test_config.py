@@ -2,7 +2,8 @@ import unittest
 from pathlib import Path
 from unittest.mock import patch
 
-from config import ConfigManager, VariableRequired, AppConfig, Settings, WrongGitPath
+from config import ConfigManager, VariableRequired, AppConfig, Settings, WrongGitPath, expand_host, format_size, \
+    parse_duration, parse_size
 
 
 class TestConfigManager(unittest.TestCase):
@@ -120,5 +121,33 @@ class TestSettings(unittest.TestCase):
             self.assertEqual(str(context.exception), f"Wrong Git path: {mock_path}")
 
 
+class TestParseSize(unittest.TestCase):
+    def test_parse_size(self):
+        self.assertEqual(parse_size(512), 512)
+        self.assertEqual(parse_size("64K"), 64 * 1024)
+        self.assertEqual(parse_size("1.5G"), 1536 * 1024 ** 2)
+        self.assertEqual(parse_size("10MiB"), 10 * 1024 ** 2)
+
+    def test_format_size(self):
+        self.assertEqual(format_size(512), "512B")
+        self.assertEqual(format_size(2048), "2.0K")
+        self.assertEqual(format_size(1536 * 1024 ** 2), "1.5G")
+        self.assertEqual(format_size(3 * 1024 ** 4), "3.0T")
+
+
+class TestParseDuration(unittest.TestCase):
+    def test_parse_duration(self):
+        self.assertEqual(parse_duration(90), 90)
+        self.assertEqual(parse_duration("30s"), 30)
+        self.assertEqual(parse_duration("10m"), 600)
+        self.assertEqual(parse_duration("1.5h"), 5400)
+
+
+class TestExpandHost(unittest.TestCase):
+    @patch("config.socket.gethostname", return_value="box")
+    def test_expand_host(self, gethostname_mock):
+        self.assertEqual(expand_host(["home", "hosts/{hostname}"]), ["home", "hosts/box"])
+
+
 if __name__ == '__main__':
     unittest.main()
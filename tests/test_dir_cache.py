@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from dir_cache import RACY_WINDOW_NS, TRACKED_DIRS_NAME, DirCache, track_dir, tracked_dirs
+
+
+def _age(path: Path) -> None:
+    """Make the directory look modified long before it is listed, so its listing is trusted"""
+    mtime = os.stat(path).st_mtime_ns - 2 * RACY_WINDOW_NS
+    os.utime(path, ns=(mtime, mtime))
+
+
+class TestDirCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.root = Path(self.tmp_dir.name, "root")
+        for name in ("a", "sub/b", "sub/deep/c", ".git/config"):
+            self.root.joinpath(name).parent.mkdir(parents=True, exist_ok=True)
+            self.root.joinpath(name).write_text("")
+        self.cache = DirCache(Path(self.tmp_dir.name, "dir_cache.json"))
+
+    def test_walk(self):
+        self.root.joinpath("link").symlink_to(self.root.joinpath("sub"))
+
+        files = list(self.cache.walk(self.root, excluded=(".git",)))
+
+        self.assertEqual(files, [self.root.joinpath(name) for name in ("a", "sub/b", "sub/deep/c")])
+
+    def test_special_files_left_out(self):
+        os.mkfifo(self.root.joinpath("pipe"))
+        self.root.joinpath("file_link").symlink_to(self.root.joinpath("a"))
+
+        self.assertEqual(self.cache.listing(self.root), (["a", "file_link"], [".git", "sub"]))
+
+    def test_unchanged_directory_not_read(self):
+        for directory in (self.root, self.root.joinpath("sub"), self.root.joinpath("sub", "deep")):
+            _age(directory)
+        list(self.cache.walk(self.root))
+        self.cache.save()
+        cache = DirCache(self.cache.path)
+        cache.load()
+        self.assertEqual(cache.entries, self.cache.entries)
+
+        # A name can appear only if the listing comes from the cache
+        cache.entries[str(self.root)][3].append("ghost")
+        self.root.joinpath("sub", "deep", "d").write_text("")
+
+        files = list(cache.walk(self.root))
+
+        self.assertIn(self.root.joinpath("ghost"), files)
+        self.assertIn(self.root.joinpath("sub", "deep", "d"), files)
+
+    def test_recently_changed_directory_read_again(self):
+        list(self.cache.walk(self.root))
+        self.root.joinpath("new").write_text("")
+        os.utime(self.root, ns=(self.cache.entries[str(self.root)][0],) * 2)
+
+        self.assertIn(self.root.joinpath("new"), list(self.cache.walk(self.root)))
+
+    def test_removed_directory_forgotten(self):
+        list(self.cache.walk(self.root, excluded=(".git",)))
+        for name in ("sub/deep/c", "sub/b"):
+            self.root.joinpath(name).unlink()
+        self.root.joinpath("sub", "deep").rmdir()
+        self.root.joinpath("sub").rmdir()
+
+        self.assertEqual(list(self.cache.walk(self.root, excluded=(".git",))), [self.root.joinpath("a")])
+        self.assertEqual(list(self.cache.entries), [str(self.root)])
+
+    def test_missing_root(self):
+        self.assertEqual(list(self.cache.walk(self.root.joinpath("missing"))), [])
+
+
+class TestTrackedDirs(unittest.TestCase):
+    def test_track_dir(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            repo = Path(tmp_dir)
+            self.assertEqual(tracked_dirs(repo), [])
+
+            track_dir(repo, Path("home/.config/b"))
+            track_dir(repo, Path("home/.config/a"))
+            track_dir(repo, Path("home/.config/b"))
+
+            self.assertEqual(tracked_dirs(repo), [Path("home/.config/a"), Path("home/.config/b")])
+            self.assertEqual(repo.joinpath(TRACKED_DIRS_NAME).read_text(), "home/.config/a\nhome/.config/b\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+
+from direct import MODE_EXECUTABLE, MODE_FILE, MODE_SYMLINK, BlobCache, blob_id, file_blob_id, git_mode
+
+
+class TestBlobId(unittest.TestCase):
+    def test_same_as_git(self):
+        data = b"127.0.0.1 localhost\n"
+        oid = subprocess.run(["git", "hash-object", "--stdin"], input=data, capture_output=True, check=True).stdout
+
+        self.assertEqual(blob_id(data), oid.decode().strip())
+
+    def test_file_blob_id(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir, "file")
+            path.write_bytes(b"content")
+
+            self.assertEqual(file_blob_id(path, 7), blob_id(b"content"))
+            # The file was changed after it was stat'ed
+            self.assertIsNone(file_blob_id(path, 3))
+
+    def test_git_mode(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path, link = Path(tmp_dir, "file"), Path(tmp_dir, "link")
+            path.write_text("")
+            link.symlink_to(path)
+
+            self.assertEqual(git_mode(os.lstat(path)), MODE_FILE)
+            self.assertEqual(git_mode(os.lstat(link)), MODE_SYMLINK)
+            path.chmod(0o755)
+            self.assertEqual(git_mode(os.lstat(path)), MODE_EXECUTABLE)
+
+
+class TestBlobCache(unittest.TestCase):
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir, "file")
+            path.write_text("a")
+            st = os.stat(path)
+            cache = BlobCache(Path(tmp_dir, "blob_cache.json"))
+
+            cache.update("file", st, "oid", "filters")
+            cache.save()
+            cache = BlobCache(cache.path)
+            cache.load()
+
+            self.assertEqual(cache.get("file", st, "filters"), "oid")
+            self.assertIsNone(cache.get("file", st))
+            path.write_text("ab")
+            self.assertIsNone(cache.get("file", os.stat(path), "filters"))
+
+            cache.discard("file")
+            self.assertEqual(cache.entries, {})
+
+    def test_compare(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir, "file")
+            path.write_text("a")
+            cache = BlobCache(Path(tmp_dir, "blob_cache.json"))
+            cache.update("file", os.stat(path), "oid")
+
+            path.write_text("b")
+            os.utime(path, ns=(0, 0))
+            st = os.stat(path)
+
+            self.assertIsNone(cache.get("file", st))
+            self.assertEqual(cache.get("file", st, compare="size"), "oid")
+            self.assertIsNone(cache.get("file", st, compare="mtime-only"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import stat
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from durable import TMP_PREFIX, SyncBatch, copy_attributes, replace_file, temp_path
+
+
+class TestReplaceFile(unittest.TestCase):
+    def test_temp_path_in_same_directory(self):
+        path = Path("/etc/hosts")
+
+        self.assertEqual(temp_path(path).parent, path.parent)
+        self.assertTrue(temp_path(path).name.startswith(f"{TMP_PREFIX}hosts."))
+        self.assertNotEqual(temp_path(path), temp_path(path))
+
+    def test_replace(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir, "file")
+            path.write_text("old")
+            inode = os.stat(path).st_ino
+
+            replace_file(path, lambda tmp_path: tmp_path.write_text("new"))
+
+            self.assertEqual(path.read_text(), "new")
+            self.assertNotEqual(os.stat(path).st_ino, inode)
+            self.assertEqual(os.listdir(tmp_dir), ["file"])
+
+    def test_failed_write_cleaned_up(self):
+        def write(tmp_path: Path) -> None:
+            tmp_path.write_text("partial")
+            raise KeyboardInterrupt
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir, "file")
+            path.write_text("old")
+
+            with self.assertRaises(KeyboardInterrupt):
+                replace_file(path, write)
+
+            self.assertEqual(path.read_text(), "old")
+            self.assertEqual(os.listdir(tmp_dir), ["file"])
+
+
+class TestCopyAttributes(unittest.TestCase):
+    def test_mode_and_owner(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path, tmp_path = Path(tmp_dir, "secret"), Path(tmp_dir, "tmp")
+            path.write_text("old")
+            os.chmod(path, 0o600)
+            tmp_path.write_text("new")
+            os.chmod(tmp_path, 0o644)
+
+            copy_attributes(path, tmp_path)
+
+            self.assertEqual(stat.S_IMODE(os.stat(tmp_path).st_mode), 0o600)
+            self.assertEqual(os.stat(tmp_path).st_uid, os.stat(path).st_uid)
+            self.assertEqual(tmp_path.read_text(), "new")
+
+    def test_missing_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_path = Path(tmp_dir, "tmp")
+            tmp_path.write_text("new")
+            os.chmod(tmp_path, 0o640)
+
+            copy_attributes(Path(tmp_dir, "missing"), tmp_path)
+
+            self.assertEqual(stat.S_IMODE(os.stat(tmp_path).st_mode), 0o640)
+
+
+class TestSyncBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.paths = []
+        for directory in ("a", "b"):
+            Path(self.tmp_dir.name, directory).mkdir()
+            for name in ("1", "2"):
+                self.paths.append(Path(self.tmp_dir.name, directory, name))
+                self.paths[-1].write_text(name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @patch("durable._syncfs", return_value=0)
+    def test_syncfs_once_per_filesystem(self, syncfs_mock):
+        batch = SyncBatch()
+        for path in self.paths:
+            batch.add(path)
+
+        batch.flush(whole_filesystem=True)
+        batch.flush(whole_filesystem=True)
+
+        syncfs_mock.assert_called_once()
+        self.assertEqual(batch.directories, {})
+
+    @patch("durable.os.fsync")
+    @patch("durable._syncfs", return_value=0)
+    def test_checkpoint_syncs_only_added_files(self, syncfs_mock, fsync_mock):
+        batch = SyncBatch()
+        for path in self.paths:
+            batch.add(path)
+
+        batch.flush()
+
+        syncfs_mock.assert_not_called()
+        self.assertEqual(fsync_mock.call_count, len(self.paths) + 2)
+
+    @patch("durable.os.fsync")
+    @patch("durable._syncfs", None)
+    def test_fsync_without_syncfs(self, fsync_mock):
+        batch = SyncBatch()
+        for path in self.paths:
+            batch.add(path)
+
+        batch.flush()
+
+        # Every file and each of two directories once
+        self.assertEqual(fsync_mock.call_count, len(self.paths) + 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import io
+import json
+import os
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from errors import ConfigError
+import events
+from events import (
+    EventBus,
+    FileCompared,
+    FileCopied,
+    FileDeleted,
+    FileSkipped,
+    GitCommandRun,
+    JsonLinesSink,
+    ProgressSink,
+    ScanFinished,
+    ScanStarted,
+    TextSink,
+    configure,
+    event_name,
+)
+
+
+class TestTextSink(unittest.TestCase):
+    def test_lines(self):
+        self.assertEqual(TextSink.line(FileCopied(Path("/a"), Path("/b"), rollback=True)), "copying from /a to /b")
+        self.assertEqual(TextSink.line(FileDeleted(Path("/a"), rollback=True)), "removing /a")
+        self.assertEqual(
+            TextSink.line(FileSkipped(Path("/a"), "it is a binary file")), "skipping /a, it is a binary file"
+        )
+
+    def test_silent_events(self):
+        self.assertIsNone(TextSink.line(FileCopied(Path("/a"), Path("/b"), 10)))
+        self.assertIsNone(TextSink.line(FileCompared(Path("/a"), "in sync")))
+        self.assertIsNone(TextSink.line(GitCommandRun(["git", "status"], 0, 0.1)))
+
+
+class TestProgressSink(unittest.TestCase):
+    @patch("events.print")
+    def test_progress(self, print_mock):
+        stream = io.StringIO()
+        sink = ProgressSink(stream)
+
+        sink(ScanStarted("backup", 2))
+        sink(FileCompared(Path("/a"), "in sync"))
+        sink.drawn_at = 0
+        sink(FileCopied(Path("/b"), Path("/repo/b"), 2048))
+        sink(FileSkipped(Path("/c"), "it is a binary file"))
+        sink(ScanFinished("backup", 2))
+
+        self.assertIn("backup: 1/2 files, 1 copied (2.0K)", stream.getvalue())
+        self.assertTrue(stream.getvalue().endswith("\r\033[K"))
+        self.assertFalse(sink.visible)
+        print_mock.assert_called_once_with("skipping /c, it is a binary file")
+
+    def test_no_bar_outside_of_scans(self):
+        stream = io.StringIO()
+        sink = ProgressSink(stream)
+
+        sink(GitCommandRun(["git", "push"], 0, 1.0))
+        sink.close()
+
+        self.assertEqual(stream.getvalue(), "")
+
+
+class TestJsonLinesSink(unittest.TestCase):
+    def test_json_lines(self):
+        read_fd, write_fd = os.pipe()
+        sink = JsonLinesSink(write_fd)
+
+        sink(FileCopied(Path("/a"), Path("/repo/a"), 3))
+        sink(GitCommandRun(["git", "add", "a"], 0, 0.5))
+        sink.close()
+        os.close(write_fd)
+
+        with open(read_fd) as f:
+            records = [json.loads(line) for line in f]
+
+        self.assertEqual([record.pop("event") for record in records], ["file_copied", "git_command_run"])
+        self.assertIsInstance(records[0].pop("time"), float)
+        self.assertEqual(records[0], {"source": "/a", "destination": "/repo/a", "size": 3, "rollback": False})
+        self.assertEqual(records[1]["args"], ["git", "add", "a"])
+
+
+class TestEventBus(unittest.TestCase):
+    def test_emit_to_all_sinks(self):
+        received = []
+        bus = EventBus([received.append, received.append])
+
+        bus.emit(ScanStarted("status"))
+
+        self.assertEqual(received, [ScanStarted("status", None)] * 2)
+        self.assertEqual(event_name(received[0]), "scan_started")
+
+    @patch("events.atexit.register")
+    @patch("events.bus", EventBus())
+    def test_configure(self, _register_mock):
+        with patch("events.sys.stderr.isatty", return_value=False):
+            configure("auto")
+        self.assertEqual([type(sink) for sink in events.bus.sinks], [TextSink])
+
+        configure("quiet")
+        self.assertEqual(events.bus.sinks, [])
+
+        with patch("events.JsonLinesSink") as json_sink_mock:
+            configure("progress", 3)
+        json_sink_mock.assert_called_once_with(3)
+        self.assertIsInstance(events.bus.sinks[0], ProgressSink)
+
+    def test_configure_unknown_mode(self):
+        with self.assertRaises(ConfigError) as raised:
+            configure("loud")
+
+        self.assertEqual(str(raised.exception), "Output mode should be one of auto, text, progress, quiet")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from errors import FilterError
+from filters import FilterSet, Pipeline
+
+INI = b"""[General]
+name = gikkon
+geometry = 800x600
+
+[Session]
+id = 42
+"""
+
+
+class TestPipeline(unittest.TestCase):
+    def test_delete_keys_ini(self):
+        pipeline = Pipeline("*.ini", {"delete_keys": ["General.geometry", "Session.id"]})
+        self.assertEqual(pipeline.apply(INI), b"[General]\nname = gikkon\n\n[Session]\n")
+
+    def test_delete_keys_json(self):
+        pipeline = Pipeline("*.json", {"delete_keys": ["window.size", "token"]})
+        data = b'{\n  "token": "secret",\n  "window": {"size": 3, "x": 1}\n}\n'
+        self.assertEqual(pipeline.apply(data), b'{\n  "window": {\n    "x": 1\n  }\n}\n')
+
+    def test_regex(self):
+        pipeline = Pipeline("*", {"regex": [["^id = .*$", "id = 0"]]})
+        self.assertEqual(pipeline.apply(INI), INI.replace(b"id = 42", b"id = 0"))
+
+    def test_command(self):
+        pipeline = Pipeline("*", {"command": "tr a-z A-Z"})
+        self.assertEqual(pipeline.apply(b"abc\n"), b"ABC\n")
+
+    def test_command_failure(self):
+        with self.assertRaises(FilterError):
+            Pipeline("*", {"command": "false"}).apply(b"abc\n")
+
+    def test_delete_keys_invalid_json(self):
+        with self.assertRaises(FilterError) as raised:
+            Pipeline("*.json", {"delete_keys": ["token"]}).apply(b'{"token": ')
+
+        self.assertTrue(str(raised.exception).startswith("Filter delete_keys for *.json failed"))
+
+    def test_steps_keep_config_order(self):
+        pipeline = Pipeline("*", {"command": "tr a-z A-Z", "regex": [["X", "y"]]})
+        self.assertEqual(pipeline.apply(b"x\n"), b"y\n")
+
+    def test_invert_restores_deleted_keys(self):
+        pipeline = Pipeline("*.ini", {"delete_keys": ["General.geometry", "Session.id"]})
+        repo_data = b"[General]\nname = changed\n\n[Session]\n"
+
+        data, exact = pipeline.invert(repo_data, INI)
+
+        self.assertTrue(exact)
+        self.assertEqual(data, b"[General]\nname = changed\ngeometry = 800x600\n\n[Session]\nid = 42\n")
+
+    def test_invert_json(self):
+        pipeline = Pipeline("*.json", {"delete_keys": ["token"]})
+
+        data, exact = pipeline.invert(b'{"name": "b"}', b'{"name": "a", "token": "secret"}')
+
+        self.assertTrue(exact)
+        self.assertEqual(data, b'{"name": "b", "token": "secret"}')
+
+    @patch("filters.emit")
+    def test_invert_invalid_json(self, emit_mock):
+        pipeline = Pipeline("*.json", {"delete_keys": ["token"]})
+
+        self.assertEqual(pipeline.invert(b'{"name": "b"}', b'{"name": '), (b'{"name": "b"}', False))
+        self.assertTrue(emit_mock.call_args.args[0].message.startswith("Deleted keys of *.json are not restored"))
+
+    def test_invert_keeps_equivalent_system_file(self):
+        pipeline = Pipeline("*", {"regex": [["^id = .*$", "id = 0"]]})
+        self.assertEqual(pipeline.invert(pipeline.apply(INI), INI), (INI, True))
+
+    def test_invert_regex_is_not_exact(self):
+        pipeline = Pipeline("*", {"regex": [["^id = .*$", "id = 0"]]})
+        self.assertEqual(pipeline.invert(b"id = 0\nname = b\n", INI), (b"id = 0\nname = b\n", False))
+
+
+class TestFilterSet(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_first_match_wins(self):
+        filters = FilterSet({"home/*.ini": {"command": "cat"}, "home/*": {"command": "sort"}})
+
+        self.assertEqual(filters.pipeline("home/app.ini").pattern, "home/*.ini")
+        self.assertEqual(filters.pipeline("home/app.conf").pattern, "home/*")
+        self.assertIsNone(filters.transform("etc/app.conf"))
+
+    def test_output_is_memoized(self):
+        filters = FilterSet({"*": {"command": "sort"}}, self.cache_dir)
+        transform = filters.transform("home/file")
+
+        with patch("filters.Pipeline.apply", return_value=b"a\nb\n") as apply_mock:
+            self.assertEqual(transform.apply(b"b\na\n"), b"a\nb\n")
+            self.assertEqual(transform.apply(b"b\na\n"), b"a\nb\n")
+            apply_mock.assert_called_once_with(b"b\na\n")
+
+    def test_without_memoize_nothing_is_written(self):
+        filters = FilterSet({"*": {"command": "sort"}}, self.cache_dir)
+        filters.transform("home/file").apply(b"b\na\n")
+
+        with patch("filters.Pipeline.apply") as apply_mock:
+            self.assertEqual(filters.transform("home/file", memoize=False).apply(b"b\na\n"), b"a\nb\n")
+            self.assertEqual(filters.transform("home/file", memoize=False).apply(b"d\nc\n"), apply_mock.return_value)
+            apply_mock.assert_called_once_with(b"d\nc\n")
+
+        outputs = [path.read_bytes() for path in self.cache_dir.rglob("*") if path.is_file()]
+        self.assertEqual(outputs, [b"a\nb\n"])
+
+    def test_stale_outputs_are_removed(self):
+        transform = FilterSet({"*": {"command": "sort"}}, self.cache_dir).transform("home/file")
+
+        transform.apply(b"b\na\n")
+        transform.apply(b"d\nc\n")
+
+        outputs = [path.read_bytes() for path in self.cache_dir.rglob("*") if path.is_file()]
+        self.assertEqual(outputs, [b"c\nd\n"])
+
+    def test_fingerprint_depends_on_config(self):
+        first = FilterSet({"*": {"command": "sort"}}).transform("file")
+        second = FilterSet({"*": {"command": "sort -r"}}).transform("file")
+        self.assertNotEqual(first.fingerprint, second.fingerprint)
@@ -1,9 +1,14 @@
+import os
+import subprocess
+import tempfile
+import time
 import unittest
 from pathlib import Path
 from unittest.mock import patch, MagicMock, call
 
 import user_texts
-from git_wrapper import GitWrapper, DEFAULT_COMMIT_MESSAGE
+from errors import GitError
+from git_wrapper import GitWrapper, DEFAULT_COMMIT_MESSAGE, TUNING, DiffStat, RemoteResult, Tuning
 
 
 class TestGitWrapper(unittest.TestCase):
@@ -103,7 +108,7 @@ class TestGitWrapper(unittest.TestCase):
         run_mock.assert_any_call(['git', 'rev-parse', 'main'], cwd=self.git_wrapper.path, check=True,
                                  text=True, stdout=-1)
         run_mock.assert_any_call(["git", "ls-remote", "origin", "main"], cwd=self.git_wrapper.path, check=True,
-                                 text=True, stdout=-1)
+                                 text=True, stdout=-1, timeout=None)
 
     @patch("git_wrapper.subprocess.run")
     @patch("git_wrapper.UserInput.ask_bool", return_value=False)
@@ -119,7 +124,7 @@ class TestGitWrapper(unittest.TestCase):
         run_mock.assert_any_call(['git', 'rev-parse', 'main'], cwd=self.git_wrapper.path, check=True,
                                  text=True, stdout=-1)
         run_mock.assert_any_call(["git", "ls-remote", "origin", "main"], cwd=self.git_wrapper.path, check=True,
-                                 text=True, stdout=-1)
+                                 text=True, stdout=-1, timeout=None)
 
     @patch("git_wrapper.UserInput.raw", return_value="Test commit message")
     @patch("git_wrapper.GitWrapper.push")
@@ -127,12 +132,13 @@ class TestGitWrapper(unittest.TestCase):
         self.git_wrapper.commit_and_push()
 
         raw_mock.assert_called_once_with(user_texts.commit_message, default=DEFAULT_COMMIT_MESSAGE)
-        push_mock.assert_called_once_with("Test commit message", "origin", "main")
+        push_mock.assert_called_once_with("Test commit message", None, None)
 
+    @patch("git_wrapper.GitWrapper.write_commit_graph")
     @patch("git_wrapper.GitWrapper._stage_all_changes")
     @patch("git_wrapper.GitWrapper._create_commit")
     @patch("git_wrapper.GitWrapper._push_to_remote")
-    def test_push(self, push_to_remote_mock, create_commit_mock, stage_all_changes_mock):
+    def test_push(self, push_to_remote_mock, create_commit_mock, stage_all_changes_mock, write_commit_graph_mock):
         test_message = "Test commit message"
         test_remote_name = "origin"
         test_branch_name = "main"
@@ -142,6 +148,71 @@ class TestGitWrapper(unittest.TestCase):
         stage_all_changes_mock.assert_called_once()
         create_commit_mock.assert_called_once_with(test_message)
         push_to_remote_mock.assert_called_once_with(test_remote_name, test_branch_name)
+        write_commit_graph_mock.assert_called_once()
+
+    @patch("builtins.print")
+    @patch("git_wrapper.UserInput.ask_bool", return_value=False)
+    @patch("git_wrapper.GitWrapper.staged_blob_sizes", return_value={"home/big.iso": 3 * 1024**3, "home/.vimrc": 10})
+    @patch("git_wrapper.GitWrapper._stage_all_changes")
+    @patch("git_wrapper.GitWrapper._create_commit")
+    @patch("git_wrapper.GitWrapper.unstage")
+    def test_push_large_blob_declined(
+        self, unstage_mock, create_commit_mock, _stage_mock, _sizes_mock, ask_bool_mock, print_mock
+    ):
+        git = GitWrapper(Path("/path/to/repo"), max_blob_size=1024**3)
+
+        with self.assertRaises(SystemExit):
+            git.push("Test commit message")
+
+        print_mock.assert_any_call("    3.0G  home/big.iso")
+        ask_bool_mock.assert_called_once_with(user_texts.commit_large_blobs, default=False)
+        unstage_mock.assert_called_once()
+        create_commit_mock.assert_not_called()
+
+    @patch("builtins.print")
+    @patch("git_wrapper.UserInput.ask_bool")
+    def test_allow_blobs(self, ask_bool_mock, print_mock):
+        git = GitWrapper(Path("/path/to/repo"), max_blob_size=100, large_blobs="refuse")
+
+        self.assertTrue(git.allow_blobs({"a": 100}))
+        self.assertFalse(git.allow_blobs({"a": 101}))
+        ask_bool_mock.assert_not_called()
+        print_mock.assert_called_with(
+            "Error: Refusing to commit files larger than max_blob_size, move them to the sidecar store"
+        )
+
+    @patch("git_wrapper.TimeIndex")
+    @patch("subprocess.run")
+    def test_resolve_revision(self, run_mock, time_index_mock):
+        run_mock.side_effect = [
+            MagicMock(returncode=0, stdout="abcdef\n"),
+            MagicMock(returncode=128, stdout=""),
+            MagicMock(returncode=0, stdout="1700000000\n"),
+        ]
+        time_index_mock.return_value.commit_at.return_value = "123456"
+
+        self.assertEqual(self.git_wrapper.resolve_revision("HEAD~1"), "abcdef")
+        self.assertEqual(self.git_wrapper.resolve_revision("last tuesday"), "123456")
+
+        run_mock.assert_called_with(
+            ["git", "-c", "gikkon.at=last tuesday", "config", "--type=expiry-date", "gikkon.at"],
+            cwd=self.git_wrapper.path,
+            text=True,
+            capture_output=True,
+        )
+        time_index_mock.assert_called_once_with(self.git_wrapper.path, self.git_wrapper._run)
+        time_index_mock.return_value.refresh.assert_called_once()
+        time_index_mock.return_value.commit_at.assert_called_once_with(1700000000)
+
+    def test_resolve_invalid_date(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            subprocess.run(["git", "init", "-q", tmp_dir], check=True)
+            git_wrapper = GitWrapper(Path(tmp_dir))
+
+            with self.assertRaises(GitError) as raised:
+                git_wrapper.resolve_revision("yesterdy")
+
+        self.assertEqual(str(raised.exception), "'yesterdy' is neither a revision nor a date")
 
     @patch("subprocess.run")
     def test_discard_changes(self, run_mock):
@@ -153,25 +224,70 @@ class TestGitWrapper(unittest.TestCase):
             check=True,
         )
 
-    @patch("os.walk")
-    def test_files(self, walk_mock):
-        walk_mock.return_value = [
-            ("/path/to/repo", ["dir1", "dir2", ".git"], ["file1.txt", "file2.txt", ".gitignore"]),
-            ("/path/to/repo/dir1", [], ["file3.txt", "file4.txt"]),
-            ("/path/to/repo/dir2", [], ["file5.txt"]),
-        ]
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            repo = Path(tmp_dir)
+            for name in ("file1.txt", "file2.txt", ".gitignore", ".gikkon-meta", "dir1/file3.txt", "dir1/file4.txt",
+                         "dir2/file5.txt", ".git/config"):
+                repo.joinpath(name).parent.mkdir(parents=True, exist_ok=True)
+                repo.joinpath(name).write_text("")
 
-        expected_files = [
-            Path("file1.txt"),
-            Path("file2.txt"),
-            Path("dir1/file3.txt"),
-            Path("dir1/file4.txt"),
-            Path("dir2/file5.txt"),
-        ]
+            result_files = list(GitWrapper(repo).files())
+
+        self.assertEqual(
+            [Path("file1.txt"), Path("file2.txt"), Path("dir1/file3.txt"), Path("dir1/file4.txt"),
+             Path("dir2/file5.txt")],
+            result_files,
+        )
 
-        result_files = [file for file in self.git_wrapper.files() if file.name != ".gitignore"]
+    def test_files_sparse(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            repo = Path(tmp_dir)
+            for name in ("home/file1.txt", "etc/file2.txt", "var/file3.txt"):
+                repo.joinpath(name).parent.mkdir(parents=True, exist_ok=True)
+                repo.joinpath(name).write_text("")
 
-        self.assertEqual(expected_files, result_files)
+            result_files = list(GitWrapper(repo, sparse_paths=["home", "etc"]).files())
+
+        self.assertEqual([Path("home/file1.txt"), Path("etc/file2.txt")], result_files)
+
+    @patch("subprocess.run")
+    def test_clone(self, run_mock):
+        run_mock.return_value.returncode = 0
+
+        GitWrapper.clone("https://example.com/repo", "/tmp/repo")
+
+        run_mock.assert_called_once_with(["git", "clone", "https://example.com/repo.git", "/tmp/repo"])
+
+    @patch("subprocess.run")
+    def test_clone_partial_sparse(self, run_mock):
+        run_mock.return_value.returncode = 0
+
+        GitWrapper.clone("repo.git", "/tmp/repo", filter_spec="blob:none", depth=1, sparse_paths=["home", "host"])
+
+        run_mock.assert_has_calls([
+            call(["git", "clone", "--filter=blob:none", "--depth", "1", "--sparse", "repo.git", "/tmp/repo"]),
+            call(["git", "sparse-checkout", "set", "--cone", "home", "host"], cwd="/tmp/repo"),
+        ])
+
+    @patch("subprocess.run")
+    def test_clone_failure(self, run_mock):
+        run_mock.return_value.returncode = 128
+
+        with self.assertRaises(GitError) as raised:
+            GitWrapper.clone("repo.git", "/tmp/repo", sparse_paths=["home"])
+
+        run_mock.assert_called_once()
+        self.assertEqual(str(raised.exception), "Failed to clone repo.git")
+
+    @patch("subprocess.run")
+    def test_sparse_checkout_failure(self, run_mock):
+        run_mock.side_effect = [MagicMock(returncode=0), MagicMock(returncode=1)]
+
+        with self.assertRaises(GitError) as raised:
+            GitWrapper.clone("repo.git", "/tmp/repo", sparse_paths=["home", "host"])
+
+        self.assertEqual(str(raised.exception), "Failed to set up sparse checkout of home, host in /tmp/repo")
 
     @patch("subprocess.run")
     def test_get_changed_files(self, run_mock):
@@ -198,6 +314,49 @@ class TestGitWrapper(unittest.TestCase):
         result_changed_files = self.git_wrapper.get_changed_files()
         self.assertEqual(expected_changed_files, result_changed_files)
 
+    @patch("git_wrapper.os.remove")
+    @patch("pathlib.Path.exists", side_effect=[False, True])
+    @patch("subprocess.run")
+    def test_remove_files(self, run_mock, _exists_mock, remove_mock):
+        paths = [Path("/path/to/repo/etc/a"), Path("/path/to/repo/etc/new")]
+
+        self.git_wrapper.remove_files(paths)
+
+        run_mock.assert_called_once_with(
+            ["git", "--literal-pathspecs", "rm", "-q", "--ignore-unmatch", "--pathspec-from-file=-",
+             "--pathspec-file-nul"],
+            input="etc/a\0etc/new",
+            text=True,
+            cwd=self.git_wrapper.path,
+            check=True,
+        )
+        remove_mock.assert_called_once_with(paths[1])
+
+    @patch("subprocess.run")
+    def test_unpushed_commits(self, run_mock):
+        run_mock.side_effect = [MagicMock(returncode=0, stdout="3\n"), MagicMock(returncode=128, stdout="")]
+
+        self.assertEqual(self.git_wrapper.unpushed_commits(), 3)
+        self.assertEqual(self.git_wrapper.unpushed_commits(), 0)
+
+        run_mock.assert_called_with(["git", "rev-list", "--count", "origin/main..main"], cwd=self.git_wrapper.path,
+                                    capture_output=True, text=True)
+        self.assertEqual(self.git_wrapper.subprocess_count, 2)
+
+    @patch("subprocess.run")
+    def test_staged_changes(self, run_mock):
+        run_mock.return_value = MagicMock(stdout=(
+            ":100644 100644 abc def M\thome/.bashrc\n"
+            ":100644 000000 abc 000 D\thome/.gone\n"
+            "1\t1\thome/.bashrc\n"
+            "-\t-\thome/.gone\n"
+        ))
+
+        self.assertEqual(self.git_wrapper.staged_changes(), [
+            DiffStat("M", Path("home/.bashrc"), 1, 1),
+            DiffStat("D", Path("home/.gone"), None, None),
+        ])
+
     @patch("subprocess.run")
     def test_stage_all_changes_and_create_commit(self, run_mock):
         # Выполнение приватных методов
@@ -216,3 +375,223 @@ class TestGitWrapper(unittest.TestCase):
 
 if __name__ == "__main__":
     unittest.main()
+
+
+def _git(*args, cwd):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, text=True, capture_output=True).stdout.strip()
+
+
+class TestRemotes(unittest.TestCase):
+    def setUp(self):
+        env_patcher = patch.dict(os.environ, {
+            "GIT_AUTHOR_NAME": "test",
+            "GIT_AUTHOR_EMAIL": "test@test",
+            "GIT_COMMITTER_NAME": "test",
+            "GIT_COMMITTER_EMAIL": "test@test",
+            # Remote which never answers
+            "GIT_SSH_COMMAND": "sleep 10 #",
+        })
+        env_patcher.start()
+        self.addCleanup(env_patcher.stop)
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.repo = self.root.joinpath("repo")
+        _git("init", "-q", "-b", "main", str(self.repo), cwd=self.root)
+        _git("commit", "-q", "--allow-empty", "-m", "initial", cwd=self.repo)
+        for name in ("primary", "mirror"):
+            _git("init", "-q", "--bare", str(self.root.joinpath(f"{name}.git")), cwd=self.root)
+            _git("remote", "add", name, str(self.root.joinpath(f"{name}.git")), cwd=self.repo)
+        self.head = _git("rev-parse", "HEAD", cwd=self.repo)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_push_to_all_remotes(self):
+        git = GitWrapper(self.repo, remotes={"primary": "main", "mirror": "main"})
+
+        results = git.push_to_remotes()
+
+        self.assertEqual([(r.remote, r.ok) for r in results], [("primary", True), ("mirror", True)])
+        for name in ("primary", "mirror"):
+            self.assertEqual(_git("rev-parse", "main", cwd=self.root.joinpath(f"{name}.git")), self.head)
+
+    def test_failed_and_hanging_remotes(self):
+        remotes = {"primary": "main", str(self.root.joinpath("nothing.git")): "main", "ssh://example.invalid/r": "main"}
+        git = GitWrapper(self.repo, remotes=remotes, push_timeout=0.5)
+
+        start = time.monotonic()
+        results = git.push_to_remotes()
+
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual([r.ok for r in results], [True, False, False])
+        self.assertEqual(results[2].message, "timed out after 0.5s")
+
+    @patch("builtins.print")
+    @patch("git_wrapper.UserInput.ask_bool", return_value=True)
+    def test_ensure_push_only_behind_remotes(self, ask_bool_mock, _print_mock):
+        _git("push", "-q", "primary", "main", cwd=self.repo)
+        git = GitWrapper(self.repo, remotes={"primary": "main", "mirror": "main"})
+
+        with patch.object(git, "_push_to_remote", wraps=git._push_to_remote) as push_mock:
+            git.ensure_push()
+
+        push_mock.assert_called_once_with("mirror", "main")
+        self.assertEqual(_git("rev-parse", "main", cwd=self.root.joinpath("mirror.git")), self.head)
+
+    @patch("builtins.print")
+    @patch("sys.exit")
+    def test_report_exits_if_nothing_pushed(self, exit_mock, print_mock):
+        GitWrapper._report([RemoteResult("primary", "main", False, 0.1, "rejected")])
+
+        print_mock.assert_called_once_with("Error: Failed to push to primary/main: rejected")
+        exit_mock.assert_called_once_with(1)
+
+    def test_blobs_starting_with(self):
+        for content in ("pointer 1\n", "plain\n", "pointer " * 100, "pointer 2\n", "p"):
+            subprocess.run(
+                ["git", "hash-object", "-w", "--stdin"], input=content, text=True, cwd=self.repo, check=True
+            )
+
+        blobs = GitWrapper(self.repo).blobs_starting_with(b"pointer ", 100)
+
+        self.assertEqual(sorted(blobs), [b"pointer 1\n", b"pointer 2\n"])
+
+    def test_staged_blob_sizes(self):
+        git = GitWrapper(self.repo)
+        self.repo.joinpath("hosts").write_text("127.0.0.1 localhost\n")
+        self.repo.joinpath("motd").write_text("hi\n")
+        _git("add", "hosts", "motd", cwd=self.repo)
+        _git("commit", "-q", "-m", "files", cwd=self.repo)
+        self.repo.joinpath("hosts").write_text("127.0.0.1 localhost gikkon\n")
+        self.repo.joinpath("new file").write_text("x" * 1000)
+        _git("rm", "-q", "motd", cwd=self.repo)
+        _git("add", "-A", cwd=self.repo)
+
+        self.assertEqual(git.staged_blob_sizes(), {"hosts": 27, "new file": 1000})
+
+    def test_blob_usage(self):
+        git = GitWrapper(self.repo)
+        for content in ("a" * 100, "b" * 10):
+            self.repo.joinpath("etc").mkdir(exist_ok=True)
+            self.repo.joinpath("etc", "hosts").write_text(content)
+            self.repo.joinpath("motd").write_text("hi\n")
+            _git("add", "-A", cwd=self.repo)
+            _git("commit", "-q", "-m", "change", cwd=self.repo)
+        _git("rm", "-q", "motd", cwd=self.repo)
+        _git("commit", "-q", "-m", "remove", cwd=self.repo)
+
+        usages, unknown = git.blob_usage()
+
+        self.assertEqual([(u.path, u.current, u.versions) for u in usages], [("etc/hosts", 10, 2), ("motd", None, 1)])
+        self.assertGreater(usages[0].history, 0)
+        self.assertEqual(unknown, 0)
+
+    def test_blob_usage_in_partial_clone(self):
+        for content in ("a" * 100, "b" * 10):
+            self.repo.joinpath("hosts").write_text(content)
+            _git("add", "-A", cwd=self.repo)
+            _git("commit", "-q", "-m", "change", cwd=self.repo)
+        _git("config", "uploadpack.allowFilter", "true", cwd=self.repo)
+        clone = self.root.joinpath("clone")
+        _git("clone", "-q", "--filter=blob:none", f"file://{self.repo}", str(clone), cwd=self.root)
+
+        usages, unknown = GitWrapper(clone).blob_usage()
+
+        self.assertEqual([(u.path, u.current, u.versions, u.missing) for u in usages], [("hosts", 10, 1, 0)])
+        self.assertEqual(unknown, 1)
+        # The old version is still not fetched
+        missing = _git("rev-list", "--objects", "--all", "--missing=print", cwd=clone).split()
+        self.assertEqual(len([oid for oid in missing if oid.startswith("?")]), 1)
+
+    def test_stream_blobs(self):
+        git = GitWrapper(self.repo)
+        self.repo.joinpath("etc").mkdir()
+        self.repo.joinpath("etc", "hosts").write_text("127.0.0.1 localhost\n")
+        self.repo.joinpath("motd").write_text("hi\n")
+        _git("add", "-A", cwd=self.repo)
+        _git("commit", "-q", "-m", "files", cwd=self.repo)
+
+        entries = git.tree_entries("HEAD")
+        contents = [stream.read(size) for size, stream in git.stream_blobs(oid for _mode, oid, _path in entries)]
+
+        self.assertEqual([(mode, path) for mode, _oid, path in entries], [("100644", "etc/hosts"), ("100644", "motd")])
+        self.assertEqual(contents, [b"127.0.0.1 localhost\n", b"hi\n"])
+
+        blobs = git.stream_blobs([entries[0][1], "0" * 40])
+        size, stream = next(blobs)
+        stream.read(size)
+        with self.assertRaises(GitError) as raised:
+            next(blobs)
+        self.assertEqual(str(raised.exception), f"Object {'0' * 40} is missing from the repo")
+
+    def test_commit_index(self):
+        git = GitWrapper(self.repo)
+        source = self.root.joinpath("hosts")
+        source.write_text("127.0.0.1 localhost\n")
+
+        oids = git.hash_objects([source])
+        git.update_index([("100644", oids[0], "etc/hosts")])
+        commit = git.commit_index("direct")
+
+        self.assertEqual(git.index_entries(), {"etc/hosts": ("100644", oids[0])})
+        self.assertEqual(_git("rev-parse", "HEAD", cwd=self.repo), commit)
+        self.assertEqual(_git("rev-parse", "HEAD^", cwd=self.repo), self.head)
+        self.assertEqual(_git("show", "HEAD:etc/hosts", cwd=self.repo), "127.0.0.1 localhost")
+        self.assertFalse(self.repo.joinpath("etc", "hosts").exists())
+        self.assertIsNone(git.commit_index("nothing changed"))
+
+        git.checkout_index(["etc/hosts"])
+        self.assertEqual(self.repo.joinpath("etc", "hosts").read_text(), "127.0.0.1 localhost\n")
+        self.assertEqual(_git("status", "--porcelain", cwd=self.repo), "")
+
+        git.update_index([("0", "0" * 40, "etc/hosts")])
+        self.assertEqual(git.index_entries(), {})
+
+
+class TestTune(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.repo = Path(self.tmp_dir.name)
+        _git("init", "-q", str(self.repo), cwd=self.repo)
+        self.repo.joinpath("file").write_text("content")
+        _git("add", "file", cwd=self.repo)
+
+    def tearDown(self):
+        subprocess.run(["git", "fsmonitor--daemon", "stop"], cwd=self.repo, capture_output=True)
+        self.tmp_dir.cleanup()
+
+    def test_tune(self):
+        results = GitWrapper(self.repo).tune()
+
+        self.assertEqual([result.name for result in results], list(TUNING))
+        for result in results:
+            if result.name != "core.fsmonitor":
+                self.assertTrue(result.ok, result)
+        self.assertEqual(_git("config", "index.version", cwd=self.repo), "4")
+        self.assertEqual(_git("ls-files", cwd=self.repo), "file")
+
+    @patch("git_wrapper.GitWrapper._run")
+    def test_fsmonitor_not_supported(self, run_mock):
+        # A localized git says nothing the probe could match in English
+        run_mock.return_value = MagicMock(
+            returncode=128, stdout="git version 2.39.5\ncpu: x86_64\n", stderr="Fehler: nicht unterstützt"
+        )
+        with patch("git_wrapper.GitWrapper._check_tuning", return_value=""):
+            results = GitWrapper(self.repo).tune()
+
+        self.assertEqual(
+            results[-1],
+            Tuning("core.fsmonitor", "true", False, "builtin fsmonitor is not available on this platform"),
+        )
+        fsmonitor_config = call(["git", "config", "--local", "core.fsmonitor", "true"], check=True)
+        self.assertNotIn(fsmonitor_config, run_mock.call_args_list)
+
+    @patch("git_wrapper.GitWrapper._run")
+    def test_fsmonitor_supported(self, run_mock):
+        run_mock.return_value = MagicMock(returncode=0, stdout="git version 2.45.0\nfeature: fsmonitor--daemon\n")
+        with patch("git_wrapper.GitWrapper._check_tuning", return_value=""):
+            results = GitWrapper(self.repo).tune()
+
+        self.assertEqual(results[-1], Tuning("core.fsmonitor", "true", True, ""))
+        run_mock.assert_any_call(["git", "config", "--local", "core.fsmonitor", "true"], check=True)
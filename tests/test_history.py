@@ -0,0 +1,82 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+
+from history import TimeIndex
+
+
+def _commit(repo: Path, timestamp: int) -> str:
+    env = dict(os.environ, GIT_AUTHOR_DATE=f"@{timestamp} +0000", GIT_COMMITTER_DATE=f"@{timestamp} +0000")
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@test", "commit", "-q", "--allow-empty", "-m", "c"],
+        cwd=repo,
+        env=env,
+        check=True,
+    )
+    return subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo, text=True, capture_output=True).stdout.strip()
+
+
+class TestTimeIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.repo = Path(self.tmp_dir.name)
+        subprocess.run(["git", "init", "-q", str(self.repo)], check=True)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _index(self) -> TimeIndex:
+        return TimeIndex(self.repo, lambda command, **kwargs: subprocess.run(command, cwd=self.repo, **kwargs))
+
+    def test_commit_at(self):
+        first = _commit(self.repo, 1000)
+        second = _commit(self.repo, 2000)
+
+        index = self._index()
+        index.refresh()
+
+        self.assertIsNone(index.commit_at(999))
+        self.assertEqual(index.commit_at(1000), first)
+        self.assertEqual(index.commit_at(1999), first)
+        self.assertEqual(index.commit_at(5000), second)
+
+    def test_incremental_refresh(self):
+        _commit(self.repo, 1000)
+        self._index().refresh()
+        third = _commit(self.repo, 3000)
+
+        index = self._index()
+        index.refresh()
+
+        self.assertEqual(len(index.commits), 2)
+        self.assertEqual(index.commit_at(3000), third)
+
+    def test_rewritten_history(self):
+        _commit(self.repo, 1000)
+        self._index().refresh()
+        subprocess.run(["git", "checkout", "-q", "--orphan", "other"], cwd=self.repo, check=True)
+        other = _commit(self.repo, 2000)
+
+        index = self._index()
+        index.refresh()
+
+        self.assertEqual(index.commits, [other])
+
+    def test_clock_skew(self):
+        _commit(self.repo, 2000)
+        skewed = _commit(self.repo, 1000)
+        third = _commit(self.repo, 3000)
+
+        index = self._index()
+        index.refresh()
+
+        self.assertEqual(index.timestamps, [2000, 2000, 3000])
+        self.assertIsNone(index.commit_at(1500))
+        self.assertEqual(index.commit_at(2500), skewed)
+        self.assertEqual(index.commit_at(3000), third)
+
+
+if __name__ == "__main__":
+    unittest.main()
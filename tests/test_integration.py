@@ -0,0 +1,337 @@
+"""
+End to end runs of gikkon commands against a real bare remote, its clone and a fake $HOME.
+Nothing is mocked except answers to prompts. Every scenario has a budget of git processes it may start
+and bytes it may read, so a change which makes a command more expensive fails here.
+"""
+import importlib.util
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import NamedTuple
+from unittest.mock import patch
+
+import events
+
+SRC_PATH = Path(__file__).parent.parent.joinpath("src")
+PROC_IO = Path("/proc/self/io")
+FILES = 40
+FILE_SIZE = 8 * 1024
+CHANGED = 5
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "test",
+    "GIT_AUTHOR_EMAIL": "test@test",
+    "GIT_COMMITTER_NAME": "test",
+    "GIT_COMMITTER_EMAIL": "test@test",
+    "GIT_CONFIG_NOSYSTEM": "1",
+}
+# Logs every git invocation before running the real git
+GIT_SHIM = """#!/bin/sh
+printf '%s\\n' "$*" >> "$GIKKON_GIT_LOG"
+exec {git} "$@"
+"""
+
+
+class Budget(NamedTuple):
+    git_calls: int
+    bytes_read: int
+
+
+# Upper bounds per scenario. Bytes read include reads of git processes gikkon started, they are reaped
+# by this process. Raise a budget only together with the change which makes the command more expensive
+DATA_SIZE = FILES * FILE_SIZE
+BUDGETS = {
+    # Cloning reads the whole pack
+    "init": Budget(git_calls=14, bytes_read=2 * 1024 * 1024),
+    "add": Budget(git_calls=0, bytes_read=FILE_SIZE + 8 * 1024),
+    # Cold stat cache, both copies of every file are read, git diff reads the index and changed blobs
+    "backup": Budget(git_calls=9, bytes_read=6 * DATA_SIZE),
+    # Every system file is read once to get its blob id, nothing goes through the working tree
+    "backup_direct": Budget(git_calls=12, bytes_read=3 * DATA_SIZE),
+    "backup_unchanged": Budget(git_calls=5, bytes_read=DATA_SIZE + 128 * 1024),
+    "status": Budget(git_calls=0, bytes_read=2 * DATA_SIZE + 16 * 1024),
+    # Only system copies of changed files are read, hashes of repo copies are cached
+    "status_cached": Budget(git_calls=0, bytes_read=CHANGED * FILE_SIZE + 8 * 1024),
+    # Object names and sizes only, no blob content is read
+    "du": Budget(git_calls=3, bytes_read=64 * 1024),
+    # Every file is read once from the cat-file pipe, nothing is checked out
+    "export": Budget(git_calls=4, bytes_read=DATA_SIZE + 128 * 1024),
+    "list": Budget(git_calls=0, bytes_read=4 * 1024),
+    "log": Budget(git_calls=2, bytes_read=32 * 1024),
+    "diff": Budget(git_calls=2, bytes_read=48 * 1024),
+}
+
+
+class Run(NamedTuple):
+    code: int
+    output: str
+    git_calls: list[str]
+    bytes_read: int
+
+
+def _git(*args, cwd):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, text=True, capture_output=True).stdout.strip()
+
+
+def _bytes_read() -> int:
+    for line in PROC_IO.read_text().splitlines():
+        name, value = line.split(": ")
+        if name == "rchar":
+            return int(value)
+
+    return 0
+
+
+def _content(i: int, version: str) -> str:
+    line = f"{version} setting_{i} = {'x' * 40}\n"
+    return line * (FILE_SIZE // len(line))
+
+
+def _load_cli():
+    spec = importlib.util.spec_from_file_location("gikkon_cli", SRC_PATH.joinpath("__main__.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@unittest.skipUnless(shutil.which("git") and PROC_IO.exists(), "needs git and /proc/self/io")
+class TestIntegration(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.cli = _load_cli()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        root = Path(self.tmp_dir.name)
+        self.remote, self.path, self.home = root.joinpath("remote.git"), root.joinpath("repo"), root.joinpath("home")
+        self.config, self.git_log = root.joinpath("config.toml"), root.joinpath("git.log")
+
+        bin_path = root.joinpath("bin")
+        bin_path.mkdir()
+        bin_path.joinpath("git").write_text(GIT_SHIM.format(git=shutil.which("git")))
+        bin_path.joinpath("git").chmod(0o755)
+
+        self.home.mkdir()
+        # Neither the completion index nor git config of the user running the tests may be touched
+        env_patcher = patch.dict(
+            os.environ,
+            {
+                **GIT_ENV,
+                "HOME": str(self.home),
+                "XDG_CACHE_HOME": str(root.joinpath("cache")),
+                "GIT_CONFIG_GLOBAL": str(root.joinpath("gitconfig")),
+                "PATH": f"{bin_path}:{os.environ['PATH']}",
+                "GIKKON_GIT_LOG": "",
+            },
+        )
+        env_patcher.start()
+        self.addCleanup(env_patcher.stop)
+        sinks_patcher = patch.object(events.bus, "sinks", [])
+        sinks_patcher.start()
+        self.addCleanup(sinks_patcher.stop)
+
+        _git("init", "-q", "--bare", "-b", "main", str(self.remote), cwd=root)
+        seed = root.joinpath("seed")
+        _git("init", "-q", "-b", "main", str(seed), cwd=root)
+        for i in range(FILES):
+            seed.joinpath("home", ".config", "app").mkdir(parents=True, exist_ok=True)
+            seed.joinpath("home", ".config", "app", f"{i}.conf").write_text(_content(i, "old"))
+        _git("add", "-A", cwd=seed)
+        _git("commit", "-q", "-m", "initial", cwd=seed)
+        _git("push", "-q", str(self.remote), "main", cwd=seed)
+
+        self.home.joinpath(".config").mkdir()
+        shutil.copytree(seed.joinpath("home", ".config", "app"), self.home.joinpath(".config", "app"))
+        self.config.write_text(f'[General]\npath = "{self.path}"\n\n[Paths]\nhome = "{self.home}"\n')
+
+    def _clone(self):
+        _git("clone", "-q", str(self.remote), str(self.path), cwd=self.tmp_dir.name)
+        # Files of a fresh clone are as new as its index, git treats them as racily clean and rehashes
+        # them on every index refresh. Age them like in a clone made long ago, so budgets don't depend on timing
+        aged = self.path.stat().st_mtime - 60
+        for path in self.path.joinpath("home").rglob("*"):
+            os.utime(path, (aged, aged))
+        _git("update-index", "-q", "--really-refresh", cwd=self.path)
+
+    def _change_files(self):
+        for i in range(CHANGED):
+            self.home.joinpath(".config", "app", f"{i}.conf").write_text(_content(i, "new"))
+
+    def _gikkon(self, *args: str, answers: str = "") -> Run:
+        self.git_log.write_text("")
+        os.environ["GIKKON_GIT_LOG"] = str(self.git_log)
+        # main switches stdout to block buffering, so it has to be a real text stream
+        stdout = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+        code = 0
+        with patch.object(sys, "argv", ["gikkon", "-c", str(self.config), "--output", "text", *args]), patch.object(
+            sys, "stdin", io.StringIO(answers)
+        ), redirect_stdout(stdout):
+            start = _bytes_read()
+            try:
+                self.cli.main()
+            except SystemExit as ex:
+                code = ex.code or 0
+            bytes_read = _bytes_read() - start
+
+        stdout.flush()
+        output = stdout.buffer.getvalue().decode()
+        return Run(code, output, self.git_log.read_text().splitlines(), bytes_read)
+
+    def assertWithinBudget(self, scenario: str, run: Run):
+        budget = BUDGETS[scenario]
+        self.assertLessEqual(
+            len(run.git_calls),
+            budget.git_calls,
+            f"{scenario} started more git processes than budgeted:\n" + "\n".join(run.git_calls),
+        )
+        self.assertLessEqual(run.bytes_read, budget.bytes_read, f"{scenario} read more bytes than budgeted")
+
+    def test_init(self):
+        run = self._gikkon("init", answers=f"{self.remote}\n{self.path}\n")
+
+        self.assertEqual(run.code, 0)
+        self.assertWithinBudget("init", run)
+        self.assertTrue(self.path.joinpath("home", ".config", "app", "0.conf").exists())
+        self.assertEqual(_git("config", "core.untrackedCache", cwd=self.path), "true")
+
+    def test_add(self):
+        self._clone()
+        new_file = self.home.joinpath(".vimrc")
+        new_file.write_text(_content(0, "vim"))
+
+        run = self._gikkon("add", str(new_file))
+
+        self.assertEqual(run.code, 0)
+        self.assertWithinBudget("add", run)
+        self.assertEqual(self.path.joinpath("home", ".vimrc").read_text(), new_file.read_text())
+
+    def test_backup(self):
+        self._clone()
+        self._change_files()
+
+        run = self._gikkon("backup", answers="y\n\n")
+
+        self.assertEqual(run.code, 0)
+        self.assertWithinBudget("backup", run)
+        self.assertEqual(_git("rev-list", "--count", "main", cwd=self.remote), "2")
+        self.assertEqual(_git("show", "main:home/.config/app/0.conf", cwd=self.remote) + "\n", _content(0, "new"))
+
+    def test_backup_direct(self):
+        self._clone()
+        self._change_files()
+
+        run = self._gikkon("backup", "--direct", answers="y\n\n")
+
+        self.assertEqual(run.code, 0)
+        self.assertWithinBudget("backup_direct", run)
+        self.assertEqual(_git("show", "main:home/.config/app/0.conf", cwd=self.remote) + "\n", _content(0, "new"))
+        self.assertEqual(_git("status", "--porcelain", cwd=self.path), "")
+
+    def test_backup_unchanged(self):
+        self._clone()
+        self._change_files()
+        self._gikkon("backup", answers="y\n\n")
+
+        run = self._gikkon("backup", answers="n\nn\n")
+
+        self.assertEqual(run.code, 0)
+        self.assertWithinBudget("backup_unchanged", run)
+        self.assertEqual(_git("rev-list", "--count", "main", cwd=self.remote), "2")
+        self.assertNotIn("commit", " ".join(run.git_calls).split())
+
+    def test_backup_refuses_large_blob(self):
+        self._clone()
+        self._change_files()
+        self.config.write_text(
+            self.config.read_text() + '\n[LargeFiles]\nmax_blob_size = "4K"\nlarge_blobs = "refuse"\n'
+        )
+
+        run = self._gikkon("backup", answers="y\n\n")
+
+        self.assertEqual(run.code, 1)
+        self.assertIn("home/.config/app/0.conf", run.output)
+        self.assertEqual(_git("rev-list", "--count", "HEAD", cwd=self.path), "1")
+        self.assertEqual(_git("diff", "--cached", "--name-only", cwd=self.path), "")
+
+    def test_status(self):
+        self._clone()
+        self._change_files()
+
+        run = self._gikkon("status")
+
+        self.assertEqual(run.code, 1)
+        self.assertWithinBudget("status", run)
+        self.assertEqual(len([line for line in run.output.splitlines() if line.startswith("modified")]), CHANGED)
+
+    def test_status_cached(self):
+        self._clone()
+        # status never writes the stat cache, a backup fills it
+        self._gikkon("backup", answers="n\nn\n")
+        self._change_files()
+
+        run = self._gikkon("status", "--quiet")
+
+        self.assertEqual(run.code, 1)
+        self.assertWithinBudget("status_cached", run)
+
+    def test_list(self):
+        self._clone()
+
+        run = self._gikkon("list")
+
+        self.assertEqual(run.code, 0)
+        self.assertWithinBudget("list", run)
+        self.assertIn(str(self.home.joinpath(".config", "app", "0.conf")), run.output)
+
+    def test_du(self):
+        self._clone()
+
+        run = self._gikkon("du", "--max_depth", "2")
+
+        self.assertEqual(run.code, 0)
+        self.assertWithinBudget("du", run)
+        self.assertRegex(run.output, rf"\d+\.\dK +\d+\.\dK +{FILES} +home/\.config/\n")
+        self.assertNotIn("app/", run.output)
+
+    def test_export(self):
+        self._clone()
+
+        run = self._gikkon("export", "--system_paths")
+
+        self.assertEqual(run.code, 0)
+        self.assertWithinBudget("export", run)
+        with tarfile.open(fileobj=io.BytesIO(run.output.encode())) as tar:
+            names = tar.getnames()
+            content = tar.extractfile(str(self.home.joinpath(".config", "app", "0.conf")).lstrip("/")).read()
+        self.assertEqual(len(names), FILES)
+        self.assertEqual(content.decode(), _content(0, "old"))
+
+    def test_log(self):
+        self._clone()
+
+        run = self._gikkon("log", str(self.home.joinpath(".config", "app", "0.conf")))
+
+        self.assertEqual(run.code, 0)
+        self.assertWithinBudget("log", run)
+        self.assertIn("initial", run.output)
+
+    def test_diff(self):
+        self._clone()
+        self._change_files()
+
+        run = self._gikkon("diff", str(self.home.joinpath(".config", "app", "0.conf")))
+
+        self.assertEqual(run.code, 0)
+        self.assertWithinBudget("diff", run)
+        self.assertIn("+new setting_0", run.output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,7 +3,6 @@ from pathlib import Path
 from unittest.mock import patch
 
 from interactor import UserInput
-from validator import RollbackValidator
 
 
 class TestUserInput(unittest.TestCase):
@@ -40,30 +39,41 @@ class TestUserInput(unittest.TestCase):
         result = UserInput.ask_bool("Is this a question?", default=True)
         self.assertEqual(result, False)
 
-    @patch("builtins.input", side_effect=["", "0,1", "0-2", "1", "no"])
-    def test_ask_rollback(self, input_mock):
-        rollback_candidates = [Path("file1.txt"), Path("file2.txt"), Path("file3.txt")]
-        validator = RollbackValidator(len(rollback_candidates))
-
-        # Проверка, что возвращается все индексы при пустом вводе
-        indices, success = UserInput.ask_rollback(rollback_candidates, validator)
-        self.assertEqual(indices, {0, 1, 2})
-        self.assertTrue(success)
-
-        # Проверка, что возвращается корректный набор индексов при вводе "0,1"
-        indices, success = UserInput.ask_rollback(rollback_candidates, validator)
-        self.assertEqual(indices, {0, 1})
-        self.assertTrue(success)
-
-        # Проверка, что при невалидном вводе "0-2" запрашивается повторный ввод
-        result_rollback, success = UserInput.ask_rollback(rollback_candidates, validator)
-        self.assertEqual(result_rollback, {1})
-        self.assertTrue(success)
-
-        # Проверка, что возвращается None и False при вводе "no"
-        indices, success = UserInput.ask_rollback(rollback_candidates, validator)
-        self.assertIsNone(indices)
-        self.assertFalse(success)
+    @patch("builtins.print")
+    @patch("builtins.input", side_effect=["", "q", "9", "2-3 File1*"])
+    def test_select(self, input_mock, print_mock):
+        candidates = [Path("File1.txt"), Path("file2.txt"), Path("file3.txt")]
+
+        self.assertEqual(UserInput.select(candidates, "header"), [0, 1, 2])
+        self.assertEqual(UserInput.select(candidates, "header"), [])
+        # Out of range number is reported and asked again
+        self.assertEqual(UserInput.select(candidates, "header"), [0, 1, 2])
+        printed = [str(c.args[0]) for c in print_mock.call_args_list]
+        self.assertIn("Number 9 is out of range, choose between 1 and 3", printed)
+
+    @patch("builtins.print")
+    @patch("builtins.input", side_effect=["", "ALL", "2"])
+    def test_select_without_default(self, input_mock, print_mock):
+        candidates = [Path("file1.txt"), Path("file2.txt")]
+
+        # Enter alone must not pick files for a destructive action
+        self.assertEqual(UserInput.select(candidates, "header", default_all=False), [])
+        self.assertEqual(UserInput.select(candidates, "header", default_all=False), [0, 1])
+        self.assertEqual(UserInput.select(candidates, "header", default_all=False), [1])
+        self.assertIn("type 'all' for all", input_mock.call_args_list[0].args[0])
+
+
+    @patch("builtins.print")
+    @patch("builtins.input", side_effect=[">", ">", "<", "!2-4"])
+    def test_select_pages(self, input_mock, print_mock):
+        candidates = [Path(f"file{i}.txt") for i in range(1, 6)]
+
+        self.assertEqual(UserInput.select(candidates, "header", page_size=2), [0, 4])
+        printed = [str(c.args[0]) for c in print_mock.call_args_list]
+        self.assertEqual(printed[1:3], ["1. file1.txt", "2. file2.txt"])
+        self.assertEqual(printed[3:5], ["3. file3.txt", "4. file4.txt"])
+        self.assertEqual(printed[5:], ["5. file5.txt", "3. file3.txt", "4. file4.txt"])
+        self.assertIn("Page 1 of 3", input_mock.call_args_list[0].args[0])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,50 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from journal import Journal
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.repo = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_only_flushed_keys_are_loaded(self):
+        journal = Journal.for_repo(self.repo)
+        journal.record("home/a")
+        journal.flush()
+        journal.record("home/b")
+
+        loaded = Journal.for_repo(self.repo)
+        loaded.load()
+
+        self.assertEqual(loaded.done, {"home/a"})
+
+    def test_flush_appends(self):
+        journal = Journal.for_repo(self.repo)
+        journal.record("home/a")
+        journal.flush()
+        journal.record("home/b")
+        journal.flush()
+
+        self.assertEqual(journal.path.read_text(), "home/a\nhome/b\n")
+        self.assertEqual(journal.done, {"home/a", "home/b"})
+
+    def test_reset(self):
+        journal = Journal.for_repo(self.repo)
+        journal.record("home/a")
+        journal.flush()
+
+        journal.reset()
+        journal.load()
+
+        self.assertEqual(journal.done, set())
+        self.assertFalse(journal.path.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from pathlib import Path
+from unittest.mock import call, patch
+
+from listing import ListEntry, bounded_map, print_json, print_null, print_text
+
+
+class TestBoundedMap(unittest.TestCase):
+    def test_keeps_order(self):
+        self.assertEqual(list(bounded_map(lambda x: x * 2, range(1000), workers=4)), [x * 2 for x in range(1000)])
+
+
+class TestPrinters(unittest.TestCase):
+    entries = [
+        ListEntry(Path("/repo/etc/a"), Path("/etc/a"), "in sync", 10, 0.0, "size,every=7"),
+        ListEntry(Path("/repo/etc/b"), Path("/etc/b"), "missing", None, None),
+    ]
+
+    @patch("builtins.print")
+    def test_print_json(self, print_mock):
+        print_json(self.entries)
+
+        print_mock.assert_has_calls(
+            [
+                call(
+                    '[\n{"system_path": "/etc/a", "repo_path": "/repo/etc/a", "status": "in sync", "size": 10, '
+                    '"mtime": 0.0, "policy": "size,every=7"}',
+                    end="",
+                ),
+                call(
+                    ',\n{"system_path": "/etc/b", "repo_path": "/repo/etc/b", "status": "missing", "size": null, '
+                    '"mtime": null, "policy": null}',
+                    end="",
+                ),
+                call("\n]"),
+            ]
+        )
+
+    @patch("builtins.print")
+    def test_print_json_empty(self, print_mock):
+        print_json([])
+
+        print_mock.assert_called_once_with("[]")
+
+    @patch("builtins.print")
+    def test_print_null(self, print_mock):
+        print_null(self.entries, repo_paths=True)
+
+        print_mock.assert_has_calls([call("/repo/etc/a", end="\0"), call("/repo/etc/b", end="\0")])
+
+    @patch("builtins.print")
+    def test_print_text_long(self, print_mock):
+        print_text(self.entries[1:], repo_paths=False, long=True)
+
+        print_mock.assert_has_calls(
+            [
+                call("\nFiles under gikkon control:"),
+                call(f"{'missing':<8}  {'-':>10}  {'-':<19}  /etc/b"),
+            ]
+        )
+
+    @patch("builtins.print")
+    def test_print_text_long_with_policy(self, print_mock):
+        print_text([self.entries[0]._replace(mtime=None)], repo_paths=False, long=True)
+
+        print_mock.assert_called_with(f"{'in sync':<8}  {10:>10}  {'-':<19}  size,every=7  /etc/a")
+
+
+if __name__ == "__main__":
+    unittest.main()
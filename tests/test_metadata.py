@@ -0,0 +1,100 @@
+import os
+import stat
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from metadata import Entry, Manifest, apply, dump, parse
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_dump_and_parse(self):
+        entries = {
+            "etc/hosts": Entry(0o644, "root", "root"),
+            "home/we\tird": Entry(0o600, "user", "users", link="/some\\target", xattrs="user.a=Yg=="),
+        }
+
+        self.assertEqual(parse(dump(entries).splitlines()), entries)
+
+    def test_update_only_changed(self):
+        path = self.root.joinpath("file")
+        path.write_text("content")
+        os.chmod(path, 0o640)
+        manifest = Manifest.for_repo(self.root)
+
+        entry = manifest.update("file", path)
+        self.assertEqual(entry.mode, 0o640)
+        self.assertTrue(manifest.changed)
+
+        manifest.save()
+        manifest.update("file", path)
+        self.assertFalse(manifest.changed)
+
+        self.assertEqual(Manifest.for_repo(self.root).entries, manifest.entries)
+
+    def test_symlink(self):
+        link = self.root.joinpath("link")
+        os.symlink("target", link)
+
+        entry = Manifest(self.root.joinpath("manifest")).update("link", link)
+
+        self.assertEqual(entry.link, "target")
+
+
+class TestApply(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_apply_directly(self):
+        path = self.root.joinpath("file")
+        path.write_text("content")
+        link = self.root.joinpath("link")
+        st = os.stat(path)
+        owner = Manifest(self.root.joinpath("manifest")).update("file", path)
+
+        apply(
+            [
+                (path, owner._replace(mode=0o600)),
+                (link, owner._replace(link="file")),
+            ]
+        )
+
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+        self.assertEqual(os.readlink(link), "file")
+        self.assertEqual(os.stat(path).st_uid, st.st_uid)
+
+    @patch("metadata.subprocess.run")
+    @patch("metadata._apply_one", side_effect=[None, PermissionError, PermissionError])
+    @patch("builtins.print")
+    def test_apply_with_sudo_in_one_call(self, print_mock, apply_one_mock, run_mock):
+        apply(
+            [
+                (Path("/etc/a"), Entry(0o644, "root", "root")),
+                (Path("/etc/b b"), Entry(0o600, "root", "wheel")),
+                (Path("/etc/c"), Entry(0o777, "root", "root", link="/etc/a")),
+            ]
+        )
+
+        run_mock.assert_called_once_with(
+            ["sudo", "sh", "-e"],
+            input="chmod 0600 '/etc/b b'\nchown -h root:wheel '/etc/b b'\n"
+            "ln -sfnT /etc/a /etc/c\nchown -h root:root /etc/c\n",
+            text=True,
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def test_render(self):
+        metrics = Metrics("backup")
+        metrics.inc("gikkon_files_copied")
+        metrics.inc("gikkon_files_copied")
+        metrics.inc("gikkon_bytes_copied", 1024)
+        metrics.phases["copy"] = 0.5
+
+        self.assertEqual(
+            metrics.render(),
+            "# HELP gikkon_bytes_copied Number of bytes copied into the repo by the last run\n"
+            "# TYPE gikkon_bytes_copied gauge\n"
+            'gikkon_bytes_copied{command="backup"} 1024\n'
+            "# HELP gikkon_files_copied Number of files copied into the repo by the last run\n"
+            "# TYPE gikkon_files_copied gauge\n"
+            'gikkon_files_copied{command="backup"} 2\n'
+            "# HELP gikkon_phase_duration_seconds Duration of phases of the last run\n"
+            "# TYPE gikkon_phase_duration_seconds gauge\n"
+            'gikkon_phase_duration_seconds{command="backup",phase="copy"} 0.5\n',
+        )
+
+    def test_phase(self):
+        metrics = Metrics("status")
+        with patch("metrics.time.monotonic", side_effect=[10.0, 12.5]):
+            with metrics.phase("scan"):
+                pass
+
+        self.assertEqual(metrics.phases, {"scan": 2.5})
+
+    @patch("metrics.time.time", return_value=1700000000.0)
+    def test_write_textfile(self, _time_mock):
+        metrics = Metrics("status")
+        metrics.set("gikkon_files_tracked", 3)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            metrics.write_textfile(Path(tmp_dir))
+
+            self.assertEqual(os.listdir(tmp_dir), ["gikkon_status.prom"])
+            content = Path(tmp_dir, "gikkon_status.prom").read_text()
+
+        self.assertIn('gikkon_files_tracked{command="status"} 3\n', content)
+        self.assertIn('gikkon_last_run_timestamp_seconds{command="status"} 1700000000\n', content)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from path_mapper import PathMapper
+
+
+class TestPathMapper(unittest.TestCase):
+    def setUp(self):
+        self.mapper = PathMapper({"home": "/home/user", "xdg": "/home/user/.config", "etc": "/etc"})
+
+    def test_to_outer(self):
+        self.assertEqual(self.mapper.to_outer(Path("home/.bashrc")), Path("/home/user/.bashrc"))
+        self.assertEqual(self.mapper.to_outer(Path("xdg/app/conf")), Path("/home/user/.config/app/conf"))
+        self.assertEqual(self.mapper.to_outer(Path("usr/share/file")), Path("/usr/share/file"))
+
+    def test_to_outer_component_prefix(self):
+        self.assertEqual(self.mapper.to_outer(Path("homebrew/file")), Path("/homebrew/file"))
+
+    def test_to_inner_longest_prefix(self):
+        self.assertEqual(self.mapper.to_inner(Path("/home/user/.config/app/conf")), Path("xdg/app/conf"))
+        self.assertEqual(self.mapper.to_inner(Path("/home/user/.bashrc")), Path("home/.bashrc"))
+        self.assertEqual(self.mapper.to_inner(Path("/usr/share/file")), Path("usr/share/file"))
+
+    def test_to_outer_many(self):
+        inner = [Path("home/a"), Path("home/b"), Path("file")]
+        outer = [Path("/home/user/a"), Path("/home/user/b"), Path("/file")]
+
+        self.assertEqual(list(self.mapper.to_outer_many(inner)), list(zip(inner, outer)))
+
+    def test_overlapping_roots_keep_tracked_paths(self):
+        tracked = {Path("home"), Path("home/.config"), Path("home/.config/app"), Path("home/.config/app/conf")}
+
+        def to_inner(outer: str) -> Path:
+            return self.mapper.to_inner(Path(outer), exists=tracked.__contains__)
+
+        self.assertEqual(to_inner("/home/user/.config/app/conf"), Path("home/.config/app/conf"))
+        # New files of a tracked directory go next to the tracked ones
+        self.assertEqual(to_inner("/home/user/.config/app/new"), Path("home/.config/app/new"))
+        self.assertEqual(to_inner("/home/user/.config/other/conf"), Path("xdg/other/conf"))
+        self.assertEqual(to_inner("/home/user/.bashrc"), Path("home/.bashrc"))
+
+    @patch.dict("os.environ", {"HOME": "/home/test"}, clear=True)
+    def test_from_config_keeps_default_roots(self):
+        mapper = PathMapper.from_config({"etc": "/etc"})
+
+        self.assertEqual(mapper.to_outer(Path("home/file")), Path("/home/test/file"))
+        self.assertEqual(mapper.to_outer(Path("etc/hosts")), Path("/etc/hosts"))
+
+    @patch.dict("os.environ", {"HOME": "/home/test"}, clear=True)
+    def test_from_config(self):
+        mapper = PathMapper.from_config({"home": "~", "xdg": "$XDG_CONFIG_HOME"})
+
+        self.assertEqual(mapper.to_outer(Path("home/file")), Path("/home/test/file"))
+        # Unset variable, the root is skipped
+        self.assertEqual(mapper.to_outer(Path("xdg/file")), Path("/xdg/file"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from errors import ConfigError
+from policies import COMPARE_SIZE, DEFAULT_PATH_POLICY, PathPolicy, PolicySet, is_binary, next_run
+
+
+class TestPolicySet(unittest.TestCase):
+    def test_first_match_wins(self):
+        policies = PolicySet(
+            {
+                "home/.cache/*": {"compare": "mtime-only"},
+                "home/*": {"compare": "size", "max_size": "1K", "priority": 5},
+            }
+        )
+
+        self.assertEqual(policies.policy("home/.cache/fonts/index").compare, "mtime-only")
+        self.assertEqual(policies.policy("home/.bashrc"), PathPolicy(COMPARE_SIZE, max_size=1024, priority=5))
+        self.assertEqual(policies.policy("etc/hosts"), DEFAULT_PATH_POLICY)
+        self.assertTrue(policies.has_priorities)
+
+    def test_many_globs(self):
+        policies = PolicySet({f"dir{i}/*.conf": {"every": i + 1} for i in range(500)})
+
+        self.assertEqual(policies.policy("dir321/app.conf").every, 322)
+        self.assertEqual(policies.policy("dir321/app.ini"), DEFAULT_PATH_POLICY)
+
+    def test_empty(self):
+        self.assertEqual(PolicySet({}).policy("home/.bashrc"), DEFAULT_PATH_POLICY)
+
+    def test_wrong_options(self):
+        with self.assertRaises(ConfigError) as raised:
+            PolicySet({"*": {"compare": "content"}})
+        self.assertEqual(str(raised.exception), "Compare mode of policy * should be one of hash, size, mtime-only")
+
+        with self.assertRaises(ConfigError) as raised:
+            PolicySet({"*": {"size": 1}})
+        self.assertEqual(str(raised.exception), "Unknown options of policy *: size")
+
+
+class TestPathPolicy(unittest.TestCase):
+    def test_every_run_by_default(self):
+        self.assertTrue(all(DEFAULT_PATH_POLICY.is_due("home/.bashrc", run) for run in range(10)))
+
+    def test_due_once_in_every_runs(self):
+        policy = PathPolicy(every=3)
+        keys = [f"home/file{i}" for i in range(300)]
+
+        for key in keys:
+            self.assertEqual(sum(policy.is_due(key, run) for run in range(3)), 1)
+        # Files are spread over runs instead of all being checked on the same one
+        self.assertTrue(all(50 < sum(policy.is_due(key, run) for key in keys) < 150 for run in range(3)))
+
+    def test_describe(self):
+        self.assertEqual(DEFAULT_PATH_POLICY.describe(), "hash")
+        self.assertEqual(
+            PathPolicy("size", 10, True, 7, -1).describe(), "size,max_size=10,skip_binary,every=7,priority=-1"
+        )
+
+
+class TestHelpers(unittest.TestCase):
+    def test_is_binary(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir, "file")
+            path.write_bytes(b"text\n")
+            self.assertFalse(is_binary(path))
+
+            path.write_bytes(b"SQLite format 3\0")
+            self.assertTrue(is_binary(path))
+
+    def test_next_run(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir, "gikkon", "run_count")
+
+            self.assertEqual(next_run(path), 1)
+            self.assertEqual(next_run(path), 2)
+            self.assertEqual(next_run(path, resume=True), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
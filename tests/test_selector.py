@@ -0,0 +1,56 @@
+import unittest
+from pathlib import Path
+
+from selector import SelectionError, Token, parse_selection, tokenize
+
+
+class TestParseSelection(unittest.TestCase):
+    candidates = [Path("/etc/systemd/a"), Path("/etc/systemd/b"), Path("/etc/hosts"), Path("/home/user/.bashrc")]
+
+    def test_numbers(self):
+        self.assertEqual(parse_selection("1 3", self.candidates), [0, 2])
+        self.assertEqual(parse_selection("3,1,", self.candidates), [0, 2])
+
+    def test_ranges(self):
+        self.assertEqual(parse_selection("2-4", self.candidates), [1, 2, 3])
+        self.assertEqual(parse_selection("3-2", self.candidates), [1, 2])
+
+    def test_globs(self):
+        self.assertEqual(parse_selection("etc/systemd/*", self.candidates), [0, 1])
+        self.assertEqual(parse_selection("*/.bashrc 3", self.candidates), [2, 3])
+
+    def test_negation(self):
+        self.assertEqual(parse_selection("!2", self.candidates), [0, 2, 3])
+        self.assertEqual(parse_selection("etc/* !etc/systemd/b", self.candidates), [0, 2])
+        self.assertEqual(parse_selection("1-4 !2-3", self.candidates), [0, 3])
+
+    def test_zero_based(self):
+        self.assertEqual(parse_selection("0 2-3", self.candidates, first=0), [0, 2, 3])
+
+    def test_tokenize(self):
+        self.assertEqual(
+            list(tokenize(" 1,,!2-5 etc/*,")),
+            [
+                Token("1", False, 1, 1),
+                Token("2-5", True, 2, 5),
+                Token("etc/*", False),
+            ],
+        )
+
+    def test_errors(self):
+        for user_input in ["0", "5", "1-5", "usr/*"]:
+            with self.assertRaises(SelectionError, msg=user_input):
+                parse_selection(user_input, self.candidates)
+
+    def test_huge_input(self):
+        candidates = [f"/etc/dir{i % 100}/file{i}" for i in range(100000)]
+        user_input = " ".join(f"{i}-{i + 5}" for i in range(1, 99990, 10)) + " !etc/dir1/* " + "7," * 100000
+
+        selected = parse_selection(user_input, candidates)
+
+        # 9999 ranges of 6, minus 1000 files of dir1, plus 7th file
+        self.assertEqual(len(selected), 9999 * 6 - 1000 + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from errors import StoreError
+from sidecar import CHUNK_SIZE, POINTER_HEADER, Pointer, Store, parse_pointer, read_pointer
+
+
+class TestPointer(unittest.TestCase):
+    def test_dump_and_parse(self):
+        pointer = Pointer(10, "ab" * 32, ["cd" * 32, "ef" * 32])
+
+        self.assertEqual(parse_pointer(pointer.dump()), pointer)
+
+    def test_not_a_pointer(self):
+        self.assertIsNone(parse_pointer(b"size 10\n"))
+        self.assertIsNone(parse_pointer(POINTER_HEADER + b"size ten\n"))
+
+    def test_read_pointer(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir, "file")
+            path.write_bytes(Pointer(0, "", []).dump())
+            self.assertEqual(read_pointer(path), Pointer(0, "", []))
+
+            path.write_text("regular copy")
+            self.assertIsNone(read_pointer(path))
+            self.assertIsNone(read_pointer(Path(tmp_dir, "nothing")))
+
+
+class TestStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.store = Store(self.root.joinpath("store"))
+        self.file = self.root.joinpath("file.db")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_put_and_read(self):
+        content = os.urandom(CHUNK_SIZE) + b"tail"
+        self.file.write_bytes(content)
+
+        pointer = self.store.put(self.file)
+
+        self.assertEqual(pointer.size, len(content))
+        self.assertEqual(len(pointer.chunks), 2)
+        self.assertEqual(b"".join(self.store.read(pointer)), content)
+
+    def test_unchanged_chunks_stored_once(self):
+        first_chunk = os.urandom(CHUNK_SIZE)
+        self.file.write_bytes(first_chunk + b"v1")
+        old = self.store.put(self.file)
+        self.file.write_bytes(first_chunk + b"v2")
+        new = self.store.put(self.file)
+
+        self.assertEqual(old.chunks[0], new.chunks[0])
+        self.assertEqual(len(list(self.store.chunks())), 3)
+
+    def test_chunks_compressed(self):
+        self.file.write_bytes(b"\0" * CHUNK_SIZE)
+        self.store.put(self.file)
+
+        self.assertLess(sum(path.stat().st_size for path in self.store.chunks()), CHUNK_SIZE // 100)
+
+    def test_missing_chunk(self):
+        self.file.write_bytes(b"content")
+        pointer = self.store.put(self.file)
+        next(self.store.chunks()).unlink()
+
+        with self.assertRaises(StoreError) as raised:
+            list(self.store.read(pointer))
+
+        self.assertEqual(
+            str(raised.exception),
+            f"Chunk {pointer.chunks[0]} is missing or damaged in the sidecar store {self.store.path}",
+        )
+
+    def test_gc(self):
+        self.file.write_bytes(b"old")
+        old = self.store.put(self.file)
+        self.file.write_bytes(b"new")
+        new = self.store.put(self.file)
+
+        removed, freed = self.store.gc([new])
+
+        self.assertEqual(removed, 1)
+        self.assertGreater(freed, 0)
+        self.assertEqual(b"".join(self.store.read(new)), b"new")
+        self.assertFalse(self.store.path.joinpath(old.chunks[0][:2]).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from filters import FINGERPRINT_PREFIX, Transform
+from sidecar import Store
+from stat_cache import StatCache, SyncStatus, sync_status
+
+
+class TestSyncStatus(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp_dir.name)
+        self.outer = self.root.joinpath("outer")
+        self.inner = self.root.joinpath("inner")
+        self.outer.write_text("content")
+        self.inner.write_text("content")
+        self.cache = StatCache(self.root.joinpath("cache.json"))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_missing(self):
+        status = sync_status("key", self.root.joinpath("nothing"), self.inner, self.cache)
+        self.assertEqual(status, SyncStatus.MISSING)
+
+    def test_symlink(self):
+        self.outer.unlink()
+        self.inner.unlink()
+        self.outer.symlink_to("target")
+        self.inner.symlink_to("target")
+        self.assertEqual(sync_status("key", self.outer, self.inner, self.cache), SyncStatus.IN_SYNC)
+
+        self.outer.unlink()
+        self.outer.symlink_to("other")
+        self.assertEqual(sync_status("key", self.outer, self.inner, self.cache), SyncStatus.MODIFIED)
+
+    def test_unreadable(self):
+        with patch("stat_cache._compare", side_effect=PermissionError):
+            self.assertEqual(sync_status("key", self.outer, self.inner, self.cache), SyncStatus.UNREADABLE)
+
+    def test_in_sync_fills_cache(self):
+        self.assertEqual(sync_status("key", self.outer, self.inner, self.cache), SyncStatus.IN_SYNC)
+        self.assertTrue(self.cache.is_fresh("key", os.stat(self.outer), os.stat(self.inner)))
+
+    def test_modified(self):
+        self.outer.write_text("changed")
+        self.assertEqual(sync_status("key", self.outer, self.inner, self.cache), SyncStatus.MODIFIED)
+        self.assertNotIn("key", self.cache.entries)
+
+    def test_touched_file_checked_by_hash(self):
+        sync_status("key", self.outer, self.inner, self.cache)
+        self.outer.write_text("content")
+        os.utime(self.outer, ns=(0, 0))
+
+        with patch("stat_cache._compare") as compare_mock:
+            self.assertEqual(sync_status("key", self.outer, self.inner, self.cache), SyncStatus.IN_SYNC)
+
+        compare_mock.assert_not_called()
+        self.assertTrue(self.cache.is_fresh("key", os.stat(self.outer), os.stat(self.inner)))
+
+    def test_same_size_change_detected_by_hash(self):
+        sync_status("key", self.outer, self.inner, self.cache)
+        self.outer.write_text("CONTENT")
+        os.utime(self.outer, ns=(0, 0))
+
+        self.assertEqual(sync_status("key", self.outer, self.inner, self.cache), SyncStatus.MODIFIED)
+
+    def test_filtered_copy(self):
+        transform = Transform(FINGERPRINT_PREFIX + "upper", lambda data: data.upper())
+        self.inner.write_text("CONTENT")
+
+        status = sync_status("key", self.outer, self.inner, self.cache, transform=transform)
+        self.assertEqual(status, SyncStatus.IN_SYNC)
+        self.assertEqual(sync_status("key", self.outer, self.inner, self.cache), SyncStatus.MODIFIED)
+
+    def test_changed_filters_make_entry_stale(self):
+        sync_status("key", self.outer, self.inner, self.cache)
+        transform = Transform(FINGERPRINT_PREFIX + "upper", lambda data: data.upper())
+
+        status = sync_status("key", self.outer, self.inner, self.cache, transform=transform)
+        self.assertEqual(status, SyncStatus.MODIFIED)
+
+    def test_pointer_to_store(self):
+        pointer = Store(self.root.joinpath("store")).put(self.outer)
+        self.inner.write_bytes(pointer.dump())
+
+        self.assertEqual(sync_status("key", self.outer, self.inner, self.cache), SyncStatus.IN_SYNC)
+        self.assertTrue(self.cache.is_fresh("key", os.stat(self.outer), os.stat(self.inner)))
+
+        self.outer.write_text("changed")
+        self.assertEqual(sync_status("key", self.outer, self.inner, self.cache), SyncStatus.MODIFIED)
+
+    def test_compare_size(self):
+        sync_status("key", self.outer, self.inner, self.cache)
+        self.outer.write_text("CONTENT")
+
+        with patch("stat_cache._compare") as compare_mock:
+            status = sync_status("key", self.outer, self.inner, self.cache, compare="size")
+        self.assertEqual(status, SyncStatus.IN_SYNC)
+        compare_mock.assert_not_called()
+
+        self.outer.write_text("longer content")
+        self.assertEqual(sync_status("key", self.outer, self.inner, self.cache, compare="size"), SyncStatus.MODIFIED)
+
+    def test_compare_mtime_only(self):
+        sync_status("key", self.outer, self.inner, self.cache)
+        mtime = os.stat(self.outer).st_mtime_ns
+        self.outer.write_text("changed, but mtime is kept")
+        os.utime(self.outer, ns=(mtime, mtime))
+
+        status = sync_status("key", self.outer, self.inner, self.cache, compare="mtime-only")
+        self.assertEqual(status, SyncStatus.IN_SYNC)
+
+        self.outer.write_text("content")
+        os.utime(self.outer, ns=(0, 0))
+        status = sync_status("key", self.outer, self.inner, self.cache, compare="mtime-only")
+        self.assertEqual(status, SyncStatus.MODIFIED)
+
+    def test_save_and_load(self):
+        sync_status("key", self.outer, self.inner, self.cache)
+        self.cache.save()
+
+        cache = StatCache(self.cache.path)
+        cache.load()
+
+        self.assertEqual(cache.entries, self.cache.entries)
+        self.assertFalse(self.cache.changed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import io
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+from throttle import IOPRIO_CLASS_IDLE, IOPRIO_CLASS_SHIFT, IOPolicy, TokenBucket, lower_priority
+
+
+class TestTokenBucket(unittest.TestCase):
+    @patch("throttle.time.sleep")
+    @patch("throttle.time.monotonic", side_effect=[0.0, 0.0, 0.0, 0.0])
+    def test_consume(self, _monotonic_mock, sleep_mock):
+        bucket = TokenBucket(rate=100)
+
+        bucket.consume(100)
+        sleep_mock.assert_not_called()
+
+        bucket.consume(50)
+        sleep_mock.assert_called_once_with(0.5)
+
+        # The debt of the previous call is paid by the next one
+        bucket.consume(50)
+        sleep_mock.assert_called_with(1.0)
+
+    @patch("throttle.time.sleep")
+    @patch("throttle.time.monotonic", side_effect=[0.0, 0.0, 10.0])
+    def test_refill_is_capped(self, _monotonic_mock, sleep_mock):
+        bucket = TokenBucket(rate=100)
+
+        bucket.consume(100)
+        bucket.consume(150)
+
+        sleep_mock.assert_called_once_with(0.5)
+
+
+class TestIOPolicy(unittest.TestCase):
+    def test_default(self):
+        policy = IOPolicy()
+
+        self.assertTrue(policy.is_default)
+        self.assertEqual(policy.read(io.BytesIO(b"abc"), 2), b"ab")
+
+    @patch("throttle.os.posix_fadvise")
+    def test_read_and_release(self, fadvise_mock):
+        bucket = MagicMock()
+        policy = IOPolicy(drop_cache=True, bucket=bucket)
+        f = MagicMock()
+        f.read.return_value = b"abc"
+
+        self.assertEqual(policy.read(f, 3), b"abc")
+        policy.release(f)
+
+        bucket.consume.assert_called_once_with(3)
+        fadvise_mock.assert_called_once_with(f.fileno.return_value, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+class TestLowerPriority(unittest.TestCase):
+    @patch("throttle.ctypes.CDLL")
+    @patch("throttle.platform.machine", return_value="x86_64")
+    @patch("throttle.os.setpriority")
+    def test_lower_priority(self, setpriority_mock, _machine_mock, cdll_mock):
+        cdll_mock.return_value.syscall.return_value = 0
+
+        lower_priority()
+
+        setpriority_mock.assert_called_once_with(os.PRIO_PROCESS, 0, 19)
+        cdll_mock.return_value.syscall.assert_called_once_with(251, 1, 0, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from unittest.mock import patch
+
+from git_wrapper import BlobUsage
+from usage import print_usage, summarize
+
+USAGES = [
+    BlobUsage("etc/hosts", 100, 300, 3),
+    BlobUsage("etc/nginx/nginx.conf", 2048, 4096, 2),
+    BlobUsage("home/big.iso", None, 2 * 1024**3, 1),
+]
+
+
+class TestSummarize(unittest.TestCase):
+    def test_directories(self):
+        entries = summarize(USAGES)
+
+        self.assertEqual(
+            entries,
+            [
+                BlobUsage("etc/", 2148, 4396, 5),
+                BlobUsage("etc/hosts", 100, 300, 3),
+                BlobUsage("etc/nginx/", 2048, 4096, 2),
+                BlobUsage("etc/nginx/nginx.conf", 2048, 4096, 2),
+                BlobUsage("home/", None, 2 * 1024**3, 1),
+                BlobUsage("home/big.iso", None, 2 * 1024**3, 1),
+                BlobUsage("total", 2148, 2 * 1024**3 + 4396, 6),
+            ],
+        )
+
+    def test_max_depth(self):
+        entries = summarize(USAGES, max_depth=1)
+
+        self.assertEqual([entry.path for entry in entries], ["etc/", "home/", "total"])
+
+    def test_empty(self):
+        self.assertEqual(summarize([]), [])
+
+    @patch("builtins.print")
+    def test_print_by_size(self, print_mock):
+        print_usage(USAGES, max_depth=1, by_size=True)
+
+        self.assertEqual(
+            [call.args[0] for call in print_mock.call_args_list],
+            [
+                "   current     history  versions  path",
+                "         -        2.0G         1  home/",
+                "      2.1K        4.3K         5  etc/",
+                "      2.1K        2.0G         6  total",
+            ],
+        )
+
+    @patch("builtins.print")
+    def test_print_missing(self, print_mock):
+        print_usage([BlobUsage("etc/hosts", None, 0, 1, 1), BlobUsage("etc/motd", 3, 3, 1)], unknown=2)
+
+        self.assertEqual(
+            [call.args[0] for call in print_mock.call_args_list],
+            [
+                "   current     history  versions  path",
+                "        3B          3B         2  etc/",
+                "         ?          0B         1  etc/hosts",
+                "        3B          3B         1  etc/motd",
+                "        3B          3B         2  total",
+                "\n3 object(s) are not fetched into this partial clone, their sizes are not counted",
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()